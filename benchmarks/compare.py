@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmarks.compare
+    ~~~~~~~~~~~~~~~~~~
+
+    Compare two benchmark reports.
+
+    .. code-block:: sh
+
+      $ python benchmarks/compare.py base.json head.json --threshold 10
+
+    Exit with 1 if req/s of any scenario dropped more than threshold percent.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import sys
+import json
+import argparse
+
+
+def load(path):
+    """Load report and return dict of `(scenario, mode)` to result.
+
+    :param path: Path to JSON report
+    """
+    with open(path, 'r') as f:
+        report = json.loads(f.read())
+
+    return dict(((v['scenario'], v['mode']), v) for v in report['results'])
+
+
+def compare(base, head, threshold):
+    """Return list of rows and whether any scenario regressed.
+
+    :param base: Results of base report
+    :param head: Results of head report
+    :param threshold: Allowed drop of req/s in percent
+    """
+    rows = []
+    regressed = False
+    for key in sorted(set(base) & set(head)):
+        before = base[key]['rps']
+        after = head[key]['rps']
+        change = (after - before) / before * 100 if before else 0.0
+        failed = change < -threshold
+        regressed = regressed or failed
+        rows.append((key[0], key[1], before, after, change,
+                     base[key]['latency_ms']['p99'],
+                     head[key]['latency_ms']['p99'], failed))
+
+    return rows, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare benchmarks.')
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', default=10.0, type=float)
+    args = parser.parse_args(argv)
+
+    rows, regressed = compare(load(args.base), load(args.head),
+                              args.threshold)
+    header = '{0:<12} {1:<10} {2:>10} {3:>10} {4:>8} {5:>9} {6:>9}'
+    print(header.format('scenario', 'mode', 'base', 'head', 'change',
+                        'p99 base', 'p99 head'))
+    row = '{0:<12} {1:<10} {2:>10.1f} {3:>10.1f} {4:>7.1f}% {5:>9.3f} ' \
+          '{6:>9.3f}{7}'
+    for v in rows:
+        print(row.format(*(v[:7] + (' REGRESSED' if v[7] else '',))))
+
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
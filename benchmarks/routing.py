@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmarks.routing
+    ~~~~~~~~~~~~~~~~~~
+
+    Compare routing engine with Werkzeug map.
+
+    .. code-block:: sh
+
+      $ python benchmarks/routing.py --routes 20000 --requests 20000
+
+    Routes are generated like OpenAPI specs, collection, item and
+    sub resource of each resource. Rows with `+lru` memoize results.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.routing import Map, Rule  # noqa: E402
+from werkzeug.test import EnvironBuilder  # noqa: E402
+from jokk._compat import timer  # noqa: E402
+from jokk.routing import Router, MapRouter  # noqa: E402
+from jokk.routing import DEFAULT_MATCH_CACHE_SIZE  # noqa: E402
+
+
+def create_routes(count):
+    """Return routes and paths to request.
+
+    :param count: Number of routes
+    """
+    routes = []
+    paths = []
+    for i in range(count // 3 + 1):
+        routes.extend(['/api/resource{0}'.format(i),
+                       '/api/resource{0}/<id>'.format(i),
+                       '/api/resource{0}/<int:id>/items'.format(i)])
+        paths.extend(['/api/resource{0}'.format(i),
+                      '/api/resource{0}/abc'.format(i),
+                      '/api/resource{0}/{0}/items'.format(i)])
+
+    return routes[:count], paths[:count]
+
+
+def build(name, routes, cache_size=0):
+    """Return `(router, seconds)`.
+
+    :param name: `trie` or `werkzeug`
+    :param routes: Routes
+    :param cache_size: Max number of memoized results
+    """
+    started = timer()
+    if name == 'trie':
+        router = Router(routes, cache_size=cache_size)
+    else:
+        router = MapRouter(Map([Rule(v, endpoint=v, strict_slashes=False)
+                                for v in routes]), cache_size)
+        #: Werkzeug sorts and compiles rules on first match.
+        router.url_map.update()
+
+    return router, timer() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark routing.')
+    parser.add_argument('--routes', default=20000, type=int)
+    parser.add_argument('--requests', default=20000, type=int)
+    args = parser.parse_args(argv)
+
+    routes, paths = create_routes(args.routes)
+    rng = random.Random(0)
+    environs = [EnvironBuilder(rng.choice(paths)).get_environ()
+                for _ in range(min(args.requests, 1000))]
+
+    print('{0:<14} {1:>10} {2:>12}'.format('routing', 'build s', 'match/s'))
+    for name in ('trie', 'werkzeug'):
+        for cache_size in (0, DEFAULT_MATCH_CACHE_SIZE):
+            router, seconds = build(name, routes, cache_size)
+            started = timer()
+            for i in range(args.requests):
+                router.match(environs[i % len(environs)])
+            elapsed = timer() - started
+            label = name + ('+lru' if cache_size else '')
+            print('{0:<14} {1:>10.3f} {2:>12.1f}'.format(
+                label, seconds, args.requests / elapsed))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+    benchmarks.run
+    ~~~~~~~~~~~~~~
+
+    Run Jokk benchmark scenarios.
+
+    .. code-block:: sh
+
+      $ python benchmarks/run.py --json result.json
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jokk.bench import main  # noqa: E402
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
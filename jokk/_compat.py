@@ -13,6 +13,7 @@
     :license: BSD, see LICENSE for more details.
 """
 import sys
+import time
 
 PY2 = sys.version_info[0] == 2
 
@@ -22,6 +23,9 @@ if PY2:
 else:
     text_type = str
 
+#: High resolution clock for measuring durations.
+timer = getattr(time, 'perf_counter', time.time)
+
 
 def to_unicode(x, charset=sys.getdefaultencoding(), errors='strict',
                allow_none_charset=False):
@@ -32,3 +36,13 @@ def to_unicode(x, charset=sys.getdefaultencoding(), errors='strict',
     if charset is None and allow_none_charset:
         return x
     return x.decode(charset, errors)
+
+
+def to_bytes(x, charset=sys.getdefaultencoding(), errors='strict'):
+    if x is None:
+        return None
+    if isinstance(x, (bytes, bytearray, memoryview)):
+        return bytes(x)
+    if isinstance(x, text_type):
+        return x.encode(charset, errors)
+    raise TypeError('Expected bytes')
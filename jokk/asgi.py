@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.asgi
+    ~~~~~~~~~
+
+    ASGI application and asyncio HTTP/1.1 server.
+
+    ASGI application shares routings, response file index and templates with
+    :class:`jokk.server.Jokk`. Cached responses are served in event loop,
+    reading response files and Werkzeug fallback run in thread pool.
+
+    .. code-block:: sh
+
+      $ jokk -c config.json --asgi
+
+    This module requires Python 3.5 or later.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import io
+import sys
+import asyncio
+import logging
+from email.utils import formatdate
+from http import HTTPStatus
+from urllib.parse import unquote
+from werkzeug.exceptions import HTTPException, InternalServerError
+from .server import create_app
+from .largefile import FileIterator
+from .shaping import ShapedBody
+from .faults import AbortConnection, abort_socket
+
+logger = logging.getLogger(__name__)
+
+#: Seconds to keep idle connection.
+KEEP_ALIVE_TIMEOUT = 5.0
+
+
+def to_environ(scope, body=b''):
+    """Create WSGI environ from ASGI scope.
+
+    :param scope: ASGI HTTP scope
+    :param body: Request body bytes
+    """
+    server = scope.get('server') or ('localhost', 80)
+    script_name = scope.get('root_path', '').encode('utf-8')
+    path_info = scope['path'].encode('utf-8')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.decode('latin-1'),
+        'PATH_INFO': path_info.decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/{0}'.format(scope.get('http_version',
+                                                       '1.1')),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+
+    return environ
+
+
+def call_wsgi(app, environ):
+    """Call WSGI application and return `(status, headers, body chunks)`.
+
+    HTTP exceptions such as `NotFound` are converted to responses.
+    :class:`jokk.largefile.FileIterator` and :class:`jokk.shaping.ShapedBody`
+    are returned as is, not to read large file into memory and not to
+    sleep in thread.
+
+    :param app: WSGI application
+    :param environ: WSGI environ
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    try:
+        iterable = app(environ, start_response)
+    except HTTPException as e:
+        iterable = e.get_response(environ)(environ, start_response)
+    except Exception:
+        logger.exception('Error on request')
+        iterable = InternalServerError()(environ, start_response)
+
+    if isinstance(iterable, (FileIterator, ShapedBody)):
+        return started[0], started[1], iterable
+
+    try:
+        body = list(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+
+    return started[0], started[1], body
+
+
+class AsgiJokk(object):
+    """ASGI application.
+
+    :param app: :class:`jokk.server.Jokk`
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported scope {0}'.format(scope['type']))
+
+        body = await self.read_body(receive)
+        environ = to_environ(scope, body)
+
+        #: Request is traced in event loop even if it falls back to thread.
+        trace = self.app.begin_trace(environ)
+
+        #: Cached response never touches files, serve it in event loop.
+        result = self.app.dispatch_environ(environ, cached_only=True)
+        if result is None:
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(None, call_wsgi, self.app,
+                                                environ)
+        status, headers, body = result
+        if trace is not None:
+            self.app.end_trace(trace, status, environ)
+        if isinstance(body, ShapedBody):
+            await self.send_shaped(send, status, headers, body)
+        elif isinstance(body, FileIterator):
+            await self.send_file(scope, send, status, headers, body)
+        else:
+            await self.send_response(send, status, headers, b''.join(body))
+
+    async def read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        return b''.join(chunks)
+
+    async def send_start(self, send, status, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers]
+        })
+
+    async def send_response(self, send, status, headers, body):
+        await self.send_start(send, status, headers)
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def send_file(self, scope, send, status, headers, body):
+        """Send large file by zero copy send extension or by chunks.
+
+        :param scope: ASGI HTTP scope
+        :param send: ASGI send
+        :param status: Status line
+        :param headers: Headers list
+        :param body: :class:`jokk.largefile.FileIterator`
+        """
+        await self.send_start(send, status, headers)
+        extensions = scope.get('extensions') or {}
+        if 'http.response.zerocopysend' in extensions:
+            body.close()
+            with open(body.path, 'rb') as f:
+                await send({'type': 'http.response.zerocopysend', 'file': f,
+                            'offset': body.start,
+                            'count': body.stop - body.start})
+            return
+
+        try:
+            for chunk in body:
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+        finally:
+            body.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def send_shaped(self, send, status, headers, body):
+        """Send chunks sleeping in event loop.
+
+        :param send: ASGI send
+        :param status: Status line
+        :param headers: Headers list
+        :param body: :class:`jokk.shaping.ShapedBody`
+        """
+        await self.send_start(send, status, headers)
+        try:
+            for delay, chunk in body.schedule():
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if chunk is not None:
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': True})
+        finally:
+            body.close()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.app.watcher is not None:
+                    self.app.watcher.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(config_path, **options):
+    """Create ASGI app.
+
+    >>> import uvicorn
+    >>> from jokk.asgi import create_asgi_app
+    >>> app = create_asgi_app('/path/to/config.json')
+    >>> uvicorn.run(app, port=5000)
+
+    :param config_path: Path to config.json
+    :param options: Options passed to :class:`jokk.server.Jokk`
+    """
+    return AsgiJokk(create_app(config_path, **options))
+
+
+class HttpConnection(object):
+    """HTTP/1.1 connection which calls ASGI application.
+
+    :param app: ASGI application
+    :param reader: `asyncio.StreamReader`
+    :param writer: `asyncio.StreamWriter`
+    :param keep_alive_timeout: Seconds to keep idle connection
+    """
+    def __init__(self, app, reader, writer,
+                 keep_alive_timeout=KEEP_ALIVE_TIMEOUT):
+        self.app = app
+        self.reader = reader
+        self.writer = writer
+        self.keep_alive_timeout = keep_alive_timeout
+        self.server = writer.get_extra_info('sockname')
+        self.client = writer.get_extra_info('peername')
+
+    async def serve(self):
+        try:
+            keep_alive = True
+            while keep_alive:
+                keep_alive = await self.handle_request()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                ConnectionError, ValueError):
+            pass
+        finally:
+            self.writer.close()
+
+    async def read_headers(self):
+        headers = []
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                return headers
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip().lower(), value.strip()))
+
+    async def read_body(self, headers):
+        headers = dict(headers)
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.read_headers()
+                    return b''.join(chunks)
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+
+        length = int(headers.get('content-length', 0) or 0)
+        if length == 0:
+            return b''
+
+        return await self.reader.readexactly(length)
+
+    async def handle_request(self):
+        """Handle one request, return `True` if connection is kept."""
+        line = await asyncio.wait_for(self.reader.readline(),
+                                      self.keep_alive_timeout)
+        if not line.strip():
+            return False
+        method, target, version = line.decode('latin-1').split()
+        headers = await self.read_headers()
+        body = await self.read_body(headers)
+
+        connection = dict(headers).get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            keep_alive = connection != 'close'
+        else:
+            keep_alive = connection == 'keep-alive'
+
+        path, _, query = target.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.1'},
+            'http_version': version.split('/', 1)[1],
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': unquote(path),
+            'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': [(k.encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers],
+            'client': self.client[:2] if self.client else None,
+            'server': self.server[:2] if self.server else None,
+            'extensions': {'http.response.zerocopysend': {}}
+        }
+        response = ResponseWriter(self.writer, method.upper() == 'HEAD',
+                                  version, keep_alive)
+        received = []
+
+        async def receive():
+            if received:
+                #: Wait until response is finished.
+                await response.finished.wait()
+                return {'type': 'http.disconnect'}
+            received.append(True)
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        try:
+            await self.app(scope, receive, response.send)
+        except AbortConnection:
+            #: Injected fault, connection is reset.
+            abort_socket(self.writer.get_extra_info('socket'))
+            self.writer.transport.abort()
+            return False
+        except Exception:
+            logger.exception('Error on request')
+            if response.started:
+                return False
+            await response.send({'type': 'http.response.start',
+                                 'status': 500, 'headers': []})
+            await response.send({'type': 'http.response.body',
+                                 'body': b'Internal Server Error'})
+
+        return response.keep_alive and response.finished.is_set()
+
+
+class ResponseWriter(object):
+    """Write ASGI response messages to stream.
+
+    :param writer: `asyncio.StreamWriter`
+    :param head: Request method is HEAD
+    :param version: HTTP version of request
+    :param keep_alive: Connection is kept
+    """
+    def __init__(self, writer, head, version, keep_alive):
+        self.writer = writer
+        self.head = head
+        self.version = version
+        self.keep_alive = keep_alive
+        self.started = False
+        self.chunked = False
+        self.finished = asyncio.Event()
+        self._start = None
+
+    def status_line(self, status):
+        try:
+            phrase = HTTPStatus(status).phrase
+        except ValueError:
+            phrase = 'Unknown'
+
+        return 'HTTP/1.1 {0} {1}\r\n'.format(status, phrase)
+
+    def write_head(self, more_body, body):
+        status, headers = self._start
+        names = set(k.lower() for k, _ in headers)
+        if b'content-length' not in names:
+            if not more_body:
+                headers.append((b'content-length', str(len(body)).encode()))
+            elif self.version == 'HTTP/1.1':
+                self.chunked = True
+                headers.append((b'transfer-encoding', b'chunked'))
+            else:
+                self.keep_alive = False
+        if b'date' not in names:
+            headers.append((b'date', formatdate(usegmt=True).encode()))
+        if not self.keep_alive:
+            headers.append((b'connection', b'close'))
+
+        lines = [self.status_line(status).encode('latin-1')]
+        for k, v in headers:
+            lines.append(k + b': ' + v + b'\r\n')
+        lines.append(b'\r\n')
+        self.writer.write(b''.join(lines))
+        self.started = True
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self._start = (message['status'], list(message.get('headers', [])))
+            return
+        if message['type'] == 'http.response.zerocopysend':
+            return await self.sendfile(message)
+        if message['type'] != 'http.response.body' or self.finished.is_set():
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        if not self.started:
+            self.write_head(more_body, body)
+        if not self.head:
+            if self.chunked:
+                if body:
+                    size = '{0:x}\r\n'.format(len(body)).encode()
+                    self.writer.write(b''.join([size, body, b'\r\n']))
+                if not more_body:
+                    self.writer.write(b'0\r\n\r\n')
+            else:
+                self.writer.write(body)
+        await self.writer.drain()
+        if not more_body:
+            self.finished.set()
+
+    async def sendfile(self, message):
+        """Send file by `os.sendfile` if transport supports it.
+
+        :param message: ASGI zero copy send message
+        """
+        if self.finished.is_set():
+            return
+        count = message.get('count')
+        more_body = message.get('more_body', False)
+        if not self.started:
+            #: Headers have Content-Length, so body is not chunked.
+            self.write_head(True, b'')
+        if not self.head and count != 0:
+            f = message['file']
+            offset = message.get('offset', 0)
+            loop = asyncio.get_event_loop()
+            if self.chunked or not hasattr(loop, 'sendfile'):
+                f.seek(offset)
+                data = f.read(-1 if count is None else count)
+                if self.chunked:
+                    data = '{0:x}\r\n'.format(len(data)).encode() + data + \
+                        b'\r\n'
+                self.writer.write(data)
+            else:
+                await self.writer.drain()
+                await loop.sendfile(self.writer.transport, f, offset, count)
+        if not more_body:
+            if self.chunked and not self.head:
+                self.writer.write(b'0\r\n\r\n')
+            await self.writer.drain()
+            self.finished.set()
+
+
+async def start_server(app, host, port, sock=None, **options):
+    """Start asyncio HTTP/1.1 server.
+
+    :param app: ASGI application
+    :param host: Host to bind
+    :param port: Port number
+    :param sock: Listening socket, `host` and `port` are ignored if passed
+    :param options: Options passed to :class:`HttpConnection`
+    """
+    async def handle(reader, writer):
+        await HttpConnection(app, reader, writer, **options).serve()
+
+    if sock is not None:
+        return await asyncio.start_server(handle, sock=sock)
+
+    return await asyncio.start_server(handle, host, port, reuse_address=True)
+
+
+def run(app, host='127.0.0.1', port=5000, sock=None):
+    """Serve ASGI application forever.
+
+    :param app: ASGI application
+    :param host: Host to bind
+    :param port: Port number
+    :param sock: Listening socket
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(start_server(app, host, port, sock))
+    for v in server.sockets:
+        sys.stderr.write(' * Running on http://{0}:{1}/ '
+                         '(Press CTRL+C to quit)\n'.format(
+                             *v.getsockname()[:2]))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.bench
+    ~~~~~~~~~~
+
+    Load test benchmark of dispatch hot path.
+
+    Benchmark creates config.json and response files of each scenario in
+    temporary directory, then sends requests to WSGI application
+    in-process and over localhost socket.
+
+    .. code-block:: sh
+
+      $ jokk bench
+      $ jokk bench --scenario static --scenario template --requests 5000
+      $ jokk bench --json result.json
+
+    ============ ==============================================
+    Scenario     Description
+    ============ ==============================================
+    static       Response file without url vars
+    template     Url vars assigned to response file
+    jsonp_cors   variables, JSONP callback and CORS headers
+    big          Large response file served from file
+    many_routes  Requests spread over many routes
+    many_map     many_routes matched by Werkzeug map
+    concurrent   Static route requested by concurrent clients
+    ============ ==============================================
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import json
+import math
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+from werkzeug.test import EnvironBuilder
+from . import __version__
+from ._compat import timer
+from .server import create_app
+from .serving import ThreadPoolWSGIServer, KeepAliveRequestHandler
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+#: Modes to send requests.
+MODES = ('inprocess', 'socket')
+
+#: Percentiles reported in results.
+PERCENTILES = (('p50', 0.5), ('p99', 0.99), ('p999', 0.999))
+
+
+class Scenario(object):
+    """Config.json, response files and paths to request.
+
+    :param name: Name of scenario
+    :param config: Config dict
+    :param files: Dict of file name in data directory to content
+    :param paths: Paths to request in turn
+    :param concurrency: Number of concurrent clients, `None` uses option
+    :param options: Options passed to :func:`jokk.server.create_app`
+    """
+    def __init__(self, name, config, files, paths, concurrency=None,
+                 options=None):
+        self.name = name
+        self.config = config
+        self.files = files
+        self.paths = paths
+        self.concurrency = concurrency
+        self.options = options or {}
+
+    def setup(self, root_path):
+        """Write config.json and response files, return config path.
+
+        :param root_path: Directory to write files
+        """
+        config_path = os.path.join(root_path, self.name, 'config.json')
+        data_path = os.path.join(root_path, self.name, 'data')
+        os.makedirs(data_path)
+        with open(config_path, 'w') as f:
+            f.write(json.dumps(self.config))
+        for k, v in self.files.items():
+            path = os.path.join(data_path, k)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(v)
+
+        return config_path
+
+
+def create_scenarios():
+    """Return dict of name to :class:`Scenario`."""
+    user = json.dumps({'id': 1, 'name': 'jokk', 'tags': ['a', 'b', 'c']})
+    template = json.dumps({'id': '${userid}', 'name': 'user ${userid}'})
+    variables = json.dumps({'id': '${id}', 'server': '${server}'})
+    big = json.dumps([{'id': i, 'name': 'item {0}'.format(i)}
+                      for i in range(60000)])
+
+    routes = ['/resource{0}/<id>'.format(i) for i in range(500)]
+    many_files = dict(('resource{0}/id_get.json'.format(i), user)
+                      for i in range(500))
+    many_paths = ['/resource{0}/{1}'.format(i * 7 % 500, i)
+                  for i in range(500)]
+
+    scenarios = [
+        Scenario('static', {'routes': ['/user']},
+                 {'user_get.json': user}, ['/user']),
+        Scenario('template', {'routes': ['/user/<userid>']},
+                 {'user/userid_get.json': template},
+                 ['/user/{0}'.format(i) for i in range(100)]),
+        Scenario('jsonp_cors',
+                 {'routes': ['/item/<id>'], 'jsonp': True, 'cors': True,
+                  'variables': {'server': 'http://example.com'}},
+                 {'item/id_get.json': variables},
+                 ['/item/{0}?callback=cb{0}'.format(i) for i in range(100)]),
+        Scenario('big', {'routes': ['/big']}, {'big_get.json': big},
+                 ['/big']),
+        Scenario('many_routes', {'routes': routes}, many_files, many_paths),
+        Scenario('many_map', {'routes': routes}, many_files, many_paths,
+                 options={'routing': 'werkzeug'}),
+        Scenario('concurrent', {'routes': ['/user']},
+                 {'user_get.json': user}, ['/user'], concurrency=8)
+    ]
+
+    return dict((v.name, v) for v in scenarios)
+
+
+def percentile(values, q):
+    """Return percentile of sorted values.
+
+    :param values: Sorted list
+    :param q: Percentile from 0 to 1
+    """
+    if not values:
+        return 0.0
+    index = int(math.ceil(q * len(values))) - 1
+
+    return values[min(max(index, 0), len(values) - 1)]
+
+
+def summarize(latencies, seconds):
+    """Return dict of throughput and latency in milliseconds.
+
+    :param latencies: List of latency in seconds
+    :param seconds: Elapsed seconds
+    """
+    values = sorted(latencies)
+    latency = {}
+    for name, q in PERCENTILES:
+        latency[name] = percentile(values, q) * 1000
+    latency['mean'] = sum(values) / len(values) * 1000 if values else 0.0
+    latency['max'] = values[-1] * 1000 if values else 0.0
+
+    return {
+        'requests': len(values),
+        'seconds': seconds,
+        'rps': len(values) / seconds if seconds else 0.0,
+        'latency_ms': latency
+    }
+
+
+def split(total, concurrency):
+    """Split total requests to clients.
+
+    :param total: Number of requests
+    :param concurrency: Number of clients
+    """
+    return [total // concurrency + (1 if i < total % concurrency else 0)
+            for i in range(concurrency)]
+
+
+def run_clients(client, paths, requests, concurrency):
+    """Run clients in threads, return `(latencies, seconds)`.
+
+    :param client: Function called with paths and number of requests,
+                   returns list of latencies
+    :param paths: Paths to request
+    :param requests: Number of requests
+    :param concurrency: Number of clients
+    """
+    results = []
+    lock = threading.Lock()
+
+    def run(count, offset):
+        ordered = paths[offset % len(paths):] + paths[:offset % len(paths)]
+        latencies = client(ordered, count)
+        with lock:
+            results.extend(latencies)
+
+    threads = [threading.Thread(target=run, args=(v, i))
+               for i, v in enumerate(split(requests, concurrency))]
+    started = timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, timer() - started
+
+
+def inprocess_client(app):
+    """Return client which calls WSGI application directly.
+
+    :param app: WSGI application
+    """
+    environs = {}
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def request(paths, count):
+        latencies = []
+        for i in range(count):
+            path = paths[i % len(paths)]
+            if path not in environs:
+                environs[path] = EnvironBuilder(path).get_environ()
+            environ = dict(environs[path])
+            started = timer()
+            iterable = app(environ, start_response)
+            try:
+                for _ in iterable:
+                    pass
+            finally:
+                if hasattr(iterable, 'close'):
+                    iterable.close()
+            latencies.append(timer() - started)
+
+        return latencies
+
+    return request
+
+
+class QuietRequestHandler(KeepAliveRequestHandler):
+    """Request handler which doesn't log requests."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def socket_client(port):
+    """Return client which sends requests by keep-alive connection.
+
+    :param port: Port number of localhost
+    """
+    def request(paths, count):
+        latencies = []
+        conn = HTTPConnection('127.0.0.1', port)
+        try:
+            for i in range(count):
+                started = timer()
+                conn.request('GET', paths[i % len(paths)])
+                res = conn.getresponse()
+                res.read()
+                latencies.append(timer() - started)
+        finally:
+            conn.close()
+
+        return latencies
+
+    return request
+
+
+def run_scenario(scenario, root_path, modes=MODES, requests=2000,
+                 concurrency=1, warmup=100):
+    """Run scenario and return list of results.
+
+    :param scenario: :class:`Scenario`
+    :param root_path: Directory to write files
+    :param modes: Modes to send requests
+    :param requests: Number of measured requests
+    :param concurrency: Number of clients unless scenario defines it
+    :param warmup: Number of requests not measured
+    """
+    config_path = scenario.setup(root_path)
+    app = create_app(config_path, **scenario.options)
+    if scenario.concurrency is not None:
+        concurrency = scenario.concurrency
+
+    results = []
+    for mode in modes:
+        server = None
+        if mode == 'socket':
+            server = ThreadPoolWSGIServer('127.0.0.1', 0, app,
+                                          threads=max(concurrency, 4),
+                                          backlog=max(concurrency, 64),
+                                          handler=QuietRequestHandler)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            client = socket_client(server.port)
+        else:
+            client = inprocess_client(app)
+
+        try:
+            if warmup:
+                run_clients(client, scenario.paths, warmup, concurrency)
+            latencies, seconds = run_clients(client, scenario.paths,
+                                             requests, concurrency)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        result = {'scenario': scenario.name, 'mode': mode,
+                  'concurrency': concurrency}
+        result.update(summarize(latencies, seconds))
+        results.append(result)
+
+    return results
+
+
+def run(names=None, modes=MODES, requests=2000, concurrency=1, warmup=100):
+    """Run scenarios and return report dict.
+
+    :param names: Names of scenarios, `None` runs all
+    :param modes: Modes to send requests
+    :param requests: Number of measured requests
+    :param concurrency: Number of clients
+    :param warmup: Number of requests not measured
+    """
+    scenarios = create_scenarios()
+    if names is None:
+        names = sorted(scenarios)
+
+    root_path = tempfile.mkdtemp()
+    results = []
+    try:
+        for name in names:
+            results.extend(run_scenario(scenarios[name], root_path, modes,
+                                        requests, concurrency, warmup))
+    finally:
+        shutil.rmtree(root_path)
+
+    return {
+        'jokk': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'requests': requests,
+        'results': results
+    }
+
+
+def format_report(report):
+    """Format report as text table.
+
+    :param report: Report dict
+    """
+    header = '{0:<12} {1:<10} {2:>4} {3:>10} {4:>9} {5:>9} {6:>9}'
+    lines = [header.format('scenario', 'mode', 'conc', 'req/s', 'p50 ms',
+                           'p99 ms', 'p999 ms')]
+    row = '{0:<12} {1:<10} {2:>4} {3:>10.1f} {4:>9.3f} {5:>9.3f} {6:>9.3f}'
+    for v in report['results']:
+        latency = v['latency_ms']
+        lines.append(row.format(v['scenario'], v['mode'], v['concurrency'],
+                                v['rps'], latency['p50'], latency['p99'],
+                                latency['p999']))
+
+    return '\n'.join(lines)
+
+
+def parse_option(argv=None):
+    """Parse options of `jokk bench`.
+
+    ====================== ========== ==============================
+    Options                Default    Description
+    ====================== ========== ==============================
+    --scenario             all        Scenario to run, repeatable
+    --mode                 all        inprocess or socket
+    -n, --requests         2000       Number of measured requests
+    --concurrency          1          Number of clients
+    --warmup               100        Number of warmup requests
+    --json                 None       Write JSON report, `-` is stdout
+    ====================== ========== ==============================
+
+    :param argv: Arguments
+    """
+    parser = argparse.ArgumentParser(prog='jokk bench',
+                                     description='Benchmark Jokk.')
+    parser.add_argument('--scenario', action='append',
+                        choices=sorted(create_scenarios()))
+    parser.add_argument('--mode', action='append', choices=MODES)
+    parser.add_argument('-n', '--requests', default=2000, type=int)
+    parser.add_argument('--concurrency', default=1, type=int)
+    parser.add_argument('--warmup', default=100, type=int)
+    parser.add_argument('--json')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run `jokk bench`.
+
+    :param argv: Arguments
+    """
+    args = parse_option(argv)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    report = run(args.scenario, args.mode or MODES, args.requests,
+                 args.concurrency, args.warmup)
+
+    if args.json == '-':
+        sys.stdout.write(json.dumps(report, indent=2, sort_keys=True) + '\n')
+        return
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            f.write(json.dumps(report, indent=2, sort_keys=True))
+
+    print(format_report(report))
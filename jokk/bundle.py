@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.bundle
+    ~~~~~~~~~~~
+
+    Packed bundle of config.json and response files.
+
+    Data directories with many small response files spend startup and cold
+    requests on open and stat syscalls. `jokk pack` compiles config.json
+    and resolved response files into one file, Jokk maps it by mmap and
+    serves response bodies from memory without filesystem access.
+
+    .. code-block:: sh
+
+      $ jokk pack -c config.json -o mock.jokk
+      $ jokk -c mock.jokk
+
+    Bundle is header followed by JSON index and concatenated bodies.
+
+    ========== ====================================================
+    Bytes      Description
+    ========== ====================================================
+    8          Magic `JOKKPACK`
+    2          Format version, big endian
+    4          Length of JSON index, big endian
+    variable   JSON index of config and `(route, method)` to offset,
+               length, mimetype and status of body
+    variable   Bodies
+    ========== ====================================================
+
+    Precompressed sidecar files are not packed, static responses are
+    compressed once in memory.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import json
+import mmap
+import struct
+import argparse
+from .index import DataIndex, Descriptor
+from ._compat import to_bytes
+
+#: Magic bytes of bundle.
+MAGIC = b'JOKKPACK'
+
+#: Format version of bundle.
+VERSION = 1
+
+#: Magic, version and length of JSON index.
+HEADER = struct.Struct('>8sHI')
+
+
+def is_bundle(path):
+    """Return `True` if file is bundle.
+
+    :param path: Path to file
+    """
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def pack(config, index, output):
+    """Write bundle and return number of packed response files.
+
+    :param config: Config dict
+    :param index: :class:`jokk.index.DataIndex`
+    :param output: Path to bundle
+    """
+    files = []
+    bodies = []
+    offset = 0
+    for endpoint, method in sorted(index.keys()):
+        descriptor = index.lookup(endpoint, method)
+        item = {'route': endpoint, 'method': method,
+                'status': descriptor.status, 'offset': None, 'length': 0}
+        if descriptor.path is not None:
+            #: Read as text same as Jokk loads response files.
+            with open(descriptor.path, 'r') as f:
+                body = to_bytes(f.read(), 'utf-8')
+            item.update({
+                'name': os.path.relpath(descriptor.path, index.data_path),
+                'ext': descriptor.ext, 'mimetype': descriptor.mimetype,
+                'offset': offset, 'length': len(body)})
+            bodies.append(body)
+            offset += len(body)
+        files.append(item)
+
+    header = json.dumps({'config': config, 'files': files},
+                        sort_keys=True).encode('utf-8')
+    with open(output, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        for body in bodies:
+            f.write(body)
+
+    return len(bodies)
+
+
+class Bundle(object):
+    """Bundle mapped by mmap.
+
+    Bodies are read from mapped memory, so process never opens
+    response files.
+
+    :param path: Path to bundle
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError('{0} is not bundle'.format(path))
+        if version != VERSION:
+            raise ValueError('Unsupported bundle version {0}'.format(version))
+
+        start = HEADER.size + length
+        header = json.loads(self._mmap[HEADER.size:start].decode('utf-8'))
+        #: Offset of bodies.
+        self.start = start
+        self.config = header['config']
+        self.files = header['files']
+
+    def read(self, offset, length):
+        """Return body bytes.
+
+        :param offset: Offset from start of bodies
+        :param length: Length of body
+        """
+        offset += self.start
+
+        return self._mmap[offset:offset + length]
+
+
+class BundleDescriptor(Descriptor):
+    """Response file in bundle.
+
+    :param bundle: :class:`Bundle`
+    :param offset: Offset of body in bundle
+    :param path: Path of response file relative to data directory
+    :param ext: Extension of response file
+    :param mimetype: Mimetype of response file
+    :param status: Status code from `.status` file or `None`
+    :param size: Size of response file
+    """
+    __slots__ = ('bundle', 'offset')
+
+    def __init__(self, bundle, offset, path, ext, mimetype, status, size):
+        super(BundleDescriptor, self).__init__(path, ext, mimetype, status,
+                                               size)
+        self.bundle = bundle
+        self.offset = offset
+
+    def read(self):
+        """Return body bytes."""
+        return self.bundle.read(self.offset, self.size)
+
+
+class BundleIndex(DataIndex):
+    """Index of response files in bundle.
+
+    :param bundle: :class:`Bundle`
+    :param routes: Url rules
+    """
+    def __init__(self, bundle, routes):
+        self.data_path = bundle.path
+        self.mimetypes = None
+        self._index = {}
+
+        routes = set(routes)
+        for v in bundle.files:
+            if v['route'] not in routes:
+                continue
+            if v['offset'] is None:
+                descriptor = Descriptor(status=v['status'])
+            else:
+                descriptor = BundleDescriptor(bundle, v['offset'], v['name'],
+                                              v['ext'], v['mimetype'],
+                                              v['status'], v['length'])
+            self._index[(v['route'], v['method'])] = descriptor
+        self.build_matchers()
+
+
+def parse_option(argv=None):
+    """Parse options of `jokk pack`.
+
+    ====================== ========== ==============================
+    Options                Default    Description
+    ====================== ========== ==============================
+    -c, --config           None       Config file
+    -o, --output           None       Bundle, default is `.jokk` ext
+    ====================== ========== ==============================
+
+    :param argv: Arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='jokk pack',
+        description='Pack config.json and response files into bundle.')
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('-o', '--output')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run `jokk pack`.
+
+    :param argv: Arguments
+    """
+    from .server import Jokk
+
+    args = parse_option(argv)
+    config_path = os.path.abspath(args.config)
+    output = args.output or os.path.splitext(config_path)[0] + '.jokk'
+
+    app = Jokk(config_path, cache_size=0)
+    count = pack(app.config, app.index, output)
+    print('Packed {0} response files to {1} ({2} bytes)'.format(
+        count, output, os.path.getsize(output)))
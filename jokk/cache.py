@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.cache
+    ~~~~~~~~~~
+
+    In-memory response file cache.
+
+    Jokk resolves a response file, a status file and a mimetype for every
+    request. Resolved results are kept in memory and validated by file's
+    mtime and size, so repeated hits don't need to probe and read files.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+#: Default cache size in bytes.
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024
+
+
+def file_stamp(path):
+    """Return file's `(mtime, size)` or `None` if file does not exist.
+
+    :param path: Path to file
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return (st.st_mtime, st.st_size)
+
+
+class CacheEntry(object):
+    """Resolved response file.
+
+    :param path: Path to response file or `None` if not found
+    :param mimetype: Mimetype of response file
+    :param status: Status code from `.status` file or `None`
+    :param body: Parsed response body
+    :param stamps: List of `(path, stamp)` which entry depends on
+    :param nbytes: Size of entry in bytes
+    """
+    __slots__ = ('path', 'mimetype', 'status', 'body', 'stamps', 'nbytes',
+                 'prepared', 'sidecars', 'variants')
+
+    def __init__(self, path, mimetype, status, body, stamps, nbytes=0):
+        self.path = path
+        self.mimetype = mimetype
+        self.status = status
+        self.body = body
+        self.stamps = stamps
+        self.nbytes = nbytes
+        #: :class:`jokk.response.PreparedResponse` of static body.
+        self.prepared = None
+        #: Precompressed files and prepared responses by encoding.
+        self.sidecars = {}
+        self.variants = {}
+
+    def is_fresh(self):
+        """Return `True` unless files which entry depends on are modified."""
+        for path, stamp in self.stamps:
+            if file_stamp(path) != stamp:
+                return False
+
+        return True
+
+
+class ResponseCache(object):
+    """LRU cache bounded by total bytes of cached entries.
+
+    :param max_bytes: Max total bytes, `0` disables cache
+    :param validate: Validate entries by mtime and size on every hit
+    """
+    def __init__(self, max_bytes=DEFAULT_CACHE_SIZE, validate=True):
+        self.max_bytes = max_bytes
+        self.validate = validate
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Get fresh entry or `None`.
+
+        :param key: Cache key
+        """
+        entry = self._entries.get(key)
+        if entry is not None and self.validate and not entry.is_fresh():
+            self.invalidate(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        with self._lock:
+            #: Move to the end (most recently used).
+            if key in self._entries:
+                self._entries[key] = self._entries.pop(key)
+        self.hits += 1
+
+        return entry
+
+    def set(self, key, entry):
+        """Set entry and evict least recently used entries if needed.
+
+        :param key: Cache key
+        :param entry: :class:`CacheEntry`
+        """
+        if self.max_bytes <= 0 or entry.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.nbytes
+            self._entries[key] = entry
+            self.total_bytes += entry.nbytes
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def add_bytes(self, key, nbytes):
+        """Account bytes added to cached entry such as compressed body.
+
+        :param key: Cache key
+        :param nbytes: Added bytes
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.nbytes += nbytes
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Remove entry.
+
+        :param key: Cache key
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry.nbytes
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """Return cache counters as dict."""
+        return {
+            'entries': len(self._entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.compression
+    ~~~~~~~~~~~~~~~~
+
+    Response compression negotiated by `Accept-Encoding`.
+
+    Static responses are compressed once per snapshot, precompressed
+    sidecar files such as `user_get.json.gz` are served as is, responses
+    with url vars are compressed per request only when they are large.
+
+    .. code-block:: json
+
+      {
+        "compression": {"gzip_level": 6, "brotli_level": 5, "min_size": 1024}
+      }
+
+    Brotli requires `brotli` package, sidecar `.br` files are served
+    without it.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import zlib
+import threading
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+#: Extensions of sidecar files to encodings.
+SIDECAR_EXTS = {'gz': GZIP, 'br': BROTLI}
+
+#: Default min bytes of response compressed per request.
+DEFAULT_MIN_SIZE = 1024
+
+
+def gzip_compress(data, level=6):
+    """Compress data to gzip format.
+
+    mtime in gzip header is always 0, so same data makes same bytes
+    and same ETag in all workers.
+
+    :param data: Bytes
+    :param level: Compression level from 1 to 9
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    return compressor.compress(data) + compressor.flush()
+
+
+class Compression(object):
+    """Compression options of snapshot.
+
+    :param gzip_level: gzip level from 1 to 9
+    :param brotli_level: Brotli quality from 0 to 11
+    :param min_size: Min bytes of response compressed per request
+    """
+    options = ('gzip_level', 'brotli_level', 'min_size')
+
+    __slots__ = options + ('encodings',)
+
+    def __init__(self, gzip_level=6, brotli_level=5,
+                 min_size=DEFAULT_MIN_SIZE):
+        if gzip_level not in range(1, 10):
+            raise ValueError('gzip_level should be from 1 to 9')
+        if brotli_level not in range(0, 12):
+            raise ValueError('brotli_level should be from 0 to 11')
+        if not isinstance(min_size, int) or min_size < 0:
+            raise ValueError('min_size should be positive integer')
+
+        self.gzip_level = gzip_level
+        self.brotli_level = brotli_level
+        self.min_size = min_size
+        #: Encodings which Jokk can compress, in preferred order.
+        self.encodings = (GZIP,) if brotli is None else (BROTLI, GZIP)
+
+    @classmethod
+    def from_config(cls, value):
+        """Create options from `compression` value of config.json.
+
+        Return `None` if compression is disabled.
+
+        :param value: `true` or dict of options
+        """
+        if value is None or value is False:
+            return None
+        if value is True:
+            return cls()
+
+        unknown = set(value) - set(cls.options)
+        if unknown:
+            raise ValueError('Unknown compression options {0}'.format(
+                ', '.join(sorted(unknown))))
+
+        return cls(**value)
+
+    def negotiate(self, accept_encoding, sidecars=(), compress=True):
+        """Return best encoding or `None` for identity.
+
+        :param accept_encoding: `Accept-Encoding` header value
+        :param sidecars: Encodings of sidecar files
+        :param compress: Encodings which Jokk compresses are available
+        """
+        if not accept_encoding:
+            return None
+
+        accept = parse_accept_header(accept_encoding)
+        best = None
+        best_quality = 0
+        for encoding in (BROTLI, GZIP):
+            if encoding not in sidecars and \
+                    not (compress and encoding in self.encodings):
+                continue
+            quality = accept[encoding]
+            if quality > best_quality:
+                best = encoding
+                best_quality = quality
+
+        return best
+
+    def compress(self, data, encoding):
+        """Compress data.
+
+        :param data: Bytes
+        :param encoding: `gzip` or `br`
+        """
+        if encoding == BROTLI:
+            return brotli.compress(data, quality=self.brotli_level)
+
+        return gzip_compress(data, self.gzip_level)
+
+
+class CompressionStats(object):
+    """Counters of compressed responses by encoding."""
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, encoding, original, compressed):
+        """Count compressed response.
+
+        :param encoding: Content encoding
+        :param original: Bytes before compression
+        :param compressed: Bytes sent
+        """
+        with self._lock:
+            counters = self._counters.setdefault(encoding, [0, 0, 0])
+            counters[0] += 1
+            counters[1] += original
+            counters[2] += compressed
+
+    def stats(self):
+        """Return dict of encoding to counters."""
+        with self._lock:
+            return dict((k, {'responses': v[0], 'original_bytes': v[1],
+                             'compressed_bytes': v[2]})
+                        for k, v in self._counters.items())
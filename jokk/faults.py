@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.faults
+    ~~~~~~~~~~~
+
+    Fault and latency injection for resilience testing.
+
+    Routes defined in `faults` of config.json are delayed, fail with error
+    status, reset connection or truncate body at given rates. Faults are
+    driven by random generator seeded by `seed`, so runs are reproducible.
+
+    .. code-block:: json
+
+      {
+        "faults": {
+          "seed": 42,
+          "/user": {"latency": {"distribution": "histogram",
+                                "buckets": [[0.01, 90], [0.5, 9], [2, 1]]},
+                    "error_rate": 0.05, "error_status": [500, 503]},
+          "*": {"reset_rate": 0.01, "truncate_rate": 0.01}
+        }
+      }
+
+    Delays are scheduled like streaming, so asyncio server sleeps in event
+    loop and doesn't block threads.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import socket
+import struct
+import random
+import threading
+from werkzeug.http import HTTP_STATUS_CODES
+from .shaping import Delay, ShapedBody, ANY_ROUTE
+from .response import error_response
+
+try:
+    _ConnectionError = ConnectionResetError
+except NameError:
+    _ConnectionError = socket.error
+
+#: Kinds of injected faults.
+ERROR = 'error'
+RESET = 'reset'
+TRUNCATE = 'truncate'
+
+
+class AbortConnection(_ConnectionError):
+    """Raised by response body to close connection without completing
+    response.
+    """
+
+
+def abort_socket(sock):
+    """Make socket send RST instead of FIN on closing.
+
+    :param sock: Socket or `None`
+    """
+    if sock is None:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                        struct.pack('ii', 1, 0))
+    except (OSError, socket.error):
+        pass
+
+
+def check_rate(name, value):
+    if not isinstance(value, (int, float)) or not 0 <= value <= 1:
+        raise ValueError('{0} should be between 0 and 1'.format(name))
+
+    return value
+
+
+class Fault(object):
+    """Fault profile of route.
+
+    :param latency: :class:`jokk.shaping.Delay` before response
+    :param error_rate: Fraction of requests which fail with error status
+    :param error_status: Status code or list of status codes of errors
+    :param reset_rate: Fraction of requests whose connection is reset
+    :param truncate_rate: Fraction of requests whose body is truncated
+    :param rng: `random.Random` instance
+    """
+    options = ('latency', 'error_rate', 'error_status', 'reset_rate',
+               'truncate_rate')
+
+    __slots__ = options + ('rng', '_lock')
+
+    def __init__(self, latency=None, error_rate=0, error_status=500,
+                 reset_rate=0, truncate_rate=0, rng=None):
+        if not isinstance(error_status, list):
+            error_status = [error_status]
+        if not error_status or not all(v in HTTP_STATUS_CODES
+                                       for v in error_status):
+            raise ValueError('error_status should be HTTP status codes')
+        rates = (check_rate('error_rate', error_rate),
+                 check_rate('reset_rate', reset_rate),
+                 check_rate('truncate_rate', truncate_rate))
+        if sum(rates) > 1:
+            raise ValueError('Sum of rates should not be greater than 1')
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reset_rate = reset_rate
+        self.truncate_rate = truncate_rate
+        self.rng = rng or random.Random()
+        #: Random numbers of one request are drawn together, so sequence
+        #: of faults doesn't depend on threads.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, options, rng=None):
+        """Create fault from route options in config.json.
+
+        :param options: Dict of options
+        :param rng: `random.Random` instance
+        """
+        unknown = set(options) - set(cls.options)
+        if unknown:
+            raise ValueError('Unknown faults options {0}'.format(
+                ', '.join(sorted(unknown))))
+        options = dict(options)
+        if options.get('latency') is not None:
+            options['latency'] = Delay.from_config(options['latency'])
+
+        return cls(rng=rng, **options)
+
+    def decide(self):
+        """Return :class:`Injection` of request or `None` if request is
+        served as is.
+        """
+        rng = self.rng
+        with self._lock:
+            delay = 0.0
+            if self.latency is not None:
+                delay = self.latency.sample(rng)
+            kind = None
+            value = None
+            r = rng.random()
+            if r < self.error_rate:
+                kind = ERROR
+                value = rng.choice(self.error_status)
+            elif r < self.error_rate + self.reset_rate:
+                kind = RESET
+            elif r < self.error_rate + self.reset_rate + self.truncate_rate:
+                kind = TRUNCATE
+                value = rng.random()
+
+        if kind is None and delay <= 0:
+            return None
+
+        return Injection(delay, kind, value)
+
+
+class Injection(object):
+    """Fault injected into one request.
+
+    :param delay: Seconds before response
+    :param kind: `error`, `reset`, `truncate` or `None` if only delayed
+    :param value: Status code of error or fraction of body kept
+                  by truncating
+    """
+    __slots__ = ('delay', 'kind', 'value')
+
+    def __init__(self, delay=0.0, kind=None, value=None):
+        self.delay = delay
+        self.kind = kind
+        self.value = value
+
+    def respond(self, headers):
+        """Return `(status, headers, body iterable)` which replaces
+        response, or `None` if response is created as usual.
+
+        :param headers: Headers added to all responses
+        """
+        if self.kind == RESET:
+            return '502 Bad Gateway', [], []
+        if self.kind != ERROR:
+            return None
+
+        return error_response(self.value, headers)
+
+    def create_body(self, body, content_length):
+        """Return :class:`FaultyBody`.
+
+        :param body: Body iterable
+        :param content_length: Value of Content-Length header or `None`
+        """
+        truncate = None
+        if self.kind == TRUNCATE:
+            try:
+                truncate = int(int(content_length) * self.value)
+            except (TypeError, ValueError):
+                truncate = 0
+
+        return FaultyBody(body, self.delay, truncate, self.kind == RESET)
+
+    def apply(self, status, headers, body):
+        """Return `(status, headers, body iterable)` with fault.
+
+        :param status: Status line
+        :param headers: Headers list
+        :param body: Body iterable
+        """
+        content_length = None
+        for k, v in headers:
+            if k.lower() == 'content-length':
+                content_length = v
+
+        return status, headers, self.create_body(body, content_length)
+
+    def apply_response(self, response):
+        """Inject fault into Werkzeug response in place.
+
+        :param response: Werkzeug response
+        """
+        body = response.response
+        if not isinstance(body, ShapedBody):
+            body = response.iter_encoded()
+        response.response = self.create_body(
+            body, response.headers.get('Content-Length'))
+        response.direct_passthrough = True
+
+        return response
+
+
+class FaultyBody(ShapedBody):
+    """Body iterable which is delayed, truncated or reset.
+
+    :param iterable: Body iterable, schedule of
+                     :class:`jokk.shaping.ShapedBody` is kept
+    :param delay: Seconds before first chunk
+    :param truncate: Bytes sent before connection is closed, `None`
+                     sends all
+    :param reset: Close connection before sending headers
+    """
+    def __init__(self, iterable, delay=0.0, truncate=None, reset=False):
+        self.iterable = iterable
+        self.delay = delay
+        self.truncate = truncate
+        self.reset = reset
+
+    def schedule(self):
+        delay = self.delay
+        if self.reset:
+            yield delay, None
+            raise AbortConnection('Connection is reset by faults')
+
+        if isinstance(self.iterable, ShapedBody):
+            chunks = self.iterable.schedule()
+        else:
+            chunks = ((0.0, v) for v in self.iterable)
+        sent = 0
+        for d, chunk in chunks:
+            if chunk is not None and self.truncate is not None and \
+                    sent + len(chunk) > self.truncate:
+                yield d + delay, chunk[:self.truncate - sent]
+                raise AbortConnection('Body is truncated by faults')
+            yield d + delay, chunk
+            delay = 0.0
+            if chunk is not None:
+                sent += len(chunk)
+
+        if self.truncate is not None:
+            yield delay, b''
+            raise AbortConnection('Body is truncated by faults')
+        #: Headers are delayed even if body is empty.
+        if delay > 0:
+            yield delay, b''
+
+
+def parse_faults(config, worker=None):
+    """Create dict of route to :class:`Fault` from `faults` config.
+
+    Each route has its own random generator seeded by `seed` and route,
+    so faults of route don't depend on requests to other routes.
+    Prefork workers add their index to seed, otherwise all workers
+    would inject same faults.
+
+    :param config: `faults` value of config.json
+    :param worker: Index of prefork worker, `None` in single process
+    """
+    if not config:
+        return {}
+
+    config = dict(config)
+    seed = config.pop('seed', None)
+    faults = {}
+    for k, v in config.items():
+        if not k.startswith('/') and k != ANY_ROUTE:
+            raise ValueError('Unknown faults route {0}'.format(k))
+        rng = random.Random()
+        if seed is not None and worker is not None:
+            rng.seed('{0}:{1}:{2}'.format(seed, worker, k))
+        elif seed is not None:
+            rng.seed('{0}:{1}'.format(seed, k))
+        faults[k] = Fault.from_config(v, rng)
+
+    return faults
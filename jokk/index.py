@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.index
+    ~~~~~~~~~~
+
+    Route to response file index.
+
+    Jokk scans data directory once and maps every `(endpoint, method)`
+    to resolved response file, so requests don't need to probe files.
+    Variants such as `user_get.page=2.json` are indexed by method with
+    conditions, `get.page=2`.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import re
+from .compression import SIDECAR_EXTS
+from .variants import split_file_name, build_matchers
+
+
+def endpoint_to_file_name(endpoint):
+    """Convert url rule to base response file name.
+
+    `/user/<userid>` would be `user/userid`.
+
+    :param endpoint: Url rule
+    """
+    #: http://127.0.0.1:5000/ should return `_get.json`.
+    if endpoint == '/':
+        return ''
+
+    return re.sub(r'[<|>]', '', endpoint.lstrip('/'))
+
+
+def read_status(path):
+    """Read status code from `.status` file.
+
+    :param path: Path to status file
+    """
+    with open(path, 'r') as f:
+        return int(f.read())
+
+
+class Descriptor(object):
+    """Resolved response file.
+
+    :param path: Path to response file or `None` if not found
+    :param ext: Extension of response file
+    :param mimetype: Mimetype of response file
+    :param status: Status code from `.status` file or `None`
+    :param size: Size of response file
+    :param sidecars: Dict of encoding to precompressed file
+    """
+    __slots__ = ('path', 'ext', 'mimetype', 'status', 'size', 'sidecars')
+
+    def __init__(self, path=None, ext=None, mimetype=None, status=None,
+                 size=0, sidecars=None):
+        self.path = path
+        self.ext = ext
+        self.mimetype = mimetype
+        self.status = status
+        self.size = size
+        self.sidecars = sidecars or {}
+
+
+#: Returned when neither response file nor status file are found.
+MISSING = Descriptor()
+
+
+class DataIndex(object):
+    """Index of `(endpoint, method)` to :class:`Descriptor`.
+
+    :param data_path: Path to data directory
+    :param routes: Url rules
+    :param mimetypes: List of `{'ext': ..., 'mimetype': ...}`
+    """
+    def __init__(self, data_path, routes, mimetypes):
+        self.data_path = data_path
+        self.mimetypes = mimetypes
+        self._index = {}
+
+        files = self.scan()
+        for endpoint in routes:
+            methods = files.get(endpoint_to_file_name(endpoint), {})
+            for method, found in methods.items():
+                descriptor = self.resolve(method, found)
+                if descriptor is not None:
+                    self._index[(endpoint, method)] = descriptor
+        self.build_matchers()
+
+    def __len__(self):
+        return len(self._index)
+
+    def build_matchers(self):
+        """Compile variants of indexed response files."""
+        #: `(endpoint, method)` to :class:`jokk.variants.VariantMatcher`.
+        self._matchers = build_matchers(self._index.keys())
+
+    def keys(self):
+        """Return `(endpoint, method)` list of indexed response files."""
+        return list(self._index.keys())
+
+    def scan(self):
+        """Walk data directory and collect response files.
+
+        Return dict of `{file_name: {method: {ext: path}}}`.
+        Sidecar files such as `user_get.json.gz` are collected as
+        `json.gz` ext, variants such as `user_get.page=2.json` are
+        collected as `get.page=2` method.
+        """
+        exts = set(v['ext'] for v in self.mimetypes)
+        exts.add('status')
+
+        files = {}
+        for root, _, names in os.walk(self.data_path):
+            rel_path = os.path.relpath(root, self.data_path)
+            for name in names:
+                base, _, ext = name.rpartition('.')
+                suffix = None
+                if ext in SIDECAR_EXTS:
+                    suffix = ext
+                    base, _, ext = base.rpartition('.')
+                    if ext == 'status':
+                        continue
+                if ext not in exts or '_' not in base:
+                    continue
+                if suffix is not None:
+                    ext = ext + '.' + suffix
+                file_name, method = split_file_name(base)
+                if rel_path != os.curdir:
+                    file_name = '/'.join(rel_path.split(os.sep) + [file_name])
+                found = files.setdefault(file_name, {}).setdefault(method, {})
+                found[ext] = os.path.join(root, name)
+
+        return files
+
+    def resolve(self, method, found):
+        """Create descriptor from found files.
+
+        Find response file json, xml, html, txt order.
+
+        :param method: Lower cased HTTP method
+        :param found: Dict of `{ext: path}`
+        """
+        status = None
+        if 'status' in found:
+            status = read_status(found['status'])
+
+        #: `HTTP HEAD` method should return empty string.
+        if method.partition('.')[0] != 'head':
+            for v in self.mimetypes:
+                path = found.get(v['ext'])
+                if path is None:
+                    continue
+
+                sidecars = {}
+                for suffix, encoding in SIDECAR_EXTS.items():
+                    sidecar = found.get(v['ext'] + '.' + suffix)
+                    if sidecar is not None:
+                        sidecars[encoding] = sidecar
+
+                return Descriptor(path, v['ext'], v['mimetype'], status,
+                                  os.path.getsize(path), sidecars)
+
+        if status is None:
+            return None
+
+        return Descriptor(status=status)
+
+    def select(self, endpoint, method, environ):
+        """Return method of variant which request matches, or method.
+
+        :param endpoint: Url rule
+        :param method: Lower cased HTTP method
+        :param environ: WSGI environ
+        """
+        if not self._matchers:
+            return method
+        matcher = self._matchers.get((endpoint, method))
+        if matcher is None:
+            return method
+
+        return matcher.select(environ) or method
+
+    def lookup(self, endpoint, method):
+        """Find descriptor.
+
+        :param endpoint: Url rule
+        :param method: Lower cased HTTP method
+        """
+        return self._index.get((endpoint, method), MISSING)
+
+    def directory(self, endpoint):
+        """Return directory of response files of route.
+
+        :param endpoint: Url rule
+        """
+        segments = endpoint_to_file_name(endpoint).split('/')[:-1]
+
+        return os.path.join(self.data_path, *segments)
+
+    def refresh(self, endpoint, method):
+        """Resolve response file again from data directory.
+
+        Response files may be added, replaced or removed without touching
+        config.json. Return descriptor, or :data:`MISSING` if no files are
+        found.
+
+        :param endpoint: Url rule
+        :param method: Lower cased HTTP method
+        """
+        directory = self.directory(endpoint)
+        prefix = '{0}_{1}.'.format(endpoint_to_file_name(endpoint)
+                                   .split('/')[-1], method)
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            names = []
+
+        found = {}
+        for name in names:
+            if name.startswith(prefix):
+                found[name[len(prefix):]] = os.path.join(directory, name)
+        try:
+            descriptor = self.resolve(method, found)
+        except (IOError, OSError, ValueError):
+            #: Files are removed while they are read.
+            descriptor = None
+
+        if descriptor is None:
+            self._index.pop((endpoint, method), None)
+            return MISSING
+        self._index[(endpoint, method)] = descriptor
+
+        return descriptor
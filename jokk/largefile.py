@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.largefile
+    ~~~~~~~~~~~~~~
+
+    Large response file served without reading it into memory.
+
+    Response files larger than threshold which contain no placeholders are
+    streamed from memory map, or by `wsgi.file_wrapper` and `sendfile`
+    if server supports it. `Range` requests are supported.
+
+    .. code-block:: sh
+
+      $ jokk -c config.json --large-file-size 1048576
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import mmap
+from werkzeug.http import HTTP_STATUS_CODES, http_date, parse_range_header
+from werkzeug.wrappers import Response
+from .response import PreparedResponse, not_modified
+from .template import has_placeholders
+
+#: Default min size of response file served from file.
+DEFAULT_LARGE_FILE_SIZE = 1024 * 1024
+
+#: Bytes per chunk.
+CHUNK_SIZE = 64 * 1024
+
+PARTIAL_CONTENT = '206 {0}'.format(HTTP_STATUS_CODES[206].upper())
+
+
+def is_template_free(path):
+    """Return `True` if file contains no placeholders.
+
+    :param path: Path to file
+    """
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return not has_placeholders(mm)
+    finally:
+        mm.close()
+
+
+class FileIterator(object):
+    """Iterate region of file by chunks from memory map.
+
+    Only pages of current chunk are read, so serving large file doesn't
+    copy whole file into process memory.
+
+    :param path: Path to file
+    :param start: Start offset
+    :param stop: Stop offset
+    :param chunk_size: Bytes per chunk
+    """
+    def __init__(self, path, start, stop, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.start = start
+        self.stop = stop
+        self.chunk_size = chunk_size
+        self._pos = start
+        self._mmap = None
+
+    def __iter__(self):
+        return self
+
+    def open(self):
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._mmap, 'madvise') and \
+                hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        #: File may be truncated after it was indexed.
+        self.stop = min(self.stop, len(self._mmap))
+
+    def __next__(self):
+        if self._mmap is None:
+            if self._pos >= self.stop:
+                raise StopIteration()
+            self.open()
+        if self._pos >= self.stop:
+            self.close()
+            raise StopIteration()
+
+        end = min(self._pos + self.chunk_size, self.stop)
+        chunk = self._mmap[self._pos:end]
+        self._pos = end
+
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._pos = self.stop
+
+
+class FileResponse(PreparedResponse):
+    """Response computed once, which body is read from file per request.
+
+    :param path: Path to response file
+    :param stamp: `(mtime, size)` of response file
+    :param status: Status code or `None`
+    :param mimetype: Mimetype or `None`
+    :param headers: Additional headers such as CORS headers
+    :param etag: Add ETag and support `If-None-Match`
+    """
+    __slots__ = ('path', 'size', 'validator', 'last_modified',
+                 'unsatisfiable')
+
+    def __init__(self, path, stamp, status=None, mimetype=None, headers=(),
+                 etag=False):
+        mtime, size = stamp
+        prepared = PreparedResponse(b'', status, mimetype, headers)
+
+        self.path = path
+        self.size = size
+        self.body = None
+        self.status = prepared.status
+        self.status_code = prepared.status_code
+        #: ETag is made from mtime and size not to hash large file.
+        self.validator = '"{0:x}-{1:x}"'.format(int(mtime * 1000000), size)
+
+        self.headers = [v for v in prepared.headers
+                        if v[0] != 'Content-Length']
+        self.last_modified = http_date(mtime)
+        self.headers.append(('Last-Modified', self.last_modified))
+        self.etag = None
+        if etag:
+            self.etag = self.validator
+            self.headers.append(('ETag', self.etag))
+        if self.status_code == 200:
+            self.headers.append(('Accept-Ranges', 'bytes'))
+
+        self.not_modified_status, self.not_modified_headers = \
+            not_modified(self.headers)
+        self.unsatisfiable = PreparedResponse(
+            b'', 416, None,
+            list(headers) + [('Content-Range', 'bytes */{0}'.format(size))])
+
+    def byte_range(self, environ):
+        """Return `(start, stop)` of requested range.
+
+        `None` means whole file, `False` means range is not satisfiable.
+
+        :param environ: WSGI environ
+        """
+        if self.status_code != 200 or 'HTTP_RANGE' not in environ:
+            return None
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return None
+
+        #: Range is ignored if file is modified since client got it.
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range and if_range not in (self.validator, self.last_modified):
+            return None
+
+        rng = parse_range_header(environ['HTTP_RANGE'])
+        #: Multiple ranges are not supported, send whole file.
+        if rng is None or len(rng.ranges) != 1:
+            return None
+
+        region = rng.range_for_length(self.size)
+        if region is None:
+            return False
+
+        return region
+
+    def wsgi_response(self, environ, body=None):
+        """Return `(status, headers, body iterable)` for WSGI.
+
+        :param environ: WSGI environ
+        :param body: Ignored, body is always read from file
+        """
+        if self.is_not_modified(environ):
+            return self.not_modified_status, self.not_modified_headers, []
+
+        status = self.status
+        headers = self.headers
+        start, stop = 0, self.size
+        region = self.byte_range(environ)
+        if region is False:
+            return self.unsatisfiable.status, self.unsatisfiable.headers, []
+        if region is not None:
+            start, stop = region
+            status = PARTIAL_CONTENT
+            headers = headers + [('Content-Range', 'bytes {0}-{1}/{2}'.format(
+                start, stop - 1, self.size))]
+        headers = headers + [('Content-Length', str(stop - start))]
+
+        if not self.has_body(environ):
+            return status, headers, []
+
+        #: Server such as gunicorn sends whole file by `sendfile`.
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None and start == 0 and stop == self.size:
+            return status, headers, file_wrapper(open(self.path, 'rb'),
+                                                 CHUNK_SIZE)
+
+        return status, headers, FileIterator(self.path, start, stop)
+
+    def make_response(self, environ):
+        """Create Werkzeug response.
+
+        :param environ: WSGI environ
+        """
+        status, headers, body = self.wsgi_response(environ)
+
+        return Response(body, status=status, headers=headers,
+                        direct_passthrough=True)
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.limits
+    ~~~~~~~~~~~
+
+    Rate limits and concurrency caps to emulate capacity of backend.
+
+    Routes defined in `limits` of config.json are limited by token bucket
+    and max number of requests in flight. Requests over the rate get
+    `429 Too Many Requests`, requests over the concurrency get
+    `503 Service Unavailable`, both with `Retry-After`.
+
+    .. code-block:: json
+
+      {
+        "limits": {
+          "/user": {"rate": 100, "burst": 20},
+          "*": {"max_in_flight": 50}
+        }
+      }
+
+    `*` limits all other routes together. Buckets and counters are in
+    shared memory created before forking workers, so limits are global
+    across prefork workers. Requests in flight are counted by worker too,
+    arbiter releases them when worker exits.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import math
+import time
+import zlib
+from multiprocessing import Lock, RawArray
+from .shaping import ShapedBody, is_positive, ANY_ROUTE
+from .response import error_response
+
+#: Max number of limited routes.
+DEFAULT_LIMIT_SLOTS = 64
+
+#: Number of locks shared by slots.
+LOCK_STRIPES = 8
+
+#: Tokens, last refill time, requests in flight and owner of each slot.
+FIELDS = 4
+
+#: Clock shared by processes.
+clock = getattr(time, 'monotonic', time.time)
+
+
+def route_id(route):
+    """Return id of route which is same in every process, `0` is
+    free slot.
+
+    :param route: Route in `limits` config
+    """
+    return (zlib.crc32(route.encode('utf-8')) & 0xffffffff) + 1
+
+
+class LimitState(object):
+    """Token buckets and in-flight counters in shared memory.
+
+    Create it before forking workers and pass to each
+    :class:`jokk.server.Jokk`, slots are shared by processes.
+
+    :param slots: Max number of limited routes
+    :param workers: Number of prefork workers
+    """
+    def __init__(self, slots=DEFAULT_LIMIT_SLOTS, workers=1):
+        self.slots = slots
+        self.workers = workers
+        self.values = RawArray('d', slots * FIELDS)
+        #: Requests in flight of each worker and slot, they are released
+        #: when worker dies while serving them.
+        self.held = RawArray('d', workers * slots)
+        #: Index of worker of this process.
+        self.worker = 0
+        #: Slots share few locks, each request holds one for few
+        #: arithmetic operations.
+        self.locks = [Lock() for _ in range(min(slots, LOCK_STRIPES))]
+        self.assign_lock = Lock()
+
+    def assign(self, routes):
+        """Return dict of route to slot.
+
+        Route keeps its slot across reloads and workers. Slots of routes
+        which are no longer limited are reset and reused only when there
+        are no free slots, so tokens and requests in flight never move to
+        other route.
+
+        :param routes: Routes in `limits` config
+        """
+        if len(routes) > self.slots:
+            raise ValueError('Too many limited routes, max is {0}'.format(
+                self.slots))
+
+        values = self.values
+        owners = dict((route_id(k), k) for k in routes)
+        with self.assign_lock:
+            slots = {}
+            free = []
+            reclaimed = []
+            for slot in range(self.slots):
+                owner = values[slot * FIELDS + 3]
+                if owner in owners:
+                    slots[owners[owner]] = slot
+                elif owner:
+                    reclaimed.append(slot)
+                else:
+                    free.append(slot)
+            free.extend(reclaimed)
+            for k in sorted(routes):
+                if k not in slots:
+                    slots[k] = free.pop(0)
+                    self.reset(slots[k], route_id(k))
+
+        return slots
+
+    def reset(self, slot, owner=0):
+        """Clear slot and give it to owner.
+
+        :param slot: Index of slot
+        :param owner: :func:`route_id` of route
+        """
+        i = slot * FIELDS
+        with self.locks[slot % len(self.locks)]:
+            self.values[i:i + FIELDS] = [0.0, 0.0, 0.0, float(owner)]
+            for worker in range(self.workers):
+                self.held[worker * self.slots + slot] = 0.0
+
+    def acquire(self, slot, rate=None, burst=1, max_in_flight=None,
+                now=None, owner=None):
+        """Take token and in-flight slot.
+
+        Return `None` if admitted, or `(status code, retry after seconds)`.
+
+        :param slot: Index of slot
+        :param rate: Tokens per second, `None` is unlimited
+        :param burst: Max tokens in bucket
+        :param max_in_flight: Max requests in flight, `None` is unlimited
+        :param now: Time of :data:`clock`
+        :param owner: :func:`route_id` of route, requests of route whose
+                      slot is reused by other route are not limited
+        """
+        values = self.values
+        i = slot * FIELDS
+        with self.locks[slot % len(self.locks)]:
+            if owner is not None and values[i + 3] != owner:
+                return None
+            if max_in_flight is not None and values[i + 2] >= max_in_flight:
+                return 503, 1.0
+            if rate is not None:
+                if now is None:
+                    now = clock()
+                tokens = burst
+                #: Refill time is `0` until first request.
+                if values[i + 1]:
+                    refill = (now - values[i + 1]) * rate
+                    tokens = min(burst, values[i] + refill)
+                values[i + 1] = now
+                if tokens < 1:
+                    values[i] = tokens
+                    return 429, (1 - tokens) / rate
+                values[i] = tokens - 1
+            if max_in_flight is not None:
+                values[i + 2] += 1
+                self.held[self.worker * self.slots + slot] += 1
+
+        return None
+
+    def release(self, slot, owner=None):
+        """Release in-flight slot.
+
+        :param slot: Index of slot
+        :param owner: :func:`route_id` of route which acquired slot
+        """
+        values = self.values
+        i = slot * FIELDS
+        with self.locks[slot % len(self.locks)]:
+            if owner is not None and values[i + 3] != owner:
+                return
+            values[i + 2] = max(0.0, values[i + 2] - 1)
+            j = self.worker * self.slots + slot
+            self.held[j] = max(0.0, self.held[j] - 1)
+
+    def release_worker(self, worker):
+        """Release requests in flight of exited worker.
+
+        Worker which is killed while serving requests never releases
+        them, arbiter calls this before forking next worker.
+
+        :param worker: Index of worker
+        """
+        values = self.values
+        held = self.held
+        for slot in range(self.slots):
+            i = slot * FIELDS + 2
+            j = worker * self.slots + slot
+            with self.locks[slot % len(self.locks)]:
+                if held[j]:
+                    values[i] = max(0.0, values[i] - held[j])
+                    held[j] = 0.0
+
+    def in_flight(self, slot):
+        """Return number of requests in flight.
+
+        :param slot: Index of slot
+        """
+        return int(self.values[slot * FIELDS + 2])
+
+
+class Limit(object):
+    """Limits of route.
+
+    :param state: :class:`LimitState`
+    :param slot: Index of slot in state
+    :param rate: Requests per second, `None` is unlimited
+    :param burst: Max requests at once over rate, default is `rate`
+    :param max_in_flight: Max requests in flight, `None` is unlimited
+    :param owner: :func:`route_id` of route which owns slot
+    """
+    options = ('rate', 'burst', 'max_in_flight')
+
+    __slots__ = options + ('state', 'slot', 'owner')
+
+    def __init__(self, state, slot, rate=None, burst=None,
+                 max_in_flight=None, owner=None):
+        if rate is None and max_in_flight is None:
+            raise ValueError('rate or max_in_flight is required')
+        if rate is not None and not is_positive(rate):
+            raise ValueError('rate should be positive number')
+        if burst is None:
+            burst = max(1, rate or 1)
+        if not isinstance(burst, (int, float)) or burst < 1:
+            raise ValueError('burst should be 1 or more')
+        if max_in_flight is not None and (
+                not isinstance(max_in_flight, int) or max_in_flight <= 0):
+            raise ValueError('max_in_flight should be positive integer')
+
+        self.state = state
+        self.slot = slot
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.owner = owner
+
+    @classmethod
+    def from_config(cls, state, slot, options, owner=None):
+        """Create limit from route options in config.json.
+
+        :param state: :class:`LimitState`
+        :param slot: Index of slot in state
+        :param options: Dict of options
+        :param owner: :func:`route_id` of route which owns slot
+        """
+        unknown = set(options) - set(cls.options)
+        if unknown:
+            raise ValueError('Unknown limits options {0}'.format(
+                ', '.join(sorted(unknown))))
+
+        return cls(state, slot, owner=owner, **options)
+
+    def acquire(self, environ, headers):
+        """Return `(status, headers, body iterable)` of rejection, or `None`
+        if request is admitted.
+
+        Token is taken once per request, even if request falls back to
+        Werkzeug or thread and is dispatched again.
+
+        :param environ: WSGI environ
+        :param headers: Headers added to all responses
+        """
+        rate = None if environ.get('jokk.limited') else self.rate
+        rejected = self.state.acquire(self.slot, rate, self.burst,
+                                      self.max_in_flight, owner=self.owner)
+        if rejected is None:
+            environ['jokk.limited'] = True
+            return None
+
+        code, retry_after = rejected
+        retry_after = str(max(1, int(math.ceil(retry_after))))
+
+        return error_response(code, headers + [('Retry-After', retry_after)])
+
+    def release(self):
+        """Release in-flight slot."""
+        if self.max_in_flight is not None:
+            self.state.release(self.slot, self.owner)
+
+    def apply(self, status, headers, body):
+        """Return `(status, headers, body iterable)` which releases
+        in-flight slot when body is closed.
+
+        :param status: Status line
+        :param headers: Headers list
+        :param body: Body iterable
+        """
+        if self.max_in_flight is None:
+            return status, headers, body
+
+        return status, headers, LimitedBody(body, self)
+
+    def apply_response(self, response, environ):
+        """Release in-flight slot when Werkzeug response is closed.
+
+        :param response: Werkzeug response
+        :param environ: WSGI environ
+        """
+        if self.max_in_flight is None:
+            return response
+        #: Werkzeug doesn't send body of these responses.
+        code = response.status_code
+        if environ['REQUEST_METHOD'] == 'HEAD' or code < 200 or \
+                code in (204, 304):
+            self.release()
+            return response
+
+        body = response.response
+        if not isinstance(body, ShapedBody):
+            body = response.iter_encoded()
+        response.response = LimitedBody(body, self)
+        response.direct_passthrough = True
+
+        return response
+
+
+class LimitedBody(ShapedBody):
+    """Body iterable which holds in-flight slot until closed.
+
+    :param iterable: Body iterable, schedule of
+                     :class:`jokk.shaping.ShapedBody` is kept
+    :param limit: :class:`Limit`
+    """
+    def __init__(self, iterable, limit):
+        self.iterable = iterable
+        self.limit = limit
+
+    def schedule(self):
+        if isinstance(self.iterable, ShapedBody):
+            for v in self.iterable.schedule():
+                yield v
+        else:
+            for chunk in self.iterable:
+                yield 0.0, chunk
+
+    def close(self):
+        limit, self.limit = self.limit, None
+        if limit is not None:
+            limit.release()
+        super(LimitedBody, self).close()
+
+
+def parse_limits(config, state):
+    """Create dict of route to :class:`Limit` from `limits` config.
+
+    Slots are assigned by :meth:`LimitState.assign`, so every worker
+    uses same slots and routes keep their slots across reloads.
+
+    :param config: `limits` value of config.json
+    :param state: :class:`LimitState`
+    """
+    if not config:
+        return {}
+    for k in config:
+        if not k.startswith('/') and k != ANY_ROUTE:
+            raise ValueError('Unknown limits route {0}'.format(k))
+
+    limits = {}
+    #: Options are validated before slots are taken.
+    for k, v in config.items():
+        limits[k] = Limit.from_config(state, 0, v)
+    for k, slot in state.assign(list(config)).items():
+        limits[k].slot = slot
+        limits[k].owner = route_id(k)
+
+    return limits
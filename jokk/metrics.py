@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.metrics
+    ~~~~~~~~~~~~
+
+    Prometheus metrics of requests.
+
+    Request counts and latency histograms of each phase are recorded
+    to counters owned by request thread, so requests never wait for lock.
+    Counters of all threads are summed up when metrics are scraped.
+
+    .. code-block:: sh
+
+      $ jokk -c config.json --metrics
+      $ curl http://127.0.0.1:5000/_jokk/metrics
+
+    ========= ===============================================
+    Phase     Description
+    ========= ===============================================
+    dispatch  Whole request in Jokk
+    lookup    Finding cached response file or loading it
+    template  Assigning url vars to response file
+    serialize Building body and headers such as JSONP, gzip
+    ========= ===============================================
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import threading
+from bisect import bisect_left
+from ._compat import timer
+
+#: Upper bounds of latency histogram buckets in seconds.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+#: Route label of requests which matched no routes.
+UNMATCHED = '<unmatched>'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Trace(object):
+    """Timing spans of one request.
+
+    :param method: HTTP method
+    """
+    __slots__ = ('method', 'route', 'status', 'spans', 'started', 'last')
+
+    def __init__(self, method):
+        self.method = method
+        self.route = None
+        self.status = None
+        self.spans = {}
+        self.started = self.last = timer()
+
+    def add(self, phase, seconds):
+        """Add seconds spent in phase.
+
+        :param phase: Name of phase
+        :param seconds: Seconds
+        """
+        self.spans[phase] = self.spans.get(phase, 0.0) + seconds
+
+    def mark(self, phase=None):
+        """Add seconds since last mark to phase.
+
+        :param phase: Name of phase, `None` only starts next phase
+        """
+        now = timer()
+        if phase is not None:
+            self.add(phase, now - self.last)
+        self.last = now
+
+
+class Shard(object):
+    """Counters updated only by owner thread.
+
+    :param thread: Owner thread
+    """
+    __slots__ = ('thread', 'requests', 'histograms', 'in_flight')
+
+    def __init__(self, thread=None):
+        self.thread = thread
+        #: `(route, method, status)` to count.
+        self.requests = {}
+        #: `(route, phase)` to bucket counts followed by sum of seconds.
+        self.histograms = {}
+        self.in_flight = 0
+
+    def merge(self, other):
+        """Add counters of other shard.
+
+        :param other: :class:`Shard`
+        """
+        for k, v in list(other.requests.items()):
+            self.requests[k] = self.requests.get(k, 0) + v
+        for k, v in list(other.histograms.items()):
+            histogram = self.histograms.get(k)
+            if histogram is None:
+                self.histograms[k] = list(v)
+            else:
+                for i, count in enumerate(v):
+                    histogram[i] += count
+        self.in_flight += other.in_flight
+
+
+def escape(value):
+    """Escape label value.
+
+    :param value: Label value
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_labels(labels):
+    """Format labels as `{k="v",...}`.
+
+    :param labels: List of `(name, value)`
+    """
+    if not labels:
+        return ''
+
+    return '{' + ','.join('{0}="{1}"'.format(k, escape(v))
+                          for k, v in labels) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value)
+
+
+class Metrics(object):
+    """Registry of request metrics.
+
+    Collectors are functions which return list of
+    `(name, type, help, [(labels, value), ...])` and are called on scraping.
+
+    :param buckets: Upper bounds of histogram buckets in seconds
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.collectors = []
+        self._local = threading.local()
+        self._shards = []
+        #: Counters of finished threads.
+        self._retired = Shard()
+        self._lock = threading.Lock()
+
+    def shard(self):
+        """Return shard of current thread."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def begin(self):
+        """Count request in flight."""
+        self.shard().in_flight += 1
+
+    def end(self, trace):
+        """Record finished request.
+
+        :param trace: :class:`Trace`
+        """
+        shard = self.shard()
+        shard.in_flight -= 1
+        route = trace.route or UNMATCHED
+        key = (route, trace.method, str(trace.status))
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+
+        histograms = shard.histograms
+        buckets = self.buckets
+        for phase, seconds in trace.spans.items():
+            histogram = histograms.get((route, phase))
+            if histogram is None:
+                histogram = [0] * (len(buckets) + 1) + [0.0]
+                histograms[(route, phase)] = histogram
+            histogram[bisect_left(buckets, seconds)] += 1
+            histogram[-1] += seconds
+
+    def collect(self):
+        """Return :class:`Shard` which sums up all threads."""
+        total = Shard()
+        with self._lock:
+            alive = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    alive.append(shard)
+                else:
+                    #: Thread is finished, its counters never change.
+                    self._retired.merge(shard)
+            self._shards = alive
+            total.merge(self._retired)
+        for shard in alive:
+            total.merge(shard)
+
+        return total
+
+    def families(self, app):
+        """Return metric families of requests and application.
+
+        :param app: :class:`jokk.server.Jokk`
+        """
+        total = self.collect()
+        requests = [((('route', k[0]), ('method', k[1]), ('status', k[2])), v)
+                    for k, v in sorted(total.requests.items())]
+
+        latency = []
+        for (route, phase), histogram in sorted(total.histograms.items()):
+            labels = (('route', route), ('phase', phase))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), histogram):
+                cumulative += count
+                latency.append(('_bucket', labels + (('le', bound),),
+                                cumulative))
+            latency.append(('_sum', labels, histogram[-1]))
+            latency.append(('_count', labels, cumulative))
+
+        cache = app.snapshot.cache.stats()
+        lookups = cache['hits'] + cache['misses']
+        ratio = float(cache['hits']) / lookups if lookups else 0.0
+
+        routing = app.snapshot.router.stats()
+        compression = app.compression_stats.stats()
+        preload = app.preload_report
+
+        families = [
+            ('jokk_requests_total', 'counter',
+             'Requests by route, method and status.', requests),
+            ('jokk_request_phase_seconds', 'histogram',
+             'Latency of request phases by route.', latency),
+            ('jokk_requests_in_flight', 'gauge',
+             'Requests being processed.', [((), total.in_flight)]),
+            ('jokk_cache_hits_total', 'counter',
+             'Response cache hits of current snapshot.',
+             [((), cache['hits'])]),
+            ('jokk_cache_misses_total', 'counter',
+             'Response cache misses of current snapshot.',
+             [((), cache['misses'])]),
+            ('jokk_cache_hit_ratio', 'gauge',
+             'Response cache hit ratio of current snapshot.', [((), ratio)]),
+            ('jokk_cache_evictions_total', 'counter',
+             'Response cache evictions of current snapshot.',
+             [((), cache['evictions'])]),
+            ('jokk_cache_entries', 'gauge',
+             'Cached response files.', [((), cache['entries'])]),
+            ('jokk_cache_bytes', 'gauge',
+             'Bytes of cached response files.', [((), cache['bytes'])]),
+            ('jokk_routing_cache_hits_total', 'counter',
+             'Memoized routing hits of current snapshot.',
+             [((), routing['hits'])]),
+            ('jokk_routing_cache_misses_total', 'counter',
+             'Memoized routing misses of current snapshot.',
+             [((), routing['misses'])]),
+            ('jokk_reloads_total', 'counter',
+             'Reloads of config.json.', [((), app.reload_count)]),
+            ('jokk_last_reload_duration_seconds', 'gauge',
+             'Seconds spent on last reloading.',
+             [((), app.last_reload_duration or 0.0)]),
+            ('jokk_ready', 'gauge',
+             '1 once response files are preloaded.',
+             [((), int(app.ready.is_set()))]),
+            ('jokk_last_preload_duration_seconds', 'gauge',
+             'Seconds spent on last preloading.',
+             [((), preload.seconds if preload is not None else 0.0)]),
+            ('jokk_compressed_responses_total', 'counter',
+             'Compressed responses by encoding.',
+             [((('encoding', k),), v['responses'])
+              for k, v in sorted(compression.items())]),
+            ('jokk_compression_original_bytes_total', 'counter',
+             'Bytes of responses before compression by encoding.',
+             [((('encoding', k),), v['original_bytes'])
+              for k, v in sorted(compression.items())]),
+            ('jokk_compression_compressed_bytes_total', 'counter',
+             'Bytes of compressed responses by encoding.',
+             [((('encoding', k),), v['compressed_bytes'])
+              for k, v in sorted(compression.items())])
+        ]
+        for collector in self.collectors:
+            families.extend(collector())
+
+        return families
+
+    def render(self, app):
+        """Render metrics in Prometheus text format.
+
+        :param app: :class:`jokk.server.Jokk`
+        """
+        lines = []
+        for name, kind, description, samples in self.families(app):
+            lines.append('# HELP {0} {1}'.format(name, description))
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            for sample in samples:
+                if kind == 'histogram':
+                    suffix, labels, value = sample
+                else:
+                    suffix = ''
+                    labels, value = sample
+                lines.append('{0}{1}{2} {3}'.format(
+                    name, suffix, format_labels(labels), format_value(value)))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.preload
+    ~~~~~~~~~~~~
+
+    Warm up response file cache before serving.
+
+    Every indexed response file is read, compiled and prepared with
+    compressed variants by thread pool, so first requests to each route
+    don't pay cold path costs. `/_jokk/ready` returns 200 once warmup is
+    done.
+
+    .. code-block:: sh
+
+      $ jokk -c config.json --threads 16 --preload
+      $ curl http://127.0.0.1:5000/_jokk/ready
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import sys
+import logging
+from multiprocessing.pool import ThreadPool
+from werkzeug.routing import parse_rule
+from ._compat import timer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+#: Default number of threads which load response files.
+DEFAULT_PRELOAD_THREADS = 8
+
+
+def max_rss():
+    """Return max resident set size of process in bytes or `None`."""
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #: Linux reports kilobytes, macOS reports bytes.
+    if sys.platform != 'darwin':
+        rss *= 1024
+
+    return rss
+
+
+def route_params(endpoint):
+    """Return dict which has names of url vars of route as keys.
+
+    :param endpoint: Url rule
+    """
+    return dict((v[2], None) for v in parse_rule(endpoint)
+                if v[0] is not None)
+
+
+class PreloadReport(object):
+    """Result of warmup.
+
+    :param generation: Generation of warmed snapshot
+    :param files: Number of loaded response files
+    :param errors: Number of response files which failed to load
+    :param entries: Number of cached entries after warmup
+    :param nbytes: Bytes of cached entries after warmup
+    :param seconds: Seconds spent on warmup
+    :param rss: Max resident set size of process in bytes or `None`
+    """
+    __slots__ = ('generation', 'files', 'errors', 'entries', 'nbytes',
+                 'seconds', 'rss')
+
+    def __init__(self, generation, files, errors, entries, nbytes, seconds,
+                 rss=None):
+        self.generation = generation
+        self.files = files
+        self.errors = errors
+        self.entries = entries
+        self.nbytes = nbytes
+        self.seconds = seconds
+        self.rss = rss
+
+    def as_dict(self):
+        """Return report as dict."""
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    def __str__(self):
+        message = 'Preloaded {0} response files ({1} bytes cached) ' \
+            'in {2:.3f}s'.format(self.files, self.nbytes, self.seconds)
+        if self.rss is not None:
+            message += ', max RSS {0} bytes'.format(self.rss)
+        if self.errors:
+            message += ', {0} files failed'.format(self.errors)
+
+        return message
+
+
+def warm_up(app, snapshot, threads=DEFAULT_PRELOAD_THREADS):
+    """Load all response files of snapshot into its cache.
+
+    Return :class:`PreloadReport`.
+
+    :param app: :class:`jokk.server.Jokk`
+    :param snapshot: Snapshot to warm up
+    :param threads: Number of threads
+    """
+    started = timer()
+    keys = snapshot.index.keys()
+
+    def warm(key):
+        endpoint, method = key
+        try:
+            app.warm(snapshot, endpoint, method, route_params(endpoint))
+        except Exception:
+            logger.exception('Failed to preload %s %s', method.upper(),
+                             endpoint)
+            return False
+        return True
+
+    if threads > 1 and len(keys) > 1:
+        pool = ThreadPool(min(threads, len(keys)))
+        try:
+            results = pool.map(warm, keys)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [warm(v) for v in keys]
+
+    cache = snapshot.cache
+    report = PreloadReport(snapshot.generation, results.count(True),
+                           results.count(False), len(cache),
+                           cache.total_bytes, timer() - started, max_rss())
+    if report.entries < report.files:
+        logger.warning('Response cache is too small to keep %d files, '
+                       'increase cache size', report.files)
+
+    return report
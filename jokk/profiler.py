@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.profiler
+    ~~~~~~~~~~~~~
+
+    Sampling profiler of requests.
+
+    Random fraction of requests is profiled by cProfile and merged into
+    one stats. Stats are dumped to file by `SIGUSR1` or served at
+    `/_jokk/profile`.
+
+    .. code-block:: sh
+
+      $ jokk -c config.json --threads 16 --profile-sample-rate 0.01
+      $ kill -USR1 <pid>
+      $ python -m pstats jokk-<pid>.prof
+      $ curl http://127.0.0.1:5000/_jokk/profile?sort=tottime&limit=20
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import io
+import os
+import sys
+import signal
+import marshal
+import pstats
+import random
+import logging
+import threading
+
+try:
+    import cProfile as profile
+except ImportError:
+    import profile
+
+logger = logging.getLogger(__name__)
+
+#: Default path of dumped stats, `{pid}` is replaced with process id.
+DEFAULT_OUTPUT = 'jokk-{pid}.prof'
+
+
+class Profiler(object):
+    """Profile sampled requests and merge stats.
+
+    :param sample_rate: Fraction of requests to profile from 0 to 1
+    :param output: Path of dumped stats, `{pid}` is replaced with process id
+    :param rng: `random.Random` to sample requests
+    """
+    def __init__(self, sample_rate, output=DEFAULT_OUTPUT, rng=None):
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate should be from 0 to 1')
+
+        self.sample_rate = sample_rate
+        self.output = output
+        self.rng = rng or random.Random()
+        #: Number of profiled requests.
+        self.sampled = 0
+        self._stats = None
+        self._lock = threading.Lock()
+        #: Whether request is profiled in thread.
+        self._local = threading.local()
+
+    def start(self):
+        """Start profiling if request is sampled, return profile or `None`.
+        """
+        if self.rng.random() >= self.sample_rate:
+            return None
+        #: Requests served concurrently in event loop share one thread,
+        #: skip request while another one is profiled in thread.
+        if getattr(self._local, 'active', False):
+            return None
+
+        return self.enable()
+
+    def enable(self):
+        """Start profiling in current thread, return profile or `None`."""
+        profiler = profile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            #: Only one profiler can be active on some Python versions,
+            #: skip request while another request is profiled.
+            return None
+        self._local.active = True
+
+        return profiler
+
+    def stop(self, profiler, count=True):
+        """Stop profiling and merge stats.
+
+        :param profiler: Profile returned by :meth:`start`
+        :param count: Count profiled request
+        """
+        profiler.disable()
+        self._local.active = False
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profiler)
+            else:
+                self._stats.add(profiler)
+            if count:
+                self.sampled += 1
+
+    def run(self, func, *args):
+        """Call function profiled in current thread.
+
+        Stats are merged into sampled request which is profiled in
+        another thread, such as request of ASGI app served in thread.
+
+        :param func: Function
+        :param args: Arguments of function
+        """
+        profiler = self.enable()
+        try:
+            return func(*args)
+        finally:
+            if profiler is not None:
+                self.stop(profiler, count=False)
+
+    def reset(self):
+        """Clear merged stats."""
+        with self._lock:
+            self._stats = None
+            self.sampled = 0
+
+    def dumps(self):
+        """Return merged stats in pstats file format."""
+        with self._lock:
+            if self._stats is None:
+                return marshal.dumps({})
+            return marshal.dumps(self._stats.stats)
+
+    def dump(self, path=None):
+        """Write merged stats to file and return path.
+
+        :param path: Path to write, default is `output`
+        """
+        path = (path or self.output).format(pid=os.getpid())
+        data = self.dumps()
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return path
+
+    def report(self, sort='cumulative', limit=50):
+        """Return merged stats as text.
+
+        :param sort: Sort key of `pstats.Stats.sort_stats`
+        :param limit: Number of functions
+        """
+        if sort not in pstats.Stats.sort_arg_dict_default:
+            raise ValueError('Unknown sort key {0}'.format(sort))
+
+        stream = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        with self._lock:
+            if self._stats is None:
+                return 'No requests are profiled.\n'
+            stats = pstats.Stats(stream=stream)
+            stats.add(self._stats)
+        stats.sort_stats(sort).print_stats(limit)
+
+        return '{0} requests are profiled.\n{1}'.format(
+            self.sampled, stream.getvalue())
+
+    def install_signal(self, signum=None):
+        """Dump stats when signal is received.
+
+        :param signum: Signal number, default is `SIGUSR1`
+        """
+        if signum is None:
+            signum = getattr(signal, 'SIGUSR1', None)
+            if signum is None:
+                return
+
+        def dump(signum, frame):
+            #: Don't take lock in signal handler.
+            threading.Thread(target=self._dump_in_background).start()
+
+        signal.signal(signum, dump)
+
+    def _dump_in_background(self):
+        try:
+            path = self.dump()
+            logger.warning('Profile of %d requests is dumped to %s',
+                           self.sampled, path)
+        except Exception:
+            logger.exception('Failed to dump profile')
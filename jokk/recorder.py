@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.recorder
+    ~~~~~~~~~~~~~
+
+    Proxy which records upstream responses as response files.
+
+    `jokk record` forwards requests to upstream by pooled keep-alive
+    connections and writes responses to data directory in layout Jokk
+    serves, then adds requested paths to `routes` of config.json.
+
+    .. code-block:: sh
+
+      $ jokk record --upstream http://api.example.com -c config.json
+      $ curl http://127.0.0.1:5000/user/1
+      $ jokk -c config.json
+
+    ================ ==================================
+    Request          Recorded files
+    ================ ==================================
+    GET /user        ./data/user_get.json
+                     ./data/user_get.status
+    POST /user/1     ./data/user/1_post.json
+                     ./data/user/1_post.status
+    ================ ==================================
+
+    Files are written by background thread in batches, so recording
+    doesn't add latency to proxied requests. Query strings are not
+    recorded, last response of each path and method wins. `$` in
+    response bodies is escaped, so placeholders are served as is.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import json
+import socket
+import logging
+import argparse
+import threading
+from werkzeug.urls import url_parse, url_quote
+from .index import endpoint_to_file_name
+from .routing import get_path_info
+from .server import Jokk, is_reserved
+from ._compat import timer
+
+try:
+    from http.client import HTTPConnection, HTTPSConnection, HTTPException
+    from queue import Queue, LifoQueue, Empty, Full
+except ImportError:
+    from httplib import HTTPConnection, HTTPSConnection, HTTPException
+    from Queue import Queue, LifoQueue, Empty, Full
+
+logger = logging.getLogger(__name__)
+
+#: Default max number of idle upstream connections.
+DEFAULT_POOL_SIZE = 16
+
+#: Default seconds to wait upstream.
+DEFAULT_TIMEOUT = 30.0
+
+#: Default seconds between writing batches.
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+#: Headers which are not forwarded.
+HOP_BY_HOP = frozenset([
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade'
+])
+
+#: Methods which are sent again if reused connection is closed.
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+
+#: Headers of upstream response which are not sent back,
+#: Content-Length is computed again.
+NOT_RETURNED = HOP_BY_HOP | frozenset(['content-length'])
+
+
+def find_ext(content_type, mimetypes=Jokk.mimetypes):
+    """Return ext of response file by `Content-Type`, default is `txt`.
+
+    :param content_type: `Content-Type` header value
+    :param mimetypes: List of `{'ext': ..., 'mimetype': ...}`
+    """
+    mimetype = (content_type or '').split(';', 1)[0].strip().lower()
+    for v in mimetypes:
+        if mimetype == v['mimetype']:
+            return v['ext']
+    #: Such as `application/problem+json`.
+    for v in mimetypes:
+        if mimetype.endswith('+' + v['ext']):
+            return v['ext']
+
+    return 'txt'
+
+
+def path_to_route(path):
+    """Return route of requested path or `None` if it can't be recorded.
+
+    Segments with `=` are not recorded, their response files would be
+    read as variants.
+
+    :param path: Decoded path
+    """
+    if is_reserved(path):
+        return None
+
+    segments = path.strip('/').split('/')
+    if segments == ['']:
+        return '/'
+    for v in segments:
+        if v in ('', '.', '..') or any(c in v for c in '<>\\\0:='):
+            return None
+
+    return '/' + '/'.join(segments)
+
+
+class ConnectionPool(object):
+    """Pool of keep-alive connections to upstream.
+
+    :param upstream: Upstream url such as `http://127.0.0.1:8000/api`
+    :param size: Max number of idle connections
+    :param timeout: Seconds to wait upstream
+    """
+    def __init__(self, upstream, size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_TIMEOUT):
+        url = url_parse(upstream)
+        if url.scheme not in ('http', 'https') or not url.host:
+            raise ValueError('Invalid upstream {0}'.format(upstream))
+
+        self.connection_class = HTTPSConnection if url.scheme == 'https' \
+            else HTTPConnection
+        self.host = url.host
+        self.port = url.port
+        self.prefix = url.path.rstrip('/')
+        self.timeout = timeout
+        self._idle = LifoQueue(size)
+
+    def connect(self):
+        """Return new connection."""
+        return self.connection_class(self.host, self.port,
+                                     timeout=self.timeout)
+
+    def request(self, method, url, body=None, headers=None):
+        """Send request, return `(status, reason, headers, body)`.
+
+        Idempotent request is sent again by new connection if reused
+        connection is closed by upstream, other requests may have reached
+        upstream and are never sent twice.
+
+        :param method: HTTP method
+        :param url: Path and query string
+        :param body: Request body bytes
+        :param headers: Dict of request headers
+        """
+        try:
+            conn, reused = self._idle.get_nowait(), True
+        except Empty:
+            conn, reused = self.connect(), False
+
+        while True:
+            try:
+                conn.request(method, self.prefix + url, body, headers or {})
+                res = conn.getresponse()
+                data = res.read()
+                break
+            except (socket.error, HTTPException):
+                conn.close()
+                if not reused or method.upper() not in IDEMPOTENT_METHODS:
+                    raise
+                conn, reused = self.connect(), False
+
+        if res.will_close:
+            conn.close()
+        else:
+            try:
+                self._idle.put_nowait(conn)
+            except Full:
+                conn.close()
+
+        return res.status, res.reason, res.getheaders(), data
+
+    def close(self):
+        """Close idle connections."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
+
+class FixtureWriter(object):
+    """Write recorded responses and routes in background thread.
+
+    :param config_path: Path to config.json, created if not found
+    :param interval: Seconds between writing batches
+    :param mimetypes: List of `{'ext': ..., 'mimetype': ...}`
+    """
+    def __init__(self, config_path, interval=DEFAULT_FLUSH_INTERVAL,
+                 mimetypes=Jokk.mimetypes):
+        self.config_path = config_path
+        self.interval = interval
+        self.mimetypes = mimetypes
+        #: Number of written responses.
+        self.written = 0
+        self.queue = Queue()
+        self._thread = None
+
+    def record(self, route, method, status, content_type, body):
+        """Queue response to write, never blocks.
+
+        :param route: Route of requested path
+        :param method: HTTP method
+        :param status: Status code
+        :param content_type: `Content-Type` header value
+        :param body: Response body bytes
+        """
+        self.queue.put((route, method.lower(), status, content_type, body))
+
+    def start(self):
+        """Start writing in daemon thread."""
+        self._thread = threading.Thread(target=self.run,
+                                        name=self.__class__.__name__)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Write queued responses and stop."""
+        self.queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        stopped = False
+        while not stopped:
+            batch = []
+            deadline = timer() + self.interval
+            while True:
+                try:
+                    item = self.queue.get(
+                        timeout=max(deadline - timer(), 0.001))
+                except Empty:
+                    break
+                if item is None:
+                    stopped = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self.flush(batch)
+                except Exception:
+                    logger.exception('Failed to write recorded responses')
+
+    def read_config(self):
+        """Read config.json or return new config."""
+        if not os.path.exists(self.config_path):
+            return {'data': './data', 'routes': []}
+
+        with open(self.config_path, 'r') as f:
+            return json.loads(f.read())
+
+    def flush(self, batch):
+        """Write responses and add routes to config.json.
+
+        :param batch: List of recorded responses
+        """
+        config = self.read_config()
+        data_path = os.path.join(os.path.dirname(self.config_path),
+                                 config.get('data', './data'))
+
+        latest = {}
+        for route, method, status, content_type, body in batch:
+            latest[(route, method)] = (status, content_type, body)
+        for (route, method), (status, content_type, body) in latest.items():
+            self.write(data_path, route, method, status, content_type, body)
+        self.written += len(latest)
+
+        routes = config.setdefault('routes', [])
+        added = sorted(set(v[0] for v in latest) - set(routes))
+        if added:
+            routes.extend(added)
+            self.write_file(self.config_path,
+                            json.dumps(config, indent=2).encode('utf-8'))
+
+    def write(self, data_path, route, method, status, content_type, body):
+        """Write response file and status file.
+
+        :param data_path: Path to data directory
+        :param route: Route of requested path
+        :param method: Lower cased HTTP method
+        :param status: Status code
+        :param content_type: `Content-Type` header value
+        :param body: Response body bytes
+        """
+        base = os.path.join(data_path, *endpoint_to_file_name(route).split(
+            '/')) + '_' + method
+        directory = os.path.dirname(base)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.write_file(base + '.status', str(status).encode('utf-8'))
+        #: `HTTP HEAD` method is served as empty string.
+        if method == 'head':
+            return
+
+        ext = find_ext(content_type, self.mimetypes)
+        #: Response file of other ext would be preferred.
+        for v in self.mimetypes:
+            if v['ext'] != ext and os.path.exists(base + '.' + v['ext']):
+                os.remove(base + '.' + v['ext'])
+        try:
+            body = body.decode('utf-8').replace('$', '$$').encode('utf-8')
+        except UnicodeDecodeError:
+            pass
+        self.write_file(base + '.' + ext, body)
+
+    def write_file(self, path, data):
+        """Write file at once.
+
+        :param path: Path to file
+        :param data: Bytes
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+class Recorder(object):
+    """WSGI application which proxies and records requests.
+
+    :param pool: :class:`ConnectionPool`
+    :param writer: :class:`FixtureWriter`
+    """
+    def __init__(self, pool, writer):
+        self.pool = pool
+        self.writer = writer
+
+    def forward_headers(self, environ):
+        """Return dict of request headers to upstream.
+
+        Compression is not requested, so response files are plain.
+
+        :param environ: WSGI environ
+        """
+        headers = {}
+        for key, value in environ.items():
+            if key.startswith('HTTP_'):
+                name = key[5:].replace('_', '-').lower()
+            elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+                name = key.replace('_', '-').lower()
+            else:
+                continue
+            if name in HOP_BY_HOP or name in ('host', 'accept-encoding'):
+                continue
+            headers[name.title()] = value
+
+        return headers
+
+    def __call__(self, environ, start_response):
+        method = environ['REQUEST_METHOD']
+        path = get_path_info(environ) or '/'
+        url = url_quote(path, safe="/:@!$&'()*+,;=~")
+        if environ.get('QUERY_STRING'):
+            url += '?' + environ['QUERY_STRING']
+
+        body = None
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        if length:
+            body = environ['wsgi.input'].read(length)
+
+        try:
+            status, reason, headers, data = self.pool.request(
+                method, url, body, self.forward_headers(environ))
+        except (socket.error, HTTPException) as e:
+            logger.warning('Failed to proxy %s %s, %s', method, url, e)
+            data = b'Bad Gateway'
+            start_response('502 Bad Gateway', [
+                ('Content-Type', 'text/plain'),
+                ('Content-Length', str(len(data)))])
+            return [data]
+
+        headers = [(k, v) for k, v in headers
+                   if k.lower() not in NOT_RETURNED]
+        content_type = None
+        encoded = False
+        for k, v in headers:
+            if k.lower() == 'content-type':
+                content_type = v
+            elif k.lower() == 'content-encoding':
+                encoded = True
+
+        route = path_to_route(path)
+        if route is not None and not encoded:
+            self.writer.record(route, method, status, content_type, data)
+
+        headers.append(('Content-Length', str(len(data))))
+        start_response('{0} {1}'.format(status, reason), headers)
+
+        return [data]
+
+
+def parse_option(argv=None):
+    """Parse options of `jokk record`.
+
+    ====================== ========== ==============================
+    Options                Default    Description
+    ====================== ========== ==============================
+    --upstream             None       Upstream url to record
+    -c, --config           None       Config file to write
+    -b, --bind             127.0.0.1  Proxy url
+    -p, --port             5000       Port number
+    --threads              16         Number of threads
+    --pool-size            16         Max idle upstream connections
+    --timeout              30.0       Seconds to wait upstream
+    --flush-interval       1.0        Seconds between writing files
+    ====================== ========== ==============================
+
+    :param argv: Arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog='jokk record',
+        description='Record upstream responses as response files.')
+    parser.add_argument('--upstream', required=True)
+    parser.add_argument('-c', '--config', required=True)
+    parser.add_argument('-b', '--bind', default='127.0.0.1')
+    parser.add_argument('-p', '--port', default=5000, type=int)
+    parser.add_argument('--threads', default=16, type=int)
+    parser.add_argument('--pool-size', default=DEFAULT_POOL_SIZE, type=int)
+    parser.add_argument('--timeout', default=DEFAULT_TIMEOUT, type=float)
+    parser.add_argument('--flush-interval', default=DEFAULT_FLUSH_INTERVAL,
+                        type=float)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Run `jokk record`.
+
+    :param argv: Arguments
+    """
+    from .serving import run_pool
+
+    args = parse_option(argv)
+    pool = ConnectionPool(args.upstream, args.pool_size, args.timeout)
+    writer = FixtureWriter(os.path.abspath(args.config), args.flush_interval)
+    writer.start()
+    try:
+        run_pool(Recorder(pool, writer), args.bind, args.port, args.threads)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.stop()
+        pool.close()
+        sys.stderr.write(' * Recorded {0} responses to {1}\n'.format(
+            writer.written, args.config))
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.response
+    ~~~~~~~~~~~~~
+
+    Prepared response.
+
+    Body bytes, status and headers of static response are computed once
+    per snapshot and shared by requests. Prepared response can be served
+    directly to WSGI `start_response` without Werkzeug response object.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+from werkzeug.http import is_resource_modified, HTTP_STATUS_CODES
+from werkzeug.wrappers import Response
+
+#: Headers which are kept on `304 Not Modified` response.
+NOT_MODIFIED_HEADERS = frozenset(['etag', 'vary', 'content-encoding',
+                                  'access-control-allow-origin',
+                                  'access-control-allow-methods',
+                                  'access-control-allow-headers'])
+
+
+def wsgi_headers(response):
+    """Return headers list which Werkzeug sends for response.
+
+    :param response: Werkzeug response
+    """
+    return response.get_wsgi_headers({}).to_wsgi_list()
+
+
+def not_modified(headers):
+    """Return `(status, headers)` of `304 Not Modified` response.
+
+    :param headers: Headers list of modified response
+    """
+    response = Response(status=304, headers=[
+        v for v in headers if v[0].lower() in NOT_MODIFIED_HEADERS
+    ])
+
+    return response.status, wsgi_headers(response)
+
+
+def error_response(code, headers=()):
+    """Return `(status, headers, body iterable)` of plain text error.
+
+    :param code: Status code
+    :param headers: Headers added to response
+    """
+    reason = HTTP_STATUS_CODES[code]
+    body = reason.encode('utf-8')
+    headers = list(headers) + [('Content-Type', 'text/plain; charset=utf-8'),
+                               ('Content-Length', str(len(body)))]
+
+    return '{0} {1}'.format(code, reason), headers, [body]
+
+
+class PreparedResponse(object):
+    """Response computed once.
+
+    :param body: Response body bytes
+    :param status: Status code or `None`
+    :param mimetype: Mimetype or `None`
+    :param headers: Additional headers such as CORS headers
+    :param etag: Add strong ETag and support `If-None-Match`, or ETag
+                 which is computed from other body
+    """
+    __slots__ = ('body', 'status', 'status_code', 'headers', 'etag',
+                 'not_modified_status', 'not_modified_headers')
+
+    def __init__(self, body, status=None, mimetype=None, headers=(),
+                 etag=False):
+        response = Response(body, mimetype=mimetype)
+        if status is not None:
+            response.status_code = status
+        response.headers.extend(headers)
+        if isinstance(etag, str):
+            response.headers['ETag'] = etag
+        elif etag:
+            response.add_etag()
+
+        self.body = body
+        self.status = response.status
+        self.status_code = response.status_code
+        self.headers = wsgi_headers(response)
+        self.etag = response.headers.get('ETag') if etag else None
+
+        self.not_modified_status, self.not_modified_headers = \
+            not_modified(self.headers)
+
+    def is_not_modified(self, environ):
+        """Return `True` if `If-None-Match` matches ETag.
+
+        :param environ: WSGI environ
+        """
+        if self.etag is None or 'HTTP_IF_NONE_MATCH' not in environ:
+            return False
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return False
+
+        return not is_resource_modified(environ, self.etag)
+
+    def has_body(self, environ):
+        """Return `False` if response body should be empty.
+
+        :param environ: WSGI environ
+        """
+        code = self.status_code
+        if environ['REQUEST_METHOD'] == 'HEAD' or 100 <= code < 200 \
+                or code in (204, 304):
+            return False
+
+        return True
+
+    def make_response(self, environ):
+        """Create Werkzeug response.
+
+        :param environ: WSGI environ
+        """
+        if self.is_not_modified(environ):
+            return Response(status=304, headers=self.not_modified_headers)
+
+        return Response(self.body, status=self.status, headers=self.headers)
+
+    def wsgi_response(self, environ, body=None):
+        """Return `(status, headers, body iterable)` for WSGI.
+
+        :param environ: WSGI environ
+        :param body: Body bytes to replace prepared body
+        """
+        if body is None:
+            if self.is_not_modified(environ):
+                return self.not_modified_status, self.not_modified_headers, []
+            body = self.body
+            headers = self.headers
+        else:
+            length = str(len(body))
+            headers = [(k, length) if k == 'Content-Length' else (k, v)
+                       for k, v in self.headers]
+
+        if not self.has_body(environ):
+            return self.status, headers, []
+
+        return self.status, headers, [body]
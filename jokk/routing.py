@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.routing
+    ~~~~~~~~~~~~
+
+    Routing engine for configs with many routes.
+
+    Routes without url vars are matched by one dict lookup, routes with url
+    vars are matched by walking segment trie, so matching doesn't depend on
+    number of routes. Results are same as Werkzeug `Map` with
+    `strict_slashes=False`, when some paths match several routes, route is
+    chosen by Werkzeug's rule ordering.
+
+    Werkzeug `Map` is built lazily only if it's needed, such as `--show_urls`.
+
+    Both routers memoize results by `(method, path)` in bounded LRU, so
+    repeated requests skip matching. Routers are part of snapshot,
+    so results are discarded when config.json is reloaded.
+
+    Routes which have url vars in part of segment like `/user<id>` or
+    custom converters are not supported, such configs are matched by
+    Werkzeug `Map`.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+import threading
+from collections import OrderedDict
+from werkzeug.exceptions import NotFound
+from werkzeug.routing import Map, ValidationError, PathConverter, \
+    parse_rule, parse_converter_args
+from ._compat import PY2
+
+#: Routing engines.
+TRIE = 'trie'
+WERKZEUG = 'werkzeug'
+ROUTINGS = (TRIE, WERKZEUG)
+
+#: Default number of memoized match results.
+DEFAULT_MATCH_CACHE_SIZE = 4096
+
+#: Max number of bound adapters of Werkzeug map.
+MAX_ADAPTERS = 64
+
+#: Memoized result of path which matches no routes.
+NOT_FOUND = object()
+
+
+class UnsupportedRoute(ValueError):
+    """Route can't be matched by :class:`Router`."""
+
+
+def get_path_info(environ):
+    """Return decoded `PATH_INFO` same as Werkzeug.
+
+    :param environ: WSGI environ
+    """
+    path = environ.get('PATH_INFO', '')
+    if not PY2:
+        path = path.encode('latin-1')
+
+    return path.decode('utf-8', 'replace')
+
+
+def normalize_path(path):
+    """Return path to match, or `None` if no routes match it.
+
+    Leading slashes are merged and one trailing slash is removed
+    as Werkzeug `Map` does.
+
+    :param path: Decoded path
+    """
+    if path:
+        path = '/' + path.lstrip('/')
+    if path.endswith('/'):
+        path = path[:-1]
+        if path.endswith('/'):
+            return None
+
+    return path
+
+
+class BaseRouter(object):
+    """Router which memoizes match results.
+
+    Routes are matched by Werkzeug `Map` of :attr:`url_map`, subclasses
+    replace :meth:`match_environ` to match faster.
+
+    Bound adapters are kept by host, script name and url scheme.
+
+    :param cache_size: Max number of memoized results, `0` disables it
+    """
+    #: Werkzeug `Map` of routes.
+    url_map = None
+
+    def __init__(self, cache_size=DEFAULT_MATCH_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._adapters = {}
+
+    def match(self, environ):
+        """Return `(endpoint, args)`, raise `NotFound` unless matched.
+
+        Returned args are shared by requests, don't modify them.
+
+        :param environ: WSGI environ
+        """
+        if self.cache_size <= 0:
+            return self.match_environ(environ)
+
+        key = (environ.get('REQUEST_METHOD'), environ.get('PATH_INFO', ''))
+        result = self._results.get(key)
+        if result is None:
+            self.misses += 1
+            try:
+                result = self.match_environ(environ)
+            except NotFound:
+                result = NOT_FOUND
+            with self._lock:
+                self._results[key] = result
+                if len(self._results) > self.cache_size:
+                    self._results.popitem(last=False)
+        else:
+            self.hits += 1
+            with self._lock:
+                #: Move to the end (most recently used).
+                if key in self._results:
+                    self._results[key] = self._results.pop(key)
+
+        if result is NOT_FOUND:
+            raise NotFound()
+
+        return result
+
+    def adapter(self, environ):
+        """Return adapter bound to environ.
+
+        :param environ: WSGI environ
+        """
+        key = (environ.get('HTTP_HOST') or environ.get('SERVER_NAME'),
+               environ.get('SCRIPT_NAME', ''), environ.get('wsgi.url_scheme'))
+        adapter = self._adapters.get(key)
+        if adapter is None:
+            adapter = self.url_map.bind_to_environ(environ)
+            if len(self._adapters) >= MAX_ADAPTERS:
+                self._adapters.clear()
+            self._adapters[key] = adapter
+
+        return adapter
+
+    def match_environ(self, environ):
+        """Match WSGI environ without memoized results.
+
+        :param environ: WSGI environ
+        """
+        return self.adapter(environ).match(get_path_info(environ),
+                                           environ.get('REQUEST_METHOD'))
+
+    def stats(self):
+        """Return counters of memoized results as dict."""
+        return {
+            'entries': len(self._results),
+            'max_entries': self.cache_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+class MapRouter(BaseRouter):
+    """Router which matches by Werkzeug `Map`.
+
+    :param url_map: Werkzeug `Map`
+    :param cache_size: Max number of memoized results
+    """
+    def __init__(self, url_map, cache_size=DEFAULT_MATCH_CACHE_SIZE):
+        super(MapRouter, self).__init__(cache_size)
+        self.url_map = url_map
+
+
+class Route(object):
+    """Route with url vars.
+
+    :param endpoint: Endpoint
+    :param names: Names of url vars in order
+    :param key: Sort key, smaller key is preferred
+    """
+    __slots__ = ('endpoint', 'names', 'key')
+
+    def __init__(self, endpoint, names, key):
+        self.endpoint = endpoint
+        self.names = names
+        self.key = key
+
+
+class Node(object):
+    """Node of segment trie."""
+    __slots__ = ('static', 'dynamic', 'routes')
+
+    def __init__(self):
+        #: Segment to child node.
+        self.static = {}
+        #: List of `(spec, converter, matcher, child node)`.
+        self.dynamic = []
+        #: Routes which end at this node.
+        self.routes = []
+
+    def child(self, spec, converter, matcher):
+        for v in self.dynamic:
+            if v[0] == spec:
+                return v[3]
+        node = Node()
+        self.dynamic.append((spec, converter, matcher, node))
+
+        return node
+
+
+class Router(BaseRouter):
+    """Router which matches by dict and segment trie.
+
+    :param routes: Routes, each route is also endpoint
+    :param url_map_factory: Function which returns Werkzeug `Map`
+    :param cache_size: Max number of memoized results
+    """
+    def __init__(self, routes, url_map_factory=None,
+                 cache_size=DEFAULT_MATCH_CACHE_SIZE):
+        super(Router, self).__init__(cache_size)
+        self._url_map = None
+        self.url_map_factory = url_map_factory
+        self.converters = Map.default_converters
+        #: Path to endpoint of routes without url vars.
+        self.static = {}
+        self.root = Node()
+        for i, route in enumerate(routes):
+            self.add(route, i)
+
+    @property
+    def url_map(self):
+        """Werkzeug `Map` of same routes, built on first access."""
+        if self._url_map is None:
+            self._url_map = self.url_map_factory()
+
+        return self._url_map
+
+    def add(self, route, order=0):
+        """Add route.
+
+        :param route: Route
+        :param order: Order of route, former route wins same sort key
+        """
+        if not route.startswith('/'):
+            raise UnsupportedRoute('Route should start with slash')
+
+        items = list(parse_rule(route.rstrip('/')))
+        if all(v[0] is None for v in items):
+            path = ''.join(v[2] for v in items)
+            if path not in self.static:
+                self.static[path] = route
+            return
+
+        #: Sort key is same as Werkzeug's `Rule.match_compare_key()`.
+        static_weights = []
+        argument_weights = []
+        names = []
+        node = self.root
+        static = ''
+        for index, (name, args, variable) in enumerate(items):
+            if name is None:
+                if index > 0 and not variable.startswith('/'):
+                    raise UnsupportedRoute(
+                        'Url var in part of segment {0}'.format(route))
+                for part in variable.split('/'):
+                    if part:
+                        static_weights.append((index, -len(part)))
+                static = variable
+                continue
+
+            if not static.endswith('/'):
+                raise UnsupportedRoute(
+                    'Url var in part of segment {0}'.format(route))
+            for segment in static[1:-1].split('/') if static != '/' else []:
+                node = node.static.setdefault(segment, Node())
+            static = ''
+
+            converter = self.create_converter(route, name, args)
+            argument_weights.append(converter.weight)
+            names.append(variable)
+            node = node.child((name, args), converter,
+                              self.create_matcher(converter))
+
+        if static:
+            for segment in static[1:].split('/'):
+                node = node.static.setdefault(segment, Node())
+
+        key = (-len(static_weights), static_weights, -len(argument_weights),
+               argument_weights, order)
+        node.routes.append(Route(route, names, key))
+
+    def create_converter(self, route, name, args):
+        """Create Werkzeug converter.
+
+        :param route: Route
+        :param name: Converter name
+        :param args: Converter arguments
+        """
+        if name not in self.converters:
+            raise UnsupportedRoute('Unknown converter {0} in {1}'.format(
+                name, route))
+        c_args, c_kwargs = (), {}
+        if args:
+            c_args, c_kwargs = parse_converter_args(args)
+
+        return self.converters[name](None, *c_args, **c_kwargs)
+
+    def create_matcher(self, converter):
+        """Return regex which matches whole segment, `None` for path.
+
+        :param converter: Werkzeug converter
+        """
+        if isinstance(converter, PathConverter):
+            return None
+
+        return re.compile(r'(?:{0})\Z'.format(converter.regex), re.UNICODE)
+
+    def match_path(self, path):
+        """Return `(endpoint, args)`, raise `NotFound` unless matched.
+
+        :param path: Decoded path
+        """
+        path = normalize_path(path)
+        if path is not None:
+            endpoint = self.static.get(path)
+            if endpoint is not None:
+                return endpoint, {}
+
+            best = self.find(self.root, path.split('/')[1:], 0, [], None)
+            if best is not None:
+                route, values = best
+                return route.endpoint, dict(zip(route.names, values))
+
+        raise NotFound()
+
+    def match_environ(self, environ):
+        return self.match_path(get_path_info(environ))
+
+    def find(self, node, segments, index, values, best):
+        """Find preferred route under node.
+
+        :param node: :class:`Node`
+        :param segments: Segments of path
+        :param index: Index of current segment
+        :param values: Converted url vars
+        :param best: `(route, values)` found so far or `None`
+        """
+        if index == len(segments):
+            for route in node.routes:
+                if best is None or route.key < best[0].key:
+                    best = (route, list(values))
+            return best
+
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            best = self.find(child, segments, index + 1, values, best)
+
+        for spec, converter, matcher, child in node.dynamic:
+            if matcher is None:
+                #: Path converter matches one or more segments.
+                if not segment:
+                    continue
+                for stop in range(index + 1, len(segments) + 1):
+                    value = '/'.join(segments[index:stop])
+                    values.append(value)
+                    best = self.find(child, segments, stop, values, best)
+                    values.pop()
+                continue
+
+            if matcher.match(segment) is None:
+                continue
+            try:
+                value = converter.to_python(segment)
+            except ValidationError:
+                continue
+            values.append(value)
+            best = self.find(child, segments, index + 1, values, best)
+            values.pop()
+
+        return best
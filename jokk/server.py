@@ -16,12 +16,41 @@
     :license: BSD, see LICENSE for more details.
 """
 import os
-import re
+import sys
+import atexit
 import argparse
 import json
-from string import Template
+import logging
+import threading
+from werkzeug.exceptions import HTTPException, BadRequest, NotFound
 from werkzeug.wrappers import Request, Response
 from werkzeug.routing import Map, Rule
+from werkzeug.urls import url_decode
+from .cache import ResponseCache, CacheEntry, DEFAULT_CACHE_SIZE, file_stamp
+from .index import DataIndex
+from .bundle import Bundle, BundleIndex, BundleDescriptor, is_bundle
+from .store import Store, StoreDumper, parse_stateful, load_snapshot, \
+    DEFAULT_SNAPSHOT_INTERVAL
+from .watcher import create_watcher, DEFAULT_INTERVAL
+from .template import CompiledTemplate
+from .snapshot import Snapshot
+from .response import PreparedResponse
+from .shaping import ANY_ROUTE
+from .compression import CompressionStats
+from .metrics import Metrics, Trace, CONTENT_TYPE
+from .profiler import Profiler
+from .preload import warm_up, DEFAULT_PRELOAD_THREADS
+from .limits import LimitState, parse_limits
+from .routing import Router, MapRouter, UnsupportedRoute, TRIE, ROUTINGS, \
+    DEFAULT_MATCH_CACHE_SIZE
+from .largefile import FileResponse, DEFAULT_LARGE_FILE_SIZE, \
+    is_template_free
+from ._compat import to_bytes, to_unicode, timer
+
+logger = logging.getLogger(__name__)
+
+#: Paths of Jokk itself such as metrics, never routed to response files.
+RESERVED_PREFIX = '/_jokk/'
 
 
 class Jokk(object):
@@ -32,27 +61,59 @@ class Jokk(object):
         {'ext': 'txt', 'mimetype': 'text/plain'}
     ]
 
-    def __init__(self, config_path):
+    def __init__(self, config_path, cache_size=DEFAULT_CACHE_SIZE,
+                 watch=False, watch_interval=DEFAULT_INTERVAL,
+                 fast_path=True, large_file_size=DEFAULT_LARGE_FILE_SIZE,
+                 metrics=False, profile_sample_rate=0, routing=TRIE,
+                 match_cache_size=DEFAULT_MATCH_CACHE_SIZE, preload=False,
+                 preload_threads=DEFAULT_PRELOAD_THREADS, limit_state=None,
+                 worker_index=None):
         """Read config.json and create routings.
 
-        :param config_path: Path to config.json
+        :param config_path: Path to config.json or bundle packed by
+                            `jokk pack`
+        :param cache_size: Max bytes of response file cache, `0` disables it
+        :param watch: Watch config.json and data directory in background
+        :param watch_interval: Polling interval when inotify is unavailable
+        :param fast_path: Serve responses without Werkzeug request and
+                          response objects if possible
+        :param large_file_size: Response files without placeholders larger
+                                than this are served from file,
+                                `0` disables it
+        :param metrics: Serve Prometheus metrics at `/_jokk/metrics`
+        :param profile_sample_rate: Fraction of requests profiled by cProfile,
+                                    `0` disables profiling
+        :param routing: `trie` or `werkzeug`, `trie` falls back to
+                        `werkzeug` if routes are not supported
+        :param match_cache_size: Max number of memoized routing results,
+                                 `0` disables it
+        :param preload: Load all response files into cache in background,
+                        and on reloading before new snapshot is published
+        :param preload_threads: Number of threads which load response files
+        :param limit_state: :class:`jokk.limits.LimitState` shared by
+                            prefork workers, created on first use if `None`
+        :param worker_index: Index of prefork worker, `None` in single
+                             process
         """
         self.config_path = config_path
-        self.config = config = self.read_config(self.config_path)
-
-        #: Routings are defined in config.json.
-        self.url_map = self.create_url_map(config['routes'])
-
-        #: Served data path's root is same as `config.json` path.
-        #:
-        #: .. code-block:: text
-        #:
-        #:   ├─config.json
-        #:   └─data
-        #:     └─user_get.json
-        data_path = config['data'] if 'data' in config else './data'
-        config_root_path = os.path.dirname(config_path)
-        self.data_path = os.path.join(config_root_path, data_path)
+        #: Bundle is immutable, it's reloaded only by watcher or
+        #: :meth:`reload`, so requests never touch filesystem.
+        self.bundled = is_bundle(config_path)
+        self.cache_size = cache_size
+        self.fast_path = fast_path
+        self.large_file_size = large_file_size
+        if routing not in ROUTINGS:
+            raise ValueError('Unknown routing {0}'.format(routing))
+        self.routing = routing
+        self.match_cache_size = match_cache_size
+        self.preload = preload
+        self.preload_threads = preload_threads
+        self.limit_state = limit_state
+        self.worker_index = worker_index
+        #: Requests in flight are counted by worker, so arbiter can
+        #: release them when worker dies.
+        if limit_state is not None and worker_index is not None:
+            limit_state.worker = worker_index
 
         #: Cache `config.json`'s timestamp for auto-reloading.
         #: If `config.json` is edited after server start,
@@ -61,6 +122,96 @@ class Jokk(object):
         #: So, `config.json` changed, reload `config.json` automatically.
         self._file_timestamp = os.path.getmtime(self.config_path)
 
+        #: Number of reloads and seconds spent on last reloading.
+        self.reload_count = 0
+        self.last_reload_duration = None
+
+        #: Counters of compressed responses.
+        self.compression_stats = CompressionStats()
+
+        #: Request metrics, `None` unless enabled.
+        self.metrics = Metrics() if metrics else None
+
+        #: Sampling profiler, `None` unless enabled.
+        self.profiler = None
+        if profile_sample_rate:
+            self.profiler = Profiler(profile_sample_rate)
+
+        #: Set once response files are preloaded, or on start
+        #: unless preloading is enabled.
+        self.ready = threading.Event()
+        #: :class:`jokk.preload.PreloadReport` of last preloading.
+        self.preload_report = None
+
+        #: Functions called with WSGI environ and
+        #: :class:`jokk.metrics.Trace` before and after dispatching.
+        self.before_dispatch_funcs = []
+        self.after_dispatch_funcs = []
+
+        #: Paths under `/_jokk/` to handlers which return
+        #: `(status, headers, body iterable)`.
+        self.admin_handlers = {RESERVED_PREFIX + 'ready': self.ready_handler}
+        if self.metrics is not None:
+            self.admin_handlers[RESERVED_PREFIX + 'metrics'] = \
+                self.metrics_handler
+        if self.profiler is not None:
+            self.admin_handlers[RESERVED_PREFIX + 'profile'] = \
+                self.profile_handler
+        self._reload_lock = threading.Lock()
+
+        #: Routings, response file index and caches are derived from
+        #: config.json and bundled into one snapshot.
+        self.snapshot = self.create_snapshot(watch=watch)
+        if preload:
+            thread = threading.Thread(target=self._preload_in_background)
+            thread.daemon = True
+            thread.start()
+        else:
+            self.ready.set()
+
+        #: Stateful store is written to file in background.
+        self.store_dumper = None
+        options = parse_stateful(self.config.get('stateful'))
+        if options is not None and options.get('snapshot'):
+            self.store_dumper = StoreDumper(
+                self.create_store_path(options),
+                lambda: self.snapshot.store,
+                options.get('interval', DEFAULT_SNAPSHOT_INTERVAL))
+            self.store_dumper.start()
+
+        #: Watcher reloads config.json and data directory in background,
+        #: so requests don't need to stat `config.json`.
+        self.watcher = None
+        if watch:
+            self.watcher = create_watcher([self.config_path, self.data_path],
+                                          self.reload, watch_interval)
+            self.watcher.start()
+
+    @property
+    def config(self):
+        """Config dict of current snapshot."""
+        return self.snapshot.config
+
+    @property
+    def url_map(self):
+        """Routings of current snapshot."""
+        return self.snapshot.url_map
+
+    @property
+    def data_path(self):
+        """Path to data directory of current snapshot."""
+        return self.snapshot.data_path
+
+    @property
+    def index(self):
+        """Response file index of current snapshot."""
+        return self.snapshot.index
+
+    @property
+    def cache(self):
+        """Response file cache of current snapshot."""
+        return self.snapshot.cache
+
     def read_config(self, path):
         """Read config.json and load to dict.
 
@@ -71,6 +222,16 @@ class Jokk(object):
 
             return json.loads(data)
 
+    def create_data_path(self, config):
+        """Create path to data directory.
+
+        :param config: Config dict
+        """
+        data_path = config['data'] if 'data' in config else './data'
+        config_root_path = os.path.dirname(self.config_path)
+
+        return os.path.join(config_root_path, data_path)
+
     def create_url_map(self, routes):
         """Create url_map.
 
@@ -78,58 +239,759 @@ class Jokk(object):
         """
         rules = []
         for route in routes:
+            if is_reserved(route):
+                continue
             rules.append(Rule(route, endpoint=route, strict_slashes=False))
 
         return Map(rules)
 
+    def create_router(self, routes):
+        """Create router of routes.
+
+        :param routes: Routing dict
+        """
+        for route in routes:
+            if is_reserved(route):
+                logger.warning('Route %s is reserved by Jokk', route)
+        routes = [v for v in routes if not is_reserved(v)]
+
+        if self.routing == TRIE:
+            try:
+                return Router(routes, lambda: self.create_url_map(routes),
+                              self.match_cache_size)
+            except UnsupportedRoute as e:
+                logger.info('Routes are matched by Werkzeug, %s', e)
+
+        return MapRouter(self.create_url_map(routes), self.match_cache_size)
+
+    def create_store_path(self, options):
+        """Create path to snapshot file of stateful store.
+
+        :param options: Options of stateful store
+        """
+        return os.path.join(os.path.dirname(self.config_path),
+                            options['snapshot'])
+
+    def create_store(self, config, index, previous=None):
+        """Create stateful store or `None` unless enabled.
+
+        Items are taken from previous store on reloading, from snapshot
+        file on start if it exists, otherwise seeded from `GET` response
+        files.
+
+        :param config: Config dict
+        :param index: Response file index
+        :param previous: Store of current snapshot
+        """
+        options = parse_stateful(config.get('stateful'))
+        if options is None:
+            return None
+
+        store = Store([v for v in config['routes'] if not is_reserved(v)])
+        if previous is not None:
+            loaded = previous.dump()
+        elif options.get('snapshot'):
+            loaded = load_snapshot(self.create_store_path(options)) or {}
+        else:
+            loaded = {}
+
+        for route in store.collections:
+            items = loaded.get(route)
+            if items is None:
+                items = self.read_seed(index.lookup(route, 'get'),
+                                       config.get('variables'))
+            store.seed(route, items)
+
+        return store
+
+    def read_seed(self, descriptor, variables=None):
+        """Return items of `GET` response file which is JSON array.
+
+        :param descriptor: Resolved response file
+        :param variables: `variables` of config.json
+        """
+        if descriptor.path is None:
+            return []
+
+        body = CompiledTemplate.compile(self.read_response_file(descriptor))
+        if variables is not None:
+            body = body.bind(variables)
+        try:
+            items = json.loads(body.render({}))
+        except ValueError:
+            items = None
+        if not isinstance(items, list) or \
+                not all(isinstance(v, dict) for v in items):
+            logger.warning('%s is not JSON array of objects', descriptor.path)
+            return []
+
+        return items
+
+    def create_index(self, routes, data_path):
+        """Scan data directory and create route to response file index.
+
+        :param routes: Routing dict
+        :param data_path: Path to data directory
+        """
+        return DataIndex(data_path, routes, self.mimetypes)
+
+    def create_snapshot(self, generation=0, watch=None):
+        """Read config.json and create new snapshot.
+
+        :param generation: Number of reloads
+        :param watch: Whether files are watched or not
+        """
+        if watch is None:
+            watch = self.watcher is not None
+
+        bundle = None
+        if self.bundled:
+            bundle = Bundle(self.config_path)
+            config = bundle.config
+        else:
+            config = self.read_config(self.config_path)
+
+        #: Routings are defined in config.json.
+        router = self.create_router(config['routes'])
+
+        #: Served data path's root is same as `config.json` path.
+        #:
+        #: .. code-block:: text
+        #:
+        #:   ├─config.json
+        #:   └─data
+        #:     └─user_get.json
+        #:
+        #: Response files are resolved once on start and config reloading.
+        #: If you add response files, touch `config.json` to rescan them.
+        if bundle is None:
+            data_path = self.create_data_path(config)
+            index = self.create_index(config['routes'], data_path)
+        else:
+            data_path = bundle.path
+            index = BundleIndex(bundle, config['routes'])
+
+        #: Resolved response files are cached and validated by mtime and size.
+        #: When watcher is enabled, files are not validated per request.
+        cache = ResponseCache(self.cache_size, validate=not watch)
+
+        #: Items of stateful store are kept on reloading.
+        previous = getattr(self, 'snapshot', None)
+        store = self.create_store(config, index,
+                                  previous.store if previous else None)
+
+        #: Shared memory of limits is created on first use, or passed by
+        #: arbiter to share it with other workers.
+        if config.get('limits') and self.limit_state is None:
+            self.limit_state = LimitState()
+        limits = parse_limits(config.get('limits'), self.limit_state)
+
+        return Snapshot(generation, config, router, data_path, index, cache,
+                        store, limits, self.worker_index)
+
+    def reload(self):
+        """Reload config.json and rescan data directory.
+
+        New snapshot is built while requests are served by current snapshot,
+        then published at once.
+        """
+        with self._reload_lock:
+            self._reload()
+
+    def _reload(self):
+        started = timer()
+        snapshot = self.create_snapshot(self.snapshot.generation + 1)
+        if self.preload:
+            self.preload_report = warm_up(self, snapshot,
+                                          self.preload_threads)
+            logger.info('%s', self.preload_report)
+        self.snapshot = snapshot
+        #: Data directory may be changed by config.json.
+        if self.watcher is not None:
+            self.watcher.watch([self.config_path, snapshot.data_path])
+        self.reload_count += 1
+        self.last_reload_duration = timer() - started
+
+    def _reload_in_background(self, file_timestamp):
+        try:
+            self._reload()
+            #: Failed reloading is retried by next request.
+            self._file_timestamp = file_timestamp
+        except Exception:
+            logger.exception('Failed to reload %s', self.config_path)
+        finally:
+            self._reload_lock.release()
+
+    def _preload_in_background(self):
+        try:
+            self.preload_report = warm_up(self, self.snapshot,
+                                          self.preload_threads)
+            logger.info('%s', self.preload_report)
+        except Exception:
+            logger.exception('Failed to preload %s', self.data_path)
+        finally:
+            self.ready.set()
+
+    def wait_ready(self, timeout=None):
+        """Block until response files are preloaded.
+
+        Return `True` if ready, `False` on timeout.
+
+        :param timeout: Seconds to wait, `None` waits forever
+        """
+        self.ready.wait(timeout)
+
+        return self.ready.is_set()
+
+    def check_reload(self):
+        """Reload config.json in background if modified.
+
+        Requests are not blocked, they are served by current snapshot
+        until reloading is finished.
+        """
+        if self.bundled:
+            return
+        file_timestamp = os.path.getmtime(self.config_path)
+        if file_timestamp <= self._file_timestamp:
+            return
+        if not self._reload_lock.acquire(False):
+            return
+
+        thread = threading.Thread(target=self._reload_in_background,
+                                  args=(file_timestamp,))
+        thread.daemon = True
+        thread.start()
+
     def dispatch(self, request):
         """Dispatch HTTP requests and create response.
 
         :param request: Werkzeug request
         """
         #: Reload config.json unless config.json modified after server start.
-        file_timestamp = os.path.getmtime(self.config_path)
-        if file_timestamp > self._file_timestamp:
-            config = self.read_config(self.config_path)
-            self.config = config
-            url_map = self.create_url_map(config['routes'])
-            self._file_timestamp = file_timestamp
-        else:
-            config = self.config
+        if self.watcher is None:
+            self.check_reload()
+        snapshot = self.snapshot
+
+        endpoint, args = snapshot.router.match(request.environ)
+
+        trace = request.environ.get('jokk.trace')
+        if trace is not None:
+            trace.route = endpoint
+            trace.mark()
+        limit = self.find_limit(snapshot, endpoint)
+        if limit is None:
+            return self.serve_request(request, snapshot, endpoint, args)
+
+        result = limit.acquire(request.environ, snapshot.headers)
+        if result is not None:
+            status, headers, body = result
+            return Response(body, status=status, headers=headers)
+        try:
+            response = self.serve_request(request, snapshot, endpoint, args)
+        except BaseException:
+            limit.release()
+            raise
+
+        return limit.apply_response(response, request.environ)
+
+    def serve_request(self, request, snapshot, endpoint, args):
+        """Create response of matched route with faults and streaming.
 
-        url_map = self.url_map
-        urls = url_map.bind_to_environ(request.environ)
-        endpoint, args = urls.match()
+        :param request: Werkzeug request
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        :param args: Url vars
+        """
+        trace = request.environ.get('jokk.trace')
+        injection = self.inject_fault(request.environ, snapshot, endpoint)
+        result = None
+        if injection is not None:
+            result = injection.respond(snapshot.headers)
+        if result is None:
+            result = self.respond_store(request.environ, snapshot, endpoint,
+                                        args)
+        if result is not None:
+            status, headers, body = result
+            response = Response(body, status=status, headers=headers)
+        else:
+            response = self.respond(request, snapshot, endpoint, args)
+        if trace is not None:
+            trace.mark('serialize')
+        shape = self.find_shape(snapshot, endpoint)
+        if shape is not None:
+            shape.apply_response(response)
+        if injection is not None:
+            injection.apply_response(response)
 
-        response, status, mimetype = self.create_response(request, args,
-                                                          endpoint)
+        return response
 
-        #: If config.json contains `variables` assign variable to response.
-        if 'variables' in config:
-            template = Template(response)
-            response = template.safe_substitute(**config['variables'])
+    def respond(self, request, snapshot, endpoint, args):
+        """Create response of matched route.
 
-        if 'jsonp' in config and config['jsonp'] is True:
+        :param request: Werkzeug request
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        :param args: Url vars
+        """
+        method = snapshot.index.select(endpoint, request.method.lower(),
+                                       request.environ)
+        entry = self.find_entry(snapshot, endpoint, method, args)
+        trace = request.environ.get('jokk.trace')
+        if trace is not None:
+            trace.mark('lookup')
+        key = (snapshot.data_path, endpoint, method)
+        if isinstance(entry.body, FileResponse):
+            prepared = self.static_response(entry, snapshot, key,
+                                            request.environ, args)
+            return prepared.make_response(request.environ)
+
+        callback = None
+        if snapshot.jsonp:
             callback = request.args.get('callback', False)
-            if callback:
-                response = '{0}({1})'.format(callback, response)
-            else:
-                response = 'function({0})'.format(response)
 
-        response = Response(response, mimetype=mimetype)
+        #: Static response is computed once and served with ETag.
+        if isinstance(entry.body, bytes) and not callback:
+            prepared = self.static_response(entry, snapshot, key,
+                                            request.environ, args)
+            return prepared.make_response(request.environ)
+
+        response = entry.body
+        if not isinstance(response, bytes):
+            response = to_bytes(response.render(args), 'utf-8')
+            if trace is not None:
+                trace.mark('template')
+
+        return self.make_response(snapshot, response, entry.status,
+                                  entry.mimetype, callback,
+                                  request.environ)
+
+    def dispatch_environ(self, environ, cached_only=False):
+        """Dispatch WSGI environ without Werkzeug request and response.
+
+        Return `(status, headers, body iterable)`, or `None` if request
+        needs Werkzeug such as not found.
+
+        :param environ: WSGI environ
+        :param cached_only: Return `None` unless response file is cached,
+                            so files are never read
+        """
+        if self.watcher is None:
+            self.check_reload()
+        snapshot = self.snapshot
+
+        try:
+            endpoint, args = snapshot.router.match(environ)
+        except HTTPException:
+            return None
+
+        trace = environ.get('jokk.trace')
+        if trace is not None:
+            trace.route = endpoint
+            trace.mark()
+        limit = self.find_limit(snapshot, endpoint)
+        if limit is None:
+            return self.serve_environ(environ, snapshot, endpoint, args,
+                                      cached_only)
+
+        result = limit.acquire(environ, snapshot.headers)
+        if result is not None:
+            return result
+        try:
+            result = self.serve_environ(environ, snapshot, endpoint, args,
+                                        cached_only)
+        except BaseException:
+            limit.release()
+            raise
+        if result is None:
+            #: Request is dispatched again by Werkzeug or thread.
+            limit.release()
+            return None
+
+        return limit.apply(*result)
+
+    def serve_environ(self, environ, snapshot, endpoint, args,
+                      cached_only=False):
+        """Return `(status, headers, body iterable)` of matched route with
+        faults and streaming, or `None` if request needs Werkzeug.
+
+        :param environ: WSGI environ
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        :param args: Url vars
+        :param cached_only: Return `None` unless response file is cached
+        """
+        trace = environ.get('jokk.trace')
+        injection = self.inject_fault(environ, snapshot, endpoint)
+        result = None
+        if injection is not None:
+            result = injection.respond(snapshot.headers)
+        if result is None:
+            result = self.respond_store(environ, snapshot, endpoint, args)
+        if result is None:
+            result = self.respond_environ(environ, snapshot, endpoint, args,
+                                          cached_only)
+        if trace is not None:
+            trace.mark('serialize')
+        if result is None:
+            return None
+        shape = self.find_shape(snapshot, endpoint)
+        if shape is not None:
+            result = shape.apply(*result)
+        if injection is not None:
+            result = injection.apply(*result)
+
+        return result
+
+    def respond_store(self, environ, snapshot, endpoint, args):
+        """Return `(status, headers, body iterable)` from stateful store,
+        or `None` if request is served by response files.
+
+        :param environ: WSGI environ
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        :param args: Url vars
+        """
+        if snapshot.store is None:
+            return None
+
+        return snapshot.store.handle(environ, endpoint, args,
+                                     snapshot.headers)
+
+    def respond_environ(self, environ, snapshot, endpoint, args,
+                        cached_only=False):
+        """Return `(status, headers, body iterable)` of matched route.
+
+        :param environ: WSGI environ
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        :param args: Url vars
+        :param cached_only: Return `None` unless response file is cached
+        """
+        method = snapshot.index.select(
+            endpoint, environ['REQUEST_METHOD'].lower(), environ)
+        entry = self.find_entry(snapshot, endpoint, method, args,
+                                not cached_only)
+        trace = environ.get('jokk.trace')
+        if trace is not None:
+            trace.mark('lookup')
+        if entry is None:
+            return None
+
+        body = entry.body
+        key = (snapshot.data_path, endpoint, method)
+        if isinstance(body, FileResponse):
+            prepared = self.static_response(entry, snapshot, key, environ,
+                                            args)
+            return prepared.wsgi_response(environ)
+
+        callback = None
+        if snapshot.jsonp:
+            query_string = environ.get('QUERY_STRING')
+            if query_string:
+                callback = url_decode(query_string).get('callback', False)
+
+        if isinstance(body, bytes) and not callback:
+            prepared = self.static_response(entry, snapshot, key, environ,
+                                            args)
+            return prepared.wsgi_response(environ)
+
+        if not isinstance(body, bytes):
+            body = to_bytes(body.render(args), 'utf-8')
+            if trace is not None:
+                trace.mark('template')
+        body = self.wrap_jsonp(snapshot, body, callback)
+        body, encoding = self.compress_body(snapshot, body, environ)
+
+        key = (entry.status, entry.mimetype, encoding)
+        template = snapshot.templates.get(key)
+        if template is None:
+            headers = snapshot.headers
+            if encoding is not None:
+                headers = headers + [('Content-Encoding', encoding)]
+            template = PreparedResponse(b'', entry.status, entry.mimetype,
+                                        headers)
+            snapshot.templates[key] = template
+
+        return template.wsgi_response(environ, body)
+
+    def find_shape(self, snapshot, endpoint):
+        """Find streaming options of route or `None`.
+
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        """
+        shapes = snapshot.shapes
+        if not shapes:
+            return None
+
+        return shapes.get(endpoint, shapes.get(ANY_ROUTE))
+
+    def find_limit(self, snapshot, endpoint):
+        """Find :class:`jokk.limits.Limit` of route or `None`.
+
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        """
+        limits = snapshot.limits
+        if not limits:
+            return None
+
+        return limits.get(endpoint, limits.get(ANY_ROUTE))
+
+    def inject_fault(self, environ, snapshot, endpoint):
+        """Return :class:`jokk.faults.Injection` of request or `None`.
+
+        Fault is decided once per request and kept in environ, so request
+        which falls back to Werkzeug or thread gets same fault.
+
+        :param environ: WSGI environ
+        :param snapshot: Snapshot
+        :param endpoint: Matched url rule
+        """
+        faults = snapshot.faults
+        if not faults:
+            return None
+        if 'jokk.fault' in environ:
+            return environ['jokk.fault']
+
+        fault = faults.get(endpoint, faults.get(ANY_ROUTE))
+        injection = fault.decide() if fault is not None else None
+        environ['jokk.fault'] = injection
+
+        return injection
+
+    def make_response(self, snapshot, body, status, mimetype, callback=None,
+                      environ=None):
+        """Create Werkzeug response.
+
+        :param snapshot: Snapshot
+        :param body: Response body bytes
+        :param status: Status code or `None`
+        :param mimetype: Mimetype or `None`
+        :param callback: JSONP callback name
+        :param environ: WSGI environ to negotiate compression
+        """
+        body = self.wrap_jsonp(snapshot, body, callback)
+        encoding = None
+        if environ is not None:
+            body, encoding = self.compress_body(snapshot, body, environ)
+
+        response = Response(body, mimetype=mimetype)
         if status is not None:
             response.status_code = status
 
-        if 'cors' in config and config['cors'] is True:
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            response.headers.add('Access-Control-Allow-Methods',
-                                 'GET,PUT,POST,DELETE,PATCH')
-            response.headers.add('Access-Control-Allow-Headers',
-                                 'Content-Type, Authorization')
+        response.headers.extend(snapshot.headers)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
 
         return response
 
-    def create_response(self, request, params, endpoint):
+    def wrap_jsonp(self, snapshot, body, callback=None):
+        """Wrap body by JSONP callback if `jsonp` is enabled.
+
+        :param snapshot: Snapshot
+        :param body: Response body bytes
+        :param callback: JSONP callback name
+        """
+        if not snapshot.jsonp:
+            return body
+        if callback:
+            return to_bytes(callback, 'utf-8') + b'(' + body + b')'
+
+        return b'function(' + body + b')'
+
+    def compress_body(self, snapshot, body, environ):
+        """Compress body per request if it's large enough.
+
+        Return `(body, encoding)`, encoding is `None` if not compressed.
+
+        :param snapshot: Snapshot
+        :param body: Response body bytes
+        :param environ: WSGI environ
+        """
+        compression = snapshot.compression
+        if compression is None or len(body) < compression.min_size:
+            return body, None
+
+        encoding = compression.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None:
+            return body, None
+
+        compressed = compression.compress(body, encoding)
+        self.compression_stats.record(encoding, len(body), len(compressed))
+
+        return compressed, encoding
+
+    def use_etag(self, snapshot, method):
+        """Return `True` if response of method has ETag computed from
+        its body.
+
+        Only GET responses have ETag, HEAD has same ETag as GET.
+
+        :param snapshot: Snapshot
+        :param method: Lower cased HTTP method or method of variant
+        """
+        return snapshot.etag and method.partition('.')[0] == 'get'
+
+    def prepare_response(self, entry, snapshot, etag=False):
+        """Compute static response once and keep it in cache entry.
+
+        :param entry: Cache entry which body is bytes
+        :param snapshot: Snapshot
+        :param etag: Add ETag computed from body
+        """
+        body = self.wrap_jsonp(snapshot, entry.body)
+        prepared = PreparedResponse(body, entry.status, entry.mimetype,
+                                    snapshot.headers, etag)
+        entry.prepared = prepared
+
+        return prepared
+
+    def head_response(self, entry, snapshot, key, environ, params):
+        """Return prepared response of HEAD which has same ETag as GET.
+
+        Validator and `Content-Encoding` of GET response which would be
+        served for `Accept-Encoding` are used, responses are kept in cache
+        entry by ETag.
+
+        :param entry: Cache entry of HEAD
+        :param snapshot: Snapshot
+        :param key: Cache key of entry
+        :param environ: WSGI environ
+        :param params: Url vars
+        """
+        data_path, endpoint, method = key
+        method = 'get' + method[len('head'):]
+        etag = None
+        headers = snapshot.headers
+        get_entry = self.find_entry(snapshot, endpoint, method, params)
+        if isinstance(get_entry.body, (bytes, FileResponse)):
+            get = self.static_response(get_entry, snapshot,
+                                       (data_path, endpoint, method),
+                                       environ, params)
+            etag = get.etag
+            headers = headers + [v for v in get.headers
+                                 if v[0] == 'Content-Encoding']
+
+        prepared = entry.variants.get(etag)
+        if prepared is None:
+            body = self.wrap_jsonp(snapshot, entry.body)
+            prepared = PreparedResponse(body, entry.status, entry.mimetype,
+                                        headers, etag)
+            entry.variants[etag] = prepared
+
+        return prepared
+
+    def static_response(self, entry, snapshot, key, environ, params=None):
+        """Return prepared response of static body for `Accept-Encoding`.
+
+        Compressed responses are computed once and kept in cache entry.
+
+        :param entry: Cache entry which body is bytes or file
+        :param snapshot: Snapshot
+        :param key: Cache key of entry
+        :param environ: WSGI environ
+        :param params: Url vars
+        """
+        if snapshot.etag and key[2].partition('.')[0] == 'head':
+            return self.head_response(entry, snapshot, key, environ,
+                                      params or {})
+        prepared = self.prepared_response(entry, snapshot, key[2])
+        compression = snapshot.compression
+        accept_encoding = environ.get('HTTP_ACCEPT_ENCODING')
+        if compression is None or not accept_encoding:
+            return prepared
+
+        #: JSONP sidecar files don't have callback.
+        sidecars = {} if snapshot.jsonp else entry.sidecars
+        #: Large files are never compressed in memory.
+        encoding = compression.negotiate(
+            accept_encoding, sidecars,
+            not isinstance(prepared, FileResponse))
+        if encoding is None:
+            return prepared
+
+        variant = self.variant_response(entry, snapshot, key, prepared,
+                                        encoding)
+        if variant is False:
+            return prepared
+
+        if not variant.is_not_modified(environ) and variant.has_body(environ):
+            if isinstance(variant, FileResponse):
+                self.compression_stats.record(encoding, prepared.size,
+                                              variant.size)
+            else:
+                self.compression_stats.record(encoding, len(prepared.body),
+                                              len(variant.body))
+
+        return variant
+
+    def prepared_response(self, entry, snapshot, method):
+        """Return prepared response of identity, it's computed once.
+
+        :param entry: Cache entry which body is bytes or file
+        :param snapshot: Snapshot
+        :param method: Lower cased HTTP method or method of variant
+        """
+        if isinstance(entry.body, FileResponse):
+            return entry.body
+        if entry.prepared is not None:
+            return entry.prepared
+
+        return self.prepare_response(entry, snapshot,
+                                     self.use_etag(snapshot, method))
+
+    def variant_response(self, entry, snapshot, key, prepared, encoding):
+        """Return prepared response of content encoding, or `False` if
+        compressed body is not smaller.
+
+        Variant is computed once and kept in cache entry.
+
+        :param entry: Cache entry
+        :param snapshot: Snapshot
+        :param key: Cache key of entry
+        :param prepared: Prepared response of identity
+        :param encoding: Content encoding
+        """
+        variant = entry.variants.get(encoding)
+        if variant is None:
+            variant = self.prepare_variant(entry, snapshot, prepared,
+                                           encoding)
+            entry.variants[encoding] = variant
+            if variant is not False and variant.body is not None:
+                snapshot.cache.add_bytes(key, len(variant.body))
+
+        return variant
+
+    def prepare_variant(self, entry, snapshot, prepared, encoding):
+        """Compute compressed response from sidecar file or by compressing.
+
+        Return `False` if compressed body is not smaller.
+
+        :param entry: Cache entry
+        :param snapshot: Snapshot
+        :param prepared: Prepared response of identity
+        :param encoding: Content encoding
+        """
+        headers = snapshot.headers + [('Content-Encoding', encoding)]
+        sidecar = entry.sidecars.get(encoding)
+        etag = prepared.etag is not None
+        if isinstance(prepared, FileResponse):
+            return FileResponse(sidecar, file_stamp(sidecar), entry.status,
+                                entry.mimetype, headers, etag)
+
+        if sidecar is not None and not snapshot.jsonp:
+            with open(sidecar, 'rb') as f:
+                body = f.read()
+        else:
+            body = snapshot.compression.compress(prepared.body, encoding)
+            if len(body) >= len(prepared.body):
+                return False
+
+        return PreparedResponse(body, entry.status, entry.mimetype, headers,
+                                etag)
+
+    def create_response(self, request, params, endpoint, snapshot=None):
         """Read response file(json,xml,html,txt), status file.
 
         ============== ======================
@@ -143,55 +1005,387 @@ class Jokk(object):
 
         Find response file json, xml, html, txt order.
 
+        Requests are served from cache entries, this returns text of
+        response like before responses are prepared.
+
         :param request: Request object.
         :param params:
         :param endpoint: Base response file name rule.
+        :param snapshot: Snapshot, default is current snapshot
+        """
+        if snapshot is None:
+            snapshot = self.snapshot
+
+        method = snapshot.index.select(endpoint, request.method.lower(),
+                                       request.environ)
+        entry = self.find_entry(snapshot, endpoint, method, params)
+        body = entry.body
+        if isinstance(body, FileResponse):
+            with open(entry.path, 'r') as f:
+                body = f.read()
+        elif isinstance(body, bytes):
+            #: Response file without url vars is pre-encoded bytes.
+            body = to_unicode(body)
+        else:
+            body = body.render(params)
+
+        return body, entry.status, entry.mimetype
+
+    def find_entry(self, snapshot, endpoint, method, params, load=True):
+        """Find cached response file or load it.
+
+        :param snapshot: Snapshot
+        :param endpoint: Base response file name rule
+        :param method: Lower cased HTTP method, method of variant has
+                       conditions such as `get.page=2`
+        :param params: Url vars
+        :param load: Load response file unless cached, otherwise return `None`
+        """
+        key = (snapshot.data_path, endpoint, method)
+        #: Cached entry which is not returned is stale.
+        stale = key in snapshot.cache
+        entry = snapshot.cache.get(key)
+        if entry is not None or not load:
+            return entry
+
+        index = snapshot.index
+        descriptor = index.lookup(endpoint, method)
+        etag = self.use_etag(snapshot, method)
+        if self.bundled:
+            entry = self.create_entry(descriptor, params, snapshot, etag)
+            snapshot.cache.set(key, entry)
+            return entry
+
+        #: Response files may be added or removed without touching
+        #: config.json, so index is not trusted for stale entries.
+        vanished = descriptor.path is not None and \
+            file_stamp(descriptor.path) is None
+        if stale or vanished:
+            descriptor = index.refresh(endpoint, method)
+        try:
+            entry = self.create_entry(descriptor, params, snapshot, etag)
+        except (IOError, OSError):
+            #: Response file is removed while it is read.
+            descriptor = index.refresh(endpoint, method)
+            entry = self.create_entry(descriptor, params, snapshot, etag)
+        if entry.path is None:
+            directory = index.directory(endpoint)
+            entry.stamps = [(directory, file_stamp(directory))]
+        snapshot.cache.set(key, entry)
+
+        return entry
+
+    def create_entry(self, descriptor, params, snapshot, etag=False):
+        """Create cache entry of resolved response file.
+
+        :param descriptor: Resolved response file
+        :param params: Url vars
+        :param snapshot: Snapshot
+        :param etag: Add ETag to response served from file
         """
-        method = request.method.lower()
+        #: `HTTP HEAD` method and missing response file should return
+        #: empty string.
+        if descriptor.path is None:
+            return CacheEntry(None, None, descriptor.status, b'', [])
 
-        file_name = ''
-        #: http://127.0.0.1:5000/ should return `_get.json`.
-        if not endpoint == '/':
-            file_name = re.sub(r'[<|>]', '', endpoint.lstrip('/'))
+        return self.load_response(descriptor, params, snapshot, etag)
 
-        status_path = '{0}/{1}_{2}.{3}'.format(self.data_path, file_name,
-                                               method, 'status')
+    def load_response(self, descriptor, params, snapshot, etag=False):
+        """Read response file and compile it.
 
-        #: If `.status` file exists, read it and set to Response.status_code.
-        #: Otherwise return default status_code.
-        status = None
-        if os.path.exists(status_path):
-            with open(status_path, 'r') as f:
-                status = int(f.read())
+        You can use string.Template variable in response file.
+        Template variable is like `${xxx}`.
+        For example routing is /user/<userid>,
+        you can use ${userid} in response file.
+        See more detail about string.Template.
+        http://docs.python.org/2/library/string.html#template-strings
 
-        #: `HTTP HEAD` method should return empty string.
-        if method == 'head':
-            return '', status, None
+        If config.json contains `variables`, variables are assigned to
+        response file here, url vars are assigned on every request.
 
-        exts = self.mimetypes
-        response = ''
-        mimetype = None
-        for v in exts:
-            file_path = '{0}/{1}_{2}.{3}'.format(self.data_path, file_name,
-                                                 method, v['ext'])
+        Large response file without placeholders is not read here,
+        it is served from file on every request.
 
-            if os.path.exists(file_path) is False:
+        Response file in bundle is read from mapped memory and
+        never validated.
+
+        :param descriptor: Resolved response file
+        :param params: Url vars
+        :param snapshot: Snapshot
+        :param etag: Add ETag to response served from file
+        """
+        if isinstance(descriptor, BundleDescriptor):
+            return self.compile_response(
+                descriptor, self.read_response_file(descriptor), params,
+                snapshot, [], descriptor.size)
+
+        stamp = file_stamp(descriptor.path)
+        if self.is_large_file(descriptor.path, stamp, snapshot):
+            body = FileResponse(descriptor.path, stamp, descriptor.status,
+                                descriptor.mimetype, snapshot.headers,
+                                etag)
+            entry = CacheEntry(descriptor.path, descriptor.mimetype,
+                               descriptor.status, body,
+                               self.file_stamps(descriptor, stamp))
+            entry.sidecars = descriptor.sidecars
+            return entry
+
+        data = self.read_response_file(descriptor)
+
+        return self.compile_response(descriptor, data, params, snapshot,
+                                     self.file_stamps(descriptor, stamp),
+                                     stamp[1])
+
+    def read_response_file(self, descriptor):
+        """Return text of response file.
+
+        :param descriptor: Resolved response file
+        """
+        if isinstance(descriptor, BundleDescriptor):
+            return descriptor.read().decode('utf-8')
+
+        with open(descriptor.path, 'r') as f:
+            return f.read()
+
+    def compile_response(self, descriptor, data, params, snapshot, stamps,
+                         nbytes):
+        """Compile response file text and create cache entry.
+
+        :param descriptor: Resolved response file
+        :param data: Text of response file
+        :param params: Url vars
+        :param snapshot: Snapshot
+        :param stamps: `(path, stamp)` list which entry depends on
+        :param nbytes: Size of response file
+        """
+        body = CompiledTemplate.compile(data)
+        if snapshot.variables is not None:
+            body = body.bind(snapshot.variables, exclude=params)
+        if body.is_static(params):
+            body = body.encode('utf-8')
+
+        entry = CacheEntry(descriptor.path, descriptor.mimetype,
+                           descriptor.status, body, stamps, nbytes)
+        #: Sidecar files are not templates.
+        if isinstance(body, bytes):
+            entry.sidecars = descriptor.sidecars
+
+        return entry
+
+    def warm(self, snapshot, endpoint, method, params):
+        """Load response file into cache and prepare static responses.
+
+        Compressed variants of every encoding Jokk can serve are prepared
+        as well.
+
+        :param snapshot: Snapshot
+        :param endpoint: Url rule
+        :param method: Lower cased HTTP method
+        :param params: Url vars, only names are used
+        """
+        entry = self.find_entry(snapshot, endpoint, method, params)
+        if entry.path is None or not isinstance(entry.body,
+                                                (bytes, FileResponse)):
+            return entry
+        prepared = self.prepared_response(entry, snapshot, method)
+
+        compression = snapshot.compression
+        if compression is None:
+            return entry
+
+        key = (snapshot.data_path, endpoint, method)
+        #: JSONP sidecar files don't have callback.
+        sidecars = {} if snapshot.jsonp else entry.sidecars
+        for encoding in set(compression.encodings) | set(sidecars):
+            #: Large files are never compressed in memory.
+            if isinstance(prepared, FileResponse) and \
+                    encoding not in sidecars:
                 continue
+            self.variant_response(entry, snapshot, key, prepared, encoding)
+
+        return entry
+
+    def file_stamps(self, descriptor, stamp):
+        """Return `(path, stamp)` list of response file, sidecar files and
+        directory of them.
+
+        Directory is modified when response files are added or removed,
+        then entry is stale and response file is resolved again.
+
+        :param descriptor: Resolved response file
+        :param stamp: `(mtime, size)` of response file
+        """
+        directory = os.path.dirname(descriptor.path)
+        stamps = [(descriptor.path, stamp),
+                  (directory, file_stamp(directory))]
+        for path in descriptor.sidecars.values():
+            stamps.append((path, file_stamp(path)))
+
+        return stamps
+
+    def is_large_file(self, path, stamp, snapshot):
+        """Return `True` if response file should be served from file.
+
+        JSONP responses wrap whole body, so they are always read.
+
+        :param path: Path to response file
+        :param stamp: `(mtime, size)` of response file
+        :param snapshot: Snapshot
+        """
+        if not self.large_file_size or snapshot.jsonp or stamp is None:
+            return False
+        if stamp[1] < self.large_file_size:
+            return False
+
+        return is_template_free(path)
+
+    def before_dispatch(self, func):
+        """Register function called before dispatching.
+
+        Function is called with WSGI environ and :class:`jokk.metrics.Trace`,
+        can be used as decorator.
+
+        :param func: Function
+        """
+        self.before_dispatch_funcs.append(func)
+
+        return func
+
+    def after_dispatch(self, func):
+        """Register function called after dispatching.
 
-            with open(file_path, 'r') as f:
-                data = f.read()
-                #: You can use string.Template variable in response file.
-                #: Template variable is like `${xxx}`.
-                #: For example routing is /user/<userid>,
-                #: you can use ${userid} in response file.
-                #: See more detail about string.Template.
-                #: http://docs.python.org/2/library/string.html#template-strings
-                template = Template(data)
-                response = template.safe_substitute(**params)
-                mimetype = v['mimetype']
-                break
-
-        return response, status, mimetype
+        Function is called with WSGI environ and :class:`jokk.metrics.Trace`
+        which has route, status and seconds spent in each phase,
+        can be used as decorator.
+
+        :param func: Function
+        """
+        self.after_dispatch_funcs.append(func)
+
+        return func
+
+    @property
+    def tracing(self):
+        """Whether requests are traced or not."""
+        return self.metrics is not None or self.profiler is not None or \
+            bool(self.before_dispatch_funcs or self.after_dispatch_funcs)
+
+    def begin_trace(self, environ):
+        """Start tracing request if metrics, profiler or hooks are enabled.
+
+        Return :class:`jokk.metrics.Trace` kept in environ, or `None` if
+        request is not traced or already traced by caller.
+        Sampled request is profiled until :meth:`end_trace`, so requests
+        served by WSGI and ASGI are profiled alike.
+
+        :param environ: WSGI environ
+        """
+        if not self.tracing or 'jokk.trace' in environ or \
+                is_reserved(environ.get('PATH_INFO', '')):
+            return None
+
+        trace = Trace(environ['REQUEST_METHOD'])
+        environ['jokk.trace'] = trace
+        if self.metrics is not None:
+            self.metrics.begin()
+        for func in self.before_dispatch_funcs:
+            func(environ, trace)
+        if self.profiler is not None:
+            environ['jokk.profile'] = self.profiler.start()
+
+        return trace
+
+    def end_trace(self, trace, status, environ=None):
+        """Record traced request.
+
+        :param trace: :class:`jokk.metrics.Trace`
+        :param status: Status code or status line
+        :param environ: WSGI environ passed to after dispatch functions
+        """
+        if environ is not None and environ.get('jokk.profile') is not None:
+            self.profiler.stop(environ.pop('jokk.profile'))
+        trace.status = str(status).split(' ', 1)[0]
+        trace.add('dispatch', timer() - trace.started)
+        if self.metrics is not None:
+            self.metrics.end(trace)
+        for func in self.after_dispatch_funcs:
+            func(environ, trace)
+
+    def metrics_handler(self, environ):
+        """Return Prometheus metrics response.
+
+        :param environ: WSGI environ
+        """
+        body = to_bytes(self.metrics.render(self), 'utf-8')
+        headers = [('Content-Type', CONTENT_TYPE),
+                   ('Content-Length', str(len(body)))]
+
+        return '200 OK', headers, [body]
+
+    def ready_handler(self, environ):
+        """Return 200 once response files are preloaded, otherwise 503.
+
+        :param environ: WSGI environ
+        """
+        if not self.ready.is_set():
+            body = b'{"ready": false}'
+            headers = [('Content-Type', 'application/json'),
+                       ('Content-Length', str(len(body))),
+                       ('Retry-After', '1')]
+            return '503 Service Unavailable', headers, [body]
+
+        data = {'ready': True}
+        if self.preload_report is not None:
+            data['preload'] = self.preload_report.as_dict()
+        body = to_bytes(json.dumps(data, sort_keys=True), 'utf-8')
+        headers = [('Content-Type', 'application/json'),
+                   ('Content-Length', str(len(body)))]
+
+        return '200 OK', headers, [body]
+
+    def profile_handler(self, environ):
+        """Return merged profile as text, or pstats file by `format=pstats`.
+
+        `sort` and `limit` select functions of text, `reset` clears
+        profile after response.
+
+        :param environ: WSGI environ
+        """
+        args = url_decode(environ.get('QUERY_STRING', ''))
+        if args.get('format') == 'pstats':
+            body = self.profiler.dumps()
+            content_type = 'application/octet-stream'
+        else:
+            try:
+                limit = int(args.get('limit', 50))
+                report = self.profiler.report(args.get('sort', 'cumulative'),
+                                              limit)
+            except (KeyError, ValueError):
+                raise BadRequest()
+            body = to_bytes(report, 'utf-8')
+            content_type = 'text/plain; charset=utf-8'
+        if args.get('reset'):
+            self.profiler.reset()
+
+        headers = [('Content-Type', content_type),
+                   ('Content-Length', str(len(body)))]
+
+        return '200 OK', headers, [body]
+
+    def admin_app(self, environ, start_response):
+        """Serve paths under `/_jokk/`.
+
+        :param environ: WSGI environ
+        :param start_response: Response
+        """
+        handler = self.admin_handlers.get(environ.get('PATH_INFO'))
+        if handler is None:
+            raise NotFound()
+
+        status, headers, body = handler(environ)
+        start_response(status, headers)
+
+        return body
 
     def wsgi_app(self, environ, start_response):
         """Create WSGI response.
@@ -199,6 +1393,45 @@ class Jokk(object):
         :param environ: Environmen
         :param start_response: Response
         """
+        if is_reserved(environ.get('PATH_INFO', '')):
+            return self.admin_app(environ, start_response)
+
+        trace = self.begin_trace(environ)
+        if trace is None:
+            #: Request profiled by ASGI app falls back to thread,
+            #: profile the thread too.
+            if environ.get('jokk.profile') is not None:
+                return self.profiler.run(self.dispatch_wsgi, environ,
+                                         start_response)
+            return self.dispatch_wsgi(environ, start_response)
+
+        started = [500]
+
+        def traced_start_response(status, headers, exc_info=None):
+            started[0] = status
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.dispatch_wsgi(environ, traced_start_response)
+        except HTTPException as e:
+            started[0] = e.code
+            raise
+        finally:
+            self.end_trace(trace, started[0], environ)
+
+    def dispatch_wsgi(self, environ, start_response):
+        """Create WSGI response by fast path or Werkzeug.
+
+        :param environ: WSGI environ
+        :param start_response: Response
+        """
+        if self.fast_path:
+            result = self.dispatch_environ(environ)
+            if result is not None:
+                status, headers, body = result
+                start_response(status, headers)
+                return body
+
         request = Request(environ)
         response = self.dispatch(request)
 
@@ -214,7 +1447,16 @@ class Jokk(object):
         return self.wsgi_app(environ, start_response)
 
 
-def create_app(config_path):
+def is_reserved(path):
+    """Return `True` if path is reserved by Jokk.
+
+    :param path: Path or route
+    """
+    return path.startswith(RESERVED_PREFIX) or \
+        path == RESERVED_PREFIX.rstrip('/')
+
+
+def create_app(config_path, **options):
     """Create wsgi app.
 
     If you want use another HTTP server, such as Gevent.
@@ -227,8 +1469,9 @@ def create_app(config_path):
     >>> http_server.serve_forever()
 
     :param config_path: Path to config.json
+    :param options: Options passed to :class:`Jokk`
     """
-    app = Jokk(config_path)
+    app = Jokk(config_path, **options)
 
     return app
 
@@ -236,16 +1479,30 @@ def create_app(config_path):
 def parse_option():
     """Parse options.
 
-    =============== ========= ===============
-    Options         Default   Description
-    =============== ========= ===============
-    -b, --bind      127.0.0.1 Mock server url
-    -p, --port      5000      Port number
-    -d, --debug     True      Show tracelog
-    -r, --reloader  False     Auto reloader
-    -s, --show_urls False     Show urls
-    -c, --config    None      Config file
-    =============== ========= ===============
+    ====================== ========== ==============================
+    Options                Default    Description
+    ====================== ========== ==============================
+    -b, --bind             127.0.0.1  Mock server url
+    -p, --port             5000       Port number
+    -d, --debug            True       Show tracelog
+    -r, --reloader         False      Auto reloader
+    -s, --show_urls        False      Show urls
+    -c, --config           None       Config file
+    --cache-size           67108864   Max bytes of response cache
+    -w, --watch            False      Watch files in background
+    --watch-interval       1.0        Polling interval of watcher
+    --asgi                 False      Serve by asyncio ASGI server
+    --workers              1          Number of worker processes
+    --threads              0          Number of threads
+    --backlog              64         Size of accept queue
+    --large-file-size      1048576    Min bytes of file served from file
+    --metrics              False      Serve metrics at /_jokk/metrics
+    --profile-sample-rate  0          Fraction of requests to profile
+    --routing              trie       trie or werkzeug
+    --match-cache-size     4096       Max number of memoized routings
+    --preload              False      Load response files on start
+    --preload-threads      8          Number of threads of preloading
+    ====================== ========== ==============================
 
     """
     description = 'Simple api mock server in Python.'
@@ -256,6 +1513,24 @@ def parse_option():
     parser.add_argument('-r', '--reloader', default=False)
     parser.add_argument('-s', '--show_urls', default=False, nargs='*')
     parser.add_argument('-c', '--config')
+    parser.add_argument('--cache-size', default=DEFAULT_CACHE_SIZE, type=int)
+    parser.add_argument('-w', '--watch', default=False, action='store_true')
+    parser.add_argument('--watch-interval', default=DEFAULT_INTERVAL,
+                        type=float)
+    parser.add_argument('--asgi', default=False, action='store_true')
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--threads', default=0, type=int)
+    parser.add_argument('--backlog', default=64, type=int)
+    parser.add_argument('--large-file-size', default=DEFAULT_LARGE_FILE_SIZE,
+                        type=int)
+    parser.add_argument('--metrics', default=False, action='store_true')
+    parser.add_argument('--profile-sample-rate', default=0, type=float)
+    parser.add_argument('--routing', default=TRIE, choices=ROUTINGS)
+    parser.add_argument('--match-cache-size',
+                        default=DEFAULT_MATCH_CACHE_SIZE, type=int)
+    parser.add_argument('--preload', default=False, action='store_true')
+    parser.add_argument('--preload-threads',
+                        default=DEFAULT_PRELOAD_THREADS, type=int)
 
     args = parser.parse_args()
 
@@ -272,17 +1547,122 @@ def show_urls(app):
         print(v.endpoint)
 
 
+def is_stateful(config_path):
+    """Return `True` if config.json or bundle enables stateful store.
+
+    :param config_path: Path to config.json or bundle
+    """
+    if is_bundle(config_path):
+        config = Bundle(config_path).config
+    else:
+        with open(config_path, 'r') as f:
+            config = json.loads(f.read())
+
+    return parse_stateful(config.get('stateful')) is not None
+
+
+def report_preload(app):
+    """Write preload report to stderr in background once app is ready.
+
+    :param app: Jokk object
+    """
+    def report():
+        app.wait_ready()
+        if app.preload_report is not None:
+            sys.stderr.write(' * {0}\n'.format(app.preload_report))
+
+    thread = threading.Thread(target=report)
+    thread.daemon = True
+    thread.start()
+
+
+def create_server_app(config_path, **options):
+    """Create wsgi app served by `jokk` command.
+
+    Preloading is reported and stateful store is written on exit.
+
+    :param config_path: Path to config.json
+    :param options: Options passed to :class:`Jokk`
+    """
+    app = create_app(config_path, **options)
+    if app.preload:
+        report_preload(app)
+    if app.store_dumper is not None:
+        atexit.register(app.store_dumper.stop)
+
+    return app
+
+
 def main():
     """Main"""
+    #: `jokk bench` runs benchmark.
+    if sys.argv[1:2] == ['bench']:
+        from .bench import main as bench
+        return bench(sys.argv[2:])
+
+    #: `jokk pack` writes bundle.
+    if sys.argv[1:2] == ['pack']:
+        from .bundle import main as pack
+        return pack(sys.argv[2:])
+
+    #: `jokk record` records upstream responses.
+    if sys.argv[1:2] == ['record']:
+        from .recorder import main as record
+        return record(sys.argv[2:])
+
     from werkzeug.serving import run_simple
     args = parse_option()
     if args.config is None:
         return
     config_path = os.path.abspath(args.config)
-    app = create_app(config_path)
+    options = {
+        'cache_size': args.cache_size,
+        'watch': args.watch,
+        'watch_interval': args.watch_interval,
+        'large_file_size': args.large_file_size,
+        'metrics': args.metrics,
+        'profile_sample_rate': args.profile_sample_rate,
+        'routing': args.routing,
+        'match_cache_size': args.match_cache_size,
+        'preload': args.preload,
+        'preload_threads': args.preload_threads
+    }
 
     if args.show_urls is not False:
-        show_urls(app)
+        show_urls(create_app(config_path, **options))
+        return
+
+    #: Each worker loads config.json after fork, limits are shared
+    #: by memory mapped before fork.
+    if args.workers > 1:
+        #: Items of stateful store are kept in each worker.
+        if is_stateful(config_path):
+            sys.stderr.write(' * stateful can not be used with --workers\n')
+            return 1
+        from .serving import run_prefork
+        state = LimitState(workers=args.workers)
+        options['limit_state'] = state
+
+        def create_worker_app(index):
+            return create_server_app(config_path, worker_index=index,
+                                     **options)
+
+        run_prefork(create_worker_app, args.bind, args.port, args.workers,
+                    asgi=args.asgi, threads=args.threads,
+                    backlog=args.backlog, on_exit=state.release_worker)
+        return
+
+    app = create_server_app(config_path, **options)
+    if app.profiler is not None:
+        app.profiler.install_signal()
+    if args.asgi:
+        from .asgi import AsgiJokk, run
+        run(AsgiJokk(app), args.bind, args.port)
+        return
+
+    if args.threads > 0:
+        from .serving import run_pool
+        run_pool(app, args.bind, args.port, args.threads, args.backlog)
         return
 
     run_simple(args.bind, args.port, app, use_debugger=args.debug,
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.serving
+    ~~~~~~~~~~~~
+
+    Thread pool server and multi-process prefork server.
+
+    Thread pool server accepts connections into bounded queue and serves
+    them by fixed number of threads with HTTP/1.1 keep-alive.
+    When queue is full, `503 Service Unavailable` is returned at once.
+
+    .. code-block:: sh
+
+      $ jokk -c config.json --threads 16 --backlog 64
+
+    Arbiter binds one listening socket and forks worker processes which
+    share it. Each worker creates Jokk application after fork and serves
+    requests by Werkzeug server or asyncio ASGI server.
+
+    .. code-block:: sh
+
+      $ jokk -c config.json --workers 4
+
+    Crashed workers are restarted. `SIGTERM` and `SIGINT` shut down workers
+    gracefully, `SIGHUP` makes all workers reload config.json and `SIGUSR1`
+    makes them dump profile.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import time
+import errno
+import signal
+import socket
+import logging
+import threading
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, make_server
+from .faults import AbortConnection, abort_socket
+
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+
+logger = logging.getLogger(__name__)
+
+#: Default number of threads of thread pool server.
+DEFAULT_THREADS = 8
+
+#: Default size of accept queue of thread pool server.
+DEFAULT_BACKLOG = 64
+
+#: Seconds to keep idle connection.
+KEEP_ALIVE_TIMEOUT = 5.0
+
+#: Response sent when accept queue is full.
+SERVICE_UNAVAILABLE = (b'HTTP/1.1 503 Service Unavailable\r\n'
+                       b'Content-Type: text/plain; charset=utf-8\r\n'
+                       b'Content-Length: 19\r\n'
+                       b'Retry-After: 1\r\n'
+                       b'Connection: close\r\n'
+                       b'\r\n'
+                       b'Service Unavailable')
+
+#: Seconds to wait workers on shutdown before killing them.
+GRACEFUL_TIMEOUT = 10.0
+
+#: Workers which exit within this seconds are restarted with delay.
+MIN_WORKER_LIFETIME = 1.0
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """Request handler which keeps HTTP/1.1 connection."""
+    protocol_version = 'HTTP/1.1'
+
+    #: Idle connections are closed after this seconds.
+    timeout = KEEP_ALIVE_TIMEOUT
+
+    #: Headers and body are written separately, don't wait delayed ACK
+    #: of previous segment on kept connection.
+    disable_nagle_algorithm = True
+
+    def connection_dropped(self, error, environ=None):
+        #: Injected fault, connection is reset instead of kept.
+        if isinstance(error, AbortConnection):
+            abort_socket(self.connection)
+            self.close_connection = True
+
+
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    """WSGI server which serves connections by thread pool.
+
+    :param host: Host to bind
+    :param port: Port number
+    :param app: WSGI application
+    :param threads: Number of threads
+    :param backlog: Max connections waiting in accept queue
+    :param handler: Request handler class
+    :param fd: File descriptor of listening socket
+    """
+    multithread = True
+
+    def __init__(self, host, port, app, threads=DEFAULT_THREADS,
+                 backlog=DEFAULT_BACKLOG, handler=None, fd=None):
+        if handler is None:
+            handler = KeepAliveRequestHandler
+        self.request_queue_size = backlog
+        BaseWSGIServer.__init__(self, host, port, app, handler, fd=fd)
+
+        self.threads = threads
+        self.queue = Queue(backlog)
+        self.busy = 0
+        self.handled = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._workers = []
+        for i in range(threads):
+            thread = threading.Thread(target=self.process_queue,
+                                      name='jokk-pool-{0}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+
+        #: Pool counters are exported with request metrics of Jokk.
+        metrics = getattr(app, 'metrics', None)
+        if metrics is not None:
+            metrics.collectors.append(self.collect_metrics)
+
+    def process_request(self, request, client_address):
+        try:
+            self.queue.put_nowait((request, client_address))
+        except Full:
+            self.reject(request)
+
+    def reject(self, request):
+        """Send `503 Service Unavailable` and close connection.
+
+        :param request: Client socket
+        """
+        with self._lock:
+            self.rejected += 1
+        try:
+            request.settimeout(1.0)
+            request.sendall(SERVICE_UNAVAILABLE)
+        except (OSError, socket.error):
+            pass
+        self.shutdown_request(request)
+
+    def process_queue(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            with self._lock:
+                self.busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._lock:
+                    self.busy -= 1
+                    self.handled += 1
+
+    def server_close(self):
+        for _ in self._workers:
+            self.queue.put(None)
+        BaseWSGIServer.server_close(self)
+
+    def stats(self):
+        """Return pool counters as dict."""
+        return {
+            'threads': self.threads,
+            'busy': self.busy,
+            'queue_depth': self.queue.qsize(),
+            'queue_size': self.queue.maxsize,
+            'handled': self.handled,
+            'rejected': self.rejected
+        }
+
+    def collect_metrics(self):
+        """Return pool counters as metric families."""
+        stats = self.stats()
+        families = [
+            ('threads', 'gauge', 'Threads of pool.'),
+            ('busy', 'gauge', 'Threads serving connections.'),
+            ('queue_depth', 'gauge', 'Connections waiting in accept queue.'),
+            ('queue_size', 'gauge', 'Max connections of accept queue.'),
+            ('handled', 'counter', 'Connections served by pool.'),
+            ('rejected', 'counter', 'Connections rejected by full queue.')
+        ]
+
+        return [('jokk_pool_' + k + ('_total' if kind == 'counter' else ''),
+                 kind, description, [((), stats[k])])
+                for k, kind, description in families]
+
+
+def create_server(host, port, app, threads=0, backlog=DEFAULT_BACKLOG,
+                  fd=None):
+    """Create thread pool server, or single thread Werkzeug server.
+
+    :param host: Host to bind
+    :param port: Port number
+    :param app: WSGI application
+    :param threads: Number of threads, `0` serves requests in one thread
+    :param backlog: Max connections waiting in accept queue
+    :param fd: File descriptor of listening socket
+    """
+    if threads > 0:
+        return ThreadPoolWSGIServer(host, port, app, threads, backlog, fd=fd)
+
+    return make_server(host, port, app, fd=fd)
+
+
+def create_socket(host, port, backlog=128):
+    """Create listening socket shared by workers.
+
+    :param host: Host to bind
+    :param port: Port number
+    :param backlog: Listen backlog
+    """
+    info = socket.getaddrinfo(host, port, socket.AF_UNSPEC,
+                              socket.SOCK_STREAM)[0]
+    sock = socket.socket(info[0], socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(info[4])
+    sock.listen(backlog)
+    if hasattr(sock, 'set_inheritable'):
+        sock.set_inheritable(True)
+
+    return sock
+
+
+def serve_wsgi(app, sock, host, threads=0, backlog=DEFAULT_BACKLOG):
+    """Serve WSGI application on listening socket until `SIGTERM`.
+
+    :param app: WSGI application
+    :param sock: Listening socket
+    :param host: Host of socket
+    :param threads: Number of threads
+    :param backlog: Max connections waiting in accept queue
+    """
+    server = create_server(host, 0, app, threads, backlog, sock.fileno())
+
+    def shutdown(signum, frame):
+        #: `shutdown()` waits until `serve_forever()` is finished,
+        #: so call it from another thread.
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    server.serve_forever()
+
+
+def serve_asgi(app, sock):
+    """Serve ASGI application on listening socket until `SIGTERM`.
+
+    :param app: ASGI application
+    :param sock: Listening socket
+    """
+    import asyncio
+    from .asgi import start_server
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server = loop.run_until_complete(start_server(app, None, None, sock))
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+
+class Arbiter(object):
+    """Fork and watch worker processes.
+
+    :param sock: Listening socket
+    :param worker: Function called with listening socket and index of
+                   worker in worker process
+    :param workers: Number of worker processes
+    :param graceful_timeout: Seconds to wait workers on shutdown
+    :param on_exit: Function called with index of exited worker before
+                    next worker is forked
+    """
+    def __init__(self, sock, worker, workers=2,
+                 graceful_timeout=GRACEFUL_TIMEOUT, on_exit=None):
+        self.sock = sock
+        self.worker = worker
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.on_exit = on_exit
+        #: Pid to started time.
+        self.pids = {}
+        #: Pid to index of worker, exited worker's index is reused.
+        self.indexes = {}
+        self.alive = True
+        self._reload = False
+        self._dump = False
+
+    def run(self):
+        """Run workers until `SIGTERM` or `SIGINT`."""
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('Prefork workers require os.fork()')
+
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, self.handle_dump)
+        try:
+            while self.alive:
+                self.reap_workers()
+                if self._reload:
+                    self._reload = False
+                    self.kill_workers(signal.SIGHUP)
+                if self._dump:
+                    self._dump = False
+                    self.kill_workers(signal.SIGUSR1)
+                self.spawn_workers()
+                time.sleep(0.1)
+        finally:
+            self.stop()
+
+    def handle_stop(self, signum, frame):
+        self.alive = False
+
+    def handle_reload(self, signum, frame):
+        self._reload = True
+
+    def handle_dump(self, signum, frame):
+        self._dump = True
+
+    def spawn_workers(self):
+        while self.alive and len(self.pids) < self.workers:
+            self.spawn_worker()
+
+    def spawn_worker(self):
+        index = min(set(range(self.workers)) - set(self.indexes.values()))
+        pid = os.fork()
+        if pid != 0:
+            self.pids[pid] = time.time()
+            self.indexes[pid] = index
+            return pid
+
+        #: In worker process.
+        status = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            #: Worker installs its own handler to reload config.json.
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            if hasattr(signal, 'SIGUSR1'):
+                #: Worker installs its own handler to dump profile.
+                signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+            self.worker(self.sock, index)
+        except SystemExit as e:
+            status = e.code or 0
+        except BaseException:
+            logger.exception('Worker %d failed', os.getpid())
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def reap_workers(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except OSError as e:
+                if e.errno == errno.ECHILD:
+                    return
+                raise
+            if pid == 0:
+                return
+            started = self.pids.pop(pid, None)
+            index = self.indexes.pop(pid, None)
+            if index is not None and self.on_exit is not None:
+                self.on_exit(index)
+            if started is None or not self.alive:
+                continue
+            logger.warning('Worker %d exited with %d, restarting', pid,
+                           status)
+            #: Don't fork endlessly if workers fail on start.
+            if time.time() - started < MIN_WORKER_LIFETIME:
+                time.sleep(MIN_WORKER_LIFETIME)
+
+    def kill_workers(self, signum):
+        for pid in list(self.pids):
+            try:
+                os.kill(pid, signum)
+            except OSError as e:
+                if e.errno == errno.ESRCH:
+                    self.pids.pop(pid, None)
+
+    def stop(self):
+        """Stop workers gracefully, kill them after timeout."""
+        self.alive = False
+        self.kill_workers(signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while self.pids and time.time() < deadline:
+            self.reap_workers()
+            time.sleep(0.05)
+        self.kill_workers(signal.SIGKILL)
+        self.reap_workers()
+
+
+def run_prefork(app_factory, host, port, workers, asgi=False, threads=0,
+                backlog=DEFAULT_BACKLOG, on_exit=None):
+    """Serve Jokk by prefork workers.
+
+    :param app_factory: Function which returns :class:`jokk.server.Jokk`,
+                        called with index of worker once in each worker
+                        after fork
+    :param host: Host to bind
+    :param port: Port number
+    :param workers: Number of worker processes
+    :param asgi: Serve by asyncio ASGI server
+    :param threads: Number of threads in each worker
+    :param backlog: Max connections waiting in accept queue of each worker
+    :param on_exit: Function called with index of exited worker in
+                    arbiter process
+    """
+    sock = create_socket(host, port, max(backlog, 128))
+
+    def worker(sock, index):
+        app = app_factory(index)
+
+        def reload(signum, frame):
+            threading.Thread(target=app.reload).start()
+
+        signal.signal(signal.SIGHUP, reload)
+        if getattr(app, 'profiler', None) is not None:
+            app.profiler.install_signal()
+        if asgi:
+            from .asgi import AsgiJokk
+            serve_asgi(AsgiJokk(app), sock)
+        else:
+            serve_wsgi(app, sock, host, threads, backlog)
+
+    sys.stderr.write(' * Running on http://{0}:{1}/ with {2} workers '
+                     '(Press CTRL+C to quit)\n'.format(
+                         host, sock.getsockname()[1], workers))
+    Arbiter(sock, worker, workers, on_exit=on_exit).run()
+
+
+def run_pool(app, host, port, threads, backlog=DEFAULT_BACKLOG):
+    """Serve WSGI application by thread pool server.
+
+    :param app: WSGI application
+    :param host: Host to bind
+    :param port: Port number
+    :param threads: Number of threads
+    :param backlog: Max connections waiting in accept queue
+    """
+    server = ThreadPoolWSGIServer(host, port, app, threads, backlog)
+    sys.stderr.write(' * Running on http://{0}:{1}/ with {2} threads '
+                     '(Press CTRL+C to quit)\n'.format(host, server.port,
+                                                       threads))
+    server.serve_forever()
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.shaping
+    ~~~~~~~~~~~~
+
+    Streaming and throughput shaping of responses.
+
+    Routes defined in `streaming` of config.json send response body by
+    chunks with time to first byte, bytes per second and jitter, so Jokk
+    can behave like slow or streaming backend.
+
+    .. code-block:: json
+
+      {
+        "streaming": {
+          "/download": {"chunk_size": 1024, "rate": 10240},
+          "*": {"first_byte": {"distribution": "uniform",
+                               "min": 0.1, "max": 0.3}}
+        }
+      }
+
+    WSGI servers get generator which sleeps between chunks, asyncio server
+    sleeps in event loop, so slow responses don't occupy threads.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import time
+import random
+import bisect
+from ._compat import timer
+
+#: Default bytes per chunk.
+DEFAULT_CHUNK_SIZE = 8192
+
+#: Route key which matches all routes.
+ANY_ROUTE = '*'
+
+
+class Delay(object):
+    """Random delay in seconds.
+
+    ============ ======================= ================================
+    distribution Parameters              Delay
+    ============ ======================= ================================
+    fixed        seconds                 Always `seconds`
+    uniform      min, max                Between `min` and `max`
+    normal       mean, stddev            Gaussian, negative is 0
+    exponential  mean                    Exponential with mean `mean`
+    histogram    buckets                 Replayed from histogram
+    ============ ======================= ================================
+
+    Buckets of histogram are `[upper bound seconds, count]` sorted by
+    upper bound, delay is uniform within bucket chosen by count.
+
+    :param distribution: Name of distribution
+    :param params: Parameters of distribution
+    """
+    distributions = {
+        'fixed': ('seconds',),
+        'uniform': ('min', 'max'),
+        'normal': ('mean', 'stddev'),
+        'exponential': ('mean',),
+        'histogram': ('buckets',)
+    }
+
+    __slots__ = ('distribution', 'params', 'table')
+
+    def __init__(self, distribution='fixed', **params):
+        if distribution not in self.distributions:
+            raise ValueError('Unknown distribution {0}'.format(distribution))
+        names = self.distributions[distribution]
+        if sorted(params) != sorted(names):
+            raise ValueError('{0} distribution requires {1}'.format(
+                distribution, ', '.join(names)))
+        self.table = None
+        if distribution == 'histogram':
+            self.table = parse_buckets(params['buckets'])
+        else:
+            for k, v in params.items():
+                if not isinstance(v, (int, float)) or v < 0:
+                    raise ValueError(
+                        '{0} should be positive number'.format(k))
+
+        self.distribution = distribution
+        self.params = params
+
+    @classmethod
+    def from_config(cls, value):
+        """Create delay from number of seconds or dict.
+
+        :param value: Seconds or `{"distribution": ..., params}`
+        """
+        if isinstance(value, dict):
+            params = dict(value)
+            return cls(params.pop('distribution', 'fixed'), **params)
+
+        return cls('fixed', seconds=value)
+
+    def sample(self, rng=random):
+        """Return delay in seconds.
+
+        :param rng: `random.Random` instance
+        """
+        params = self.params
+        if self.distribution == 'fixed':
+            return params['seconds']
+        if self.distribution == 'uniform':
+            return rng.uniform(params['min'], params['max'])
+        if self.distribution == 'normal':
+            return max(0.0, rng.gauss(params['mean'], params['stddev']))
+        if self.distribution == 'histogram':
+            bounds, totals = self.table
+            i = bisect.bisect_right(totals, rng.random() * totals[-1])
+            i = min(i, len(bounds) - 1)
+            return rng.uniform(bounds[i - 1] if i > 0 else 0.0, bounds[i])
+        if params['mean'] == 0:
+            return 0.0
+
+        return rng.expovariate(1.0 / params['mean'])
+
+
+def is_positive(value):
+    """Return `True` if value is positive number.
+
+    :param value: Value of config.json
+    """
+    return isinstance(value, (int, float)) and value > 0
+
+
+def parse_buckets(buckets):
+    """Return `(upper bounds, cumulative counts)` of histogram.
+
+    :param buckets: List of `[upper bound seconds, count]`
+    """
+    bounds = []
+    totals = []
+    total = 0
+    for v in buckets if isinstance(buckets, list) else [None]:
+        if not isinstance(v, list) or len(v) != 2 or \
+                not all(isinstance(n, (int, float)) and n >= 0 for n in v):
+            raise ValueError('buckets should be [seconds, count] pairs')
+        if bounds and v[0] <= bounds[-1]:
+            raise ValueError('buckets should be sorted by seconds')
+        total += v[1]
+        bounds.append(v[0])
+        totals.append(total)
+    if total <= 0:
+        raise ValueError('buckets should have positive count')
+
+    return bounds, totals
+
+
+def rechunk(iterable, chunk_size):
+    """Yield bytes of `chunk_size` from iterable of bytes.
+
+    :param iterable: Iterable of bytes
+    :param chunk_size: Bytes per chunk
+    """
+    buf = bytearray()
+    for data in iterable:
+        buf.extend(data)
+        while len(buf) >= chunk_size:
+            yield bytes(buf[:chunk_size])
+            del buf[:chunk_size]
+    if buf:
+        yield bytes(buf)
+
+
+class Shape(object):
+    """Streaming options of route.
+
+    :param chunk_size: Bytes per chunk
+    :param rate: Bytes per second, `None` is unlimited
+    :param first_byte: :class:`Delay` before first chunk
+    :param jitter: :class:`Delay` added between chunks
+    :param chunked: Remove `Content-Length` so body is sent chunked
+    """
+    options = ('chunk_size', 'rate', 'first_byte', 'jitter', 'chunked')
+
+    __slots__ = options
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, rate=None,
+                 first_byte=None, jitter=None, chunked=False):
+        if not isinstance(chunk_size, int) or chunk_size <= 0:
+            raise ValueError('chunk_size should be positive integer')
+        if rate is not None and not is_positive(rate):
+            raise ValueError('rate should be positive number')
+
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.first_byte = first_byte
+        self.jitter = jitter
+        self.chunked = chunked is True
+
+    @classmethod
+    def from_config(cls, options):
+        """Create shape from route options in config.json.
+
+        :param options: Dict of options
+        """
+        unknown = set(options) - set(cls.options)
+        if unknown:
+            raise ValueError('Unknown streaming options {0}'.format(
+                ', '.join(sorted(unknown))))
+        options = dict(options)
+        for k in ('first_byte', 'jitter'):
+            if options.get(k) is not None:
+                options[k] = Delay.from_config(options[k])
+
+        return cls(**options)
+
+    def apply(self, status, headers, body, rng=random):
+        """Return `(status, headers, body iterable)` shaped.
+
+        :param status: Status line
+        :param headers: Headers list
+        :param body: Body iterable
+        :param rng: `random.Random` instance
+        """
+        if self.chunked:
+            headers = [v for v in headers if v[0].lower() != 'content-length']
+
+        return status, headers, ShapedBody(body, self, rng)
+
+    def apply_response(self, response, rng=random):
+        """Shape Werkzeug response in place.
+
+        :param response: Werkzeug response
+        :param rng: `random.Random` instance
+        """
+        if self.chunked:
+            response.headers.pop('Content-Length', None)
+        response.response = ShapedBody(response.iter_encoded(), self, rng)
+        response.direct_passthrough = True
+
+        return response
+
+
+class ShapedBody(object):
+    """Body iterable which is sent by :class:`Shape`.
+
+    :param iterable: Body iterable
+    :param shape: :class:`Shape`
+    :param rng: `random.Random` instance
+    """
+    def __init__(self, iterable, shape, rng=random):
+        self.iterable = iterable
+        self.shape = shape
+        self.rng = rng
+
+    def schedule(self):
+        """Yield `(delay, chunk)`, sleep `delay` seconds before sending.
+
+        Chunk is `None` if nothing is sent after delay.
+        """
+        shape = self.shape
+        delay = 0.0
+        if shape.first_byte is not None:
+            delay = shape.first_byte.sample(self.rng)
+        #: Chunks are paced from first byte, so time spent on sending
+        #: is not added to delay.
+        started = timer() + delay
+        sent = 0
+        for chunk in rechunk(self.iterable, shape.chunk_size):
+            if sent:
+                delay = 0.0
+                if shape.rate is not None:
+                    due = started + float(sent) / shape.rate
+                    delay = max(0.0, due - timer())
+                if shape.jitter is not None:
+                    delay += shape.jitter.sample(self.rng)
+            yield delay, chunk
+            sent += len(chunk)
+
+        #: Headers are delayed even if body is empty.
+        if not sent and delay > 0:
+            yield delay, b''
+
+    def __iter__(self):
+        for delay, chunk in self.schedule():
+            if delay > 0:
+                time.sleep(delay)
+            if chunk is not None:
+                yield chunk
+
+    def close(self):
+        if hasattr(self.iterable, 'close'):
+            self.iterable.close()
+
+
+def parse_shapes(config):
+    """Create dict of route to :class:`Shape` from `streaming` config.
+
+    :param config: `streaming` value of config.json
+    """
+    if not config:
+        return {}
+
+    shapes = {}
+    for k, v in config.items():
+        if not k.startswith('/') and k != ANY_ROUTE:
+            raise ValueError('Unknown streaming route {0}'.format(k))
+        shapes[k] = Shape.from_config(v)
+
+    return shapes
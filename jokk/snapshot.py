@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.snapshot
+    ~~~~~~~~~~~~~
+
+    Immutable state derived from `config.json` and data directory.
+
+    Snapshot is built off to the side on reloading and published with
+    single reference assignment, so requests never see half updated state.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+from .shaping import parse_shapes
+from .faults import parse_faults
+from .compression import Compression
+
+#: CORS headers added when `cors` is true in config.json.
+CORS_HEADERS = [
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,PATCH'),
+    ('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+]
+
+
+class Snapshot(object):
+    """State to serve requests.
+
+    :param generation: Number of reloads before this snapshot
+    :param config: Config dict
+    :param router: :class:`jokk.routing.Router` or
+                   :class:`jokk.routing.MapRouter`
+    :param data_path: Path to data directory
+    :param index: :class:`jokk.index.DataIndex`
+    :param cache: :class:`jokk.cache.ResponseCache`
+    :param store: :class:`jokk.store.Store` or `None` unless stateful
+    :param limits: Dict of route to :class:`jokk.limits.Limit`
+    :param worker: Index of prefork worker which seeds faults, `None` in
+                   single process
+    """
+    __slots__ = ('generation', 'config', 'router', 'data_path', 'index',
+                 'cache', 'variables', 'jsonp', 'etag', 'headers', 'templates',
+                 'shapes', 'faults', 'compression', 'store', 'limits',
+                 '_frozen')
+
+    def __init__(self, generation, config, router, data_path, index, cache,
+                 store=None, limits=None, worker=None):
+        self.generation = generation
+        self.config = config
+        self.router = router
+        self.data_path = data_path
+        self.index = index
+        self.cache = cache
+        self.store = store
+        #: Limits by route, `*` limits all other routes together.
+        self.limits = limits or {}
+        self.variables = config.get('variables')
+        self.jsonp = config.get('jsonp') is True
+        self.etag = config.get('etag') is True
+        self.headers = list(CORS_HEADERS) if config.get('cors') is True \
+            else []
+        #: :class:`jokk.compression.Compression` or `None` if disabled.
+        self.compression = Compression.from_config(config.get('compression'))
+        if self.compression is not None:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+        #: Header templates of dynamic responses by `(status, mimetype)`.
+        self.templates = {}
+        #: Streaming options by route, `*` matches all routes.
+        self.shapes = parse_shapes(config.get('streaming'))
+        #: Fault profiles by route, `*` matches all routes.
+        self.faults = parse_faults(config.get('faults'), worker)
+        self._frozen = True
+
+    @property
+    def url_map(self):
+        """Werkzeug `Map` of routes."""
+        return self.router.url_map
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError('Snapshot is immutable')
+        super(Snapshot, self).__setattr__(name, value)
@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.store
+    ~~~~~~~~~~
+
+    In-memory resource store of stateful mode.
+
+    Route without url vars such as `/user` and route which appends one url
+    var to it such as `/user/<userid>` are resource. Items of resource are
+    seeded from `user_get.json` which is JSON array, then `POST /user`,
+    `PUT`, `PATCH` and `DELETE /user/<userid>` update them and `GET` serves
+    them. Items are indexed by key field, so item requests are one dict
+    lookup.
+
+    Key field is url var name if seeded items have it, otherwise `id`.
+    `POST` assigns next integer key if item doesn't have key.
+
+    .. code-block:: json
+
+      {
+        "routes": ["/user", "/user/<int:userid>"],
+        "stateful": {"snapshot": "./state.json", "interval": 5}
+      }
+
+    With `snapshot`, items are written to file in background every
+    `interval` seconds if modified, and loaded from it on start instead of
+    fixtures. Items are kept on reloading config.json.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from werkzeug.routing import parse_rule
+from ._compat import text_type, to_bytes
+
+logger = logging.getLogger(__name__)
+
+#: Default interval in seconds of writing snapshot.
+DEFAULT_SNAPSHOT_INTERVAL = 5.0
+
+#: Keys of `stateful` option.
+OPTIONS = ('snapshot', 'interval')
+
+#: Status lines by status code.
+STATUSES = {
+    200: '200 OK',
+    201: '201 Created',
+    204: '204 No Content',
+    400: '400 Bad Request',
+    404: '404 Not Found',
+    409: '409 Conflict'
+}
+
+
+def parse_stateful(value):
+    """Parse `stateful` value of config.json.
+
+    Return dict of options or `None` if stateful mode is disabled.
+
+    :param value: `true` or dict of options
+    """
+    if value is None or value is False:
+        return None
+    if value is True:
+        return {}
+
+    unknown = set(value) - set(OPTIONS)
+    if unknown:
+        raise ValueError('Unknown stateful options {0}'.format(
+            ', '.join(sorted(unknown))))
+    interval = value.get('interval', DEFAULT_SNAPSHOT_INTERVAL)
+    if not isinstance(interval, (int, float)) or interval <= 0:
+        raise ValueError('interval should be positive number')
+
+    return dict(value)
+
+
+def find_resources(routes):
+    """Return dict of item route to `(collection route, url var name)`.
+
+    :param routes: Url rules
+    """
+    collections = {}
+    for route in routes:
+        items = list(parse_rule(route.rstrip('/') or '/'))
+        if all(v[0] is None for v in items):
+            collections.setdefault(route.rstrip('/'), route)
+
+    resources = {}
+    for route in routes:
+        items = list(parse_rule(route.rstrip('/')))
+        if len(items) < 2 or items[-1][0] is None:
+            continue
+        prefix = items[-2]
+        if any(v[0] is not None for v in items[:-1]) or \
+                not prefix[2].endswith('/'):
+            continue
+        collection = collections.get(prefix[2].rstrip('/'))
+        if collection is not None:
+            resources[route] = (collection, items[-1][2])
+
+    return resources
+
+
+def response(status, data, headers):
+    """Return `(status, headers, body iterable)` of JSON.
+
+    :param status: Status code
+    :param data: Encoded JSON bytes or object, `None` for empty body
+    :param headers: Headers added to response
+    """
+    if data is None:
+        body = b''
+    elif isinstance(data, bytes):
+        body = data
+    else:
+        body = to_bytes(json.dumps(data), 'utf-8')
+
+    headers = [('Content-Type', 'application/json'),
+               ('Content-Length', str(len(body)))] + headers
+
+    return STATUSES[status], headers, [body]
+
+
+def error(status, headers):
+    """Return JSON error response.
+
+    :param status: Status code
+    :param headers: Headers added to response
+    """
+    return response(status, {'error': STATUSES[status].split(' ', 1)[1]},
+                    headers)
+
+
+def read_json(environ):
+    """Return JSON object of request body or `None` if it's not object.
+
+    :param environ: WSGI environ
+    """
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        data = json.loads(environ['wsgi.input'].read(length).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+    return data if isinstance(data, dict) else None
+
+
+class Collection(object):
+    """Items of resource indexed by key field.
+
+    :param key: Key field of items
+    """
+    def __init__(self, key='id'):
+        self.key = key
+        self.items = OrderedDict()
+        self.next_id = 1
+        #: Keys of url vars such as `/user/3` are converted to integer
+        #: unless seeded items have other keys.
+        self.int_keys = True
+        self._body = None
+        self._lock = threading.Lock()
+
+    def seed(self, items):
+        """Replace items.
+
+        :param items: List of items
+        """
+        with self._lock:
+            self.items.clear()
+            self._body = None
+            self.next_id = 1
+            self.int_keys = all(isinstance(v.get(self.key, 0), int)
+                                for v in items)
+            for item in items:
+                if self.key not in item:
+                    item[self.key] = self.next_id
+                self._add(item)
+
+    def _add(self, item):
+        key = item[self.key]
+        self.items[text_type(key)] = item
+        self._body = None
+        if isinstance(key, int) and key >= self.next_id:
+            self.next_id = key + 1
+
+    def parse_key(self, key):
+        """Return key of url var as type of keys of items.
+
+        :param key: Key of item
+        """
+        if not self.int_keys or isinstance(key, int):
+            return key
+        try:
+            value = int(key)
+        except ValueError:
+            return key
+
+        #: Keys such as `03` are kept as is.
+        return value if text_type(value) == key else key
+
+    def body(self):
+        """Return all items as JSON bytes, encoded once until modified."""
+        body = self._body
+        if body is None:
+            with self._lock:
+                body = to_bytes(json.dumps(list(self.items.values())),
+                                'utf-8')
+                self._body = body
+
+        return body
+
+    def get(self, key):
+        """Return item or `None`.
+
+        :param key: Key of item
+        """
+        return self.items.get(text_type(key))
+
+    def create(self, item):
+        """Add item and return it, or `None` if key exists.
+
+        :param item: Item, next integer key is assigned unless it has key
+        """
+        with self._lock:
+            if self.key not in item:
+                #: Keys added by `PUT` are skipped.
+                while text_type(self.next_id) in self.items:
+                    self.next_id += 1
+                item[self.key] = self.next_id
+            elif text_type(item[self.key]) in self.items:
+                return None
+            self._add(item)
+
+        return item
+
+    def put(self, key, item):
+        """Replace or add item, return `True` if added.
+
+        :param key: Key of item
+        :param item: Item
+        """
+        with self._lock:
+            old = self.items.get(text_type(key))
+            if old is None:
+                item[self.key] = self.parse_key(key)
+            else:
+                item[self.key] = old[self.key]
+            self._add(item)
+
+        return old is None
+
+    def patch(self, key, changes):
+        """Update fields of item and return it, or `None` if not found.
+
+        :param key: Key of item
+        :param changes: Fields to update
+        """
+        with self._lock:
+            old = self.items.get(text_type(key))
+            if old is None:
+                return None
+            item = dict(old, **changes)
+            item[self.key] = old[self.key]
+            self._add(item)
+
+        return item
+
+    def delete(self, key):
+        """Delete item and return `True` if found.
+
+        :param key: Key of item
+        """
+        with self._lock:
+            if self.items.pop(text_type(key), None) is None:
+                return False
+            self._body = None
+
+        return True
+
+    def dump(self):
+        """Return list of items."""
+        with self._lock:
+            return list(self.items.values())
+
+
+class Store(object):
+    """Resources of stateful mode.
+
+    :param routes: Url rules
+    """
+    def __init__(self, routes):
+        #: Item route to `(collection route, url var name)`.
+        self.resources = find_resources(routes)
+        #: Collection route to :class:`Collection`.
+        self.collections = {}
+        for collection, name in self.resources.values():
+            self.collections.setdefault(collection, Collection(name))
+        #: Incremented on every modification.
+        self.version = 0
+        #: Modifications and version are updated at once.
+        self._lock = threading.Lock()
+
+    def seed(self, route, items):
+        """Seed collection.
+
+        Key field is url var name if first item has it, otherwise `id`.
+
+        :param route: Collection route
+        :param items: List of items
+        """
+        collection = self.collections[route]
+        if not items or collection.key not in items[0]:
+            collection.key = 'id'
+        collection.seed(items)
+
+    def dump(self):
+        """Return dict of collection route to items."""
+        return dict((k, v.dump()) for k, v in self.collections.items())
+
+    def handle(self, environ, endpoint, args, headers):
+        """Return `(status, headers, body iterable)`, or `None` if request
+        is not handled by store.
+
+        :param environ: WSGI environ
+        :param endpoint: Matched url rule
+        :param args: Url vars
+        :param headers: Headers added to response
+        """
+        method = environ.get('REQUEST_METHOD')
+        collection = self.collections.get(endpoint)
+        if collection is not None:
+            if method == 'GET':
+                return response(200, collection.body(), headers)
+            if method != 'POST':
+                return None
+
+            item = read_json(environ)
+            if item is None:
+                return error(400, headers)
+            with self._lock:
+                item = collection.create(item)
+                if item is None:
+                    return error(409, headers)
+                self.version += 1
+            return response(201, item, headers)
+
+        resource = self.resources.get(endpoint)
+        if resource is None:
+            return None
+        collection = self.collections[resource[0]]
+        key = args[resource[1]]
+
+        if method == 'GET':
+            item = collection.get(key)
+            if item is None:
+                return error(404, headers)
+            return response(200, item, headers)
+
+        if method == 'DELETE':
+            with self._lock:
+                if not collection.delete(key):
+                    return error(404, headers)
+                self.version += 1
+            return response(204, None, headers)
+
+        if method not in ('PUT', 'PATCH'):
+            return None
+
+        item = read_json(environ)
+        if item is None:
+            return error(400, headers)
+        with self._lock:
+            if method == 'PUT':
+                status = 201 if collection.put(key, item) else 200
+            else:
+                item = collection.patch(key, item)
+                if item is None:
+                    return error(404, headers)
+                status = 200
+            self.version += 1
+
+        return response(status, item, headers)
+
+
+class StoreDumper(object):
+    """Write items of store to file in background if modified.
+
+    :param path: Path to snapshot file
+    :param get_store: Function which returns current :class:`Store`
+    :param interval: Interval in seconds
+    """
+    def __init__(self, path, get_store, interval=DEFAULT_SNAPSHOT_INTERVAL):
+        self.path = path
+        self.get_store = get_store
+        self.interval = interval
+        self._dumped = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start writing in daemon thread."""
+        self._thread = threading.Thread(target=self.run,
+                                        name=self.__class__.__name__)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop writing and write last modification."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.dump()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except Exception:
+                logger.exception('Failed to write %s', self.path)
+
+    def dump(self):
+        """Write items unless store is modified since last writing.
+
+        Return `True` if written.
+        """
+        store = self.get_store()
+        if store is None or (store, store.version) == self._dumped:
+            return False
+
+        version = store.version
+        data = json.dumps(store.dump(), sort_keys=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        #: Rename to replace file at once.
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+        self._dumped = (store, version)
+
+        return True
+
+
+def load_snapshot(path):
+    """Return dict of collection route to items or `None` if not found.
+
+    :param path: Path to snapshot file
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        return json.loads(f.read())
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.template
+    ~~~~~~~~~~~~~
+
+    Precompiled response file template.
+
+    Response file is parsed once to literal segments and placeholder slots
+    with same rules as `string.Template.safe_substitute`.
+    Response file without placeholders is served as pre-encoded bytes.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+from string import Template
+from ._compat import to_bytes
+
+#: Bytes which may be changed by substitution, `$$`, `$name` or `${name}`.
+PLACEHOLDER = re.compile(br'\$(?:\$|\{?[_a-zA-Z])')
+
+
+def has_placeholders(data):
+    """Return `True` if data may contain placeholders.
+
+    :param data: Bytes or buffer such as `mmap`
+    """
+    return PLACEHOLDER.search(data) is not None
+
+
+class CompiledTemplate(object):
+    """Parsed template.
+
+    Segments are literal strings or `(name, original)` placeholder slots.
+    Unknown placeholders are rendered as original text like
+    `string.Template.safe_substitute`.
+
+    :param segments: List of literal strings and placeholder slots
+    """
+    pattern = Template.pattern
+
+    def __init__(self, segments):
+        self.segments = segments
+        self.names = frozenset(v[0] for v in segments
+                               if isinstance(v, tuple))
+
+    @classmethod
+    def compile(cls, text):
+        """Parse text to segments.
+
+        :param text: Template text
+        """
+        segments = []
+        pos = 0
+        for mo in cls.pattern.finditer(text):
+            literal = text[pos:mo.start()]
+            pos = mo.end()
+            named = mo.group('named') or mo.group('braced')
+            if named is not None:
+                segments.append(literal)
+                segments.append((named, mo.group()))
+            elif mo.group('escaped') is not None:
+                segments.append(literal + '$')
+            else:
+                segments.append(literal + mo.group())
+        segments.append(text[pos:])
+
+        return cls(cls.merge(segments))
+
+    @staticmethod
+    def merge(segments):
+        """Join adjacent literal segments.
+
+        :param segments: List of literal strings and placeholder slots
+        """
+        merged = []
+        for v in segments:
+            if merged and not isinstance(v, tuple) \
+                    and not isinstance(merged[-1], tuple):
+                merged[-1] += v
+            elif v != '':
+                merged.append(v)
+
+        return merged
+
+    def bind(self, mapping, exclude=()):
+        """Substitute placeholders in mapping and return new template.
+
+        :param mapping: Dict of variables
+        :param exclude: Names which would be substituted later
+        """
+        segments = []
+        for v in self.segments:
+            if isinstance(v, tuple) and v[0] in mapping \
+                    and v[0] not in exclude:
+                v = '%s' % (mapping[v[0]],)
+            segments.append(v)
+
+        return self.__class__(self.merge(segments))
+
+    def render(self, mapping):
+        """Substitute placeholders and return text.
+
+        :param mapping: Dict of variables
+        """
+        if not self.names:
+            return ''.join(self.segments)
+
+        get = mapping.get
+        return ''.join(v if not isinstance(v, tuple)
+                       else '%s' % (get(v[0], v[1]),)
+                       for v in self.segments)
+
+    def is_static(self, names=None):
+        """Return `True` if rendered text never changes.
+
+        :param names: Names which would be substituted
+        """
+        if names is None:
+            return not self.names
+
+        return self.names.isdisjoint(names)
+
+    def encode(self, charset='utf-8'):
+        """Render static template to bytes.
+
+        :param charset: Charset of bytes
+        """
+        return to_bytes(self.render({}), charset)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.variants
+    ~~~~~~~~~~~~~
+
+    Response file variants selected by query, headers or JSON body.
+
+    Variant is response file which has conditions between method and ext.
+    Conditions are url encoded, joined by `&`.
+
+    ========================================== ===========================
+    Response file                              Served when
+    ========================================== ===========================
+    user_get.page=2.json                       `?page=2`
+    user_get.page=2&sort=name.json             `?page=2&sort=name`
+    user_get.header.x-version=2.json           `X-Version: 2` header
+    user_post.body.user.role=admin.json        `{"user": {"role": "admin"}}`
+    user_get.q=*.json                          `q` query is given
+    user_get.q=jo*.json                        `q` query starts with `jo`
+    ========================================== ===========================
+
+    Variants are compiled into matcher on scanning. Variants with exact
+    values are hash buckets by condition names, so selecting costs one
+    dict lookup per set of names no matter how many variants route has.
+    Variants with `*` are checked in order after buckets. Variants with
+    more conditions, fewer `*` and longer prefixes are preferred, response
+    file without conditions is served if no variants match.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import io
+import re
+import json
+from werkzeug.urls import url_decode
+from ._compat import text_type
+
+#: Methods which response files can have variants.
+METHODS = ('get', 'post', 'put', 'patch', 'delete', 'head', 'options')
+
+#: `<file name>_<method>.<conditions>`.
+VARIANT_PATTERN = re.compile(r'\A(.*)_({0})\.(.+)\Z'.format(
+    '|'.join(METHODS)))
+
+#: Sources of values.
+QUERY = 'query'
+HEADER = 'header'
+BODY = 'body'
+
+#: Operators of conditions.
+EXACT = 'exact'
+PRESENT = 'present'
+PREFIX = 'prefix'
+
+#: Request body is not parsed yet.
+NOT_LOADED = object()
+
+
+def split_file_name(base):
+    """Return `(file name, method)` of response file name without ext.
+
+    Method of variant has conditions such as `get.page=2`.
+
+    :param base: Response file name without ext such as `user_get.page=2`
+    """
+    mo = VARIANT_PATTERN.match(base)
+    if mo is not None and all('=' in v for v in mo.group(3).split('&')):
+        return mo.group(1), mo.group(2) + '.' + mo.group(3)
+
+    return tuple(base.rsplit('_', 1))
+
+
+def parse_conditions(spec):
+    """Return tuple of `(source, name, operator, value)`.
+
+    :param spec: Url encoded conditions such as `page=2&header.x-version=2`
+    """
+    conditions = []
+    for key, value in url_decode(spec).items(multi=True):
+        source = QUERY
+        for v in (QUERY, HEADER, BODY):
+            if key.startswith(v + '.'):
+                source, key = v, key[len(v) + 1:]
+                break
+        if source == HEADER:
+            key = key.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+        elif source == BODY:
+            key = tuple(key.split('.'))
+
+        if value == '*':
+            conditions.append((source, key, PRESENT, None))
+        elif value.endswith('*'):
+            conditions.append((source, key, PREFIX, value[:-1]))
+        else:
+            conditions.append((source, key, EXACT, value))
+
+    return tuple(conditions)
+
+
+class RequestValues(object):
+    """Values of request, query and body are parsed on first access.
+
+    :param environ: WSGI environ
+    """
+    def __init__(self, environ):
+        self.environ = environ
+        self._query = None
+        self._body = NOT_LOADED
+
+    def get(self, source, key):
+        """Return text value or `None` if not found.
+
+        :param source: `query`, `header` or `body`
+        :param key: Name of value
+        """
+        if source == QUERY:
+            if self._query is None:
+                self._query = url_decode(self.environ.get('QUERY_STRING', ''))
+            return self._query.get(key)
+        if source == HEADER:
+            return self.environ.get(key)
+
+        value = self.body
+        for v in key:
+            if not isinstance(value, dict) or v not in value:
+                return None
+            value = value[v]
+        if isinstance(value, text_type):
+            return value
+
+        return json.dumps(value)
+
+    @property
+    def body(self):
+        """JSON request body or `None`.
+
+        Body is read once and put back to `wsgi.input`.
+        """
+        if self._body is NOT_LOADED:
+            self._body = None
+            try:
+                length = int(self.environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if length > 0:
+                data = self.environ['wsgi.input'].read(length)
+                self.environ['wsgi.input'] = io.BytesIO(data)
+                try:
+                    self._body = json.loads(data.decode('utf-8'))
+                except ValueError:
+                    pass
+
+        return self._body
+
+
+def match(condition, values):
+    """Return `True` if request satisfies condition.
+
+    :param condition: `(source, name, operator, value)`
+    :param values: :class:`RequestValues`
+    """
+    source, key, operator, expected = condition
+    value = values.get(source, key)
+    if value is None:
+        return False
+    if operator == PREFIX:
+        return value.startswith(expected)
+
+    return operator == PRESENT or value == expected
+
+
+def specificity(conditions):
+    """Return sort key of conditions, smaller key is preferred.
+
+    More conditions, fewer `*` and longer prefixes are preferred.
+
+    :param conditions: Parsed conditions
+    """
+    present = 0
+    prefix = 0
+    for v in conditions:
+        if v[2] == PRESENT:
+            present += 1
+        elif v[2] == PREFIX:
+            prefix += len(v[3])
+
+    return (-len(conditions), present, -prefix)
+
+
+class VariantMatcher(object):
+    """Select variant of `(endpoint, method)`."""
+
+    def __init__(self):
+        #: List of `(keys, dict of values to method)`.
+        self.buckets = []
+        #: List of `(conditions, method)`.
+        self.predicates = []
+
+    def add(self, method, conditions):
+        """Add variant.
+
+        Former variant wins same conditions.
+
+        :param method: Method with conditions such as `get.page=2`
+        :param conditions: Parsed conditions
+        """
+        if any(v[2] != EXACT for v in conditions):
+            self.predicates.append((conditions, method))
+            self.predicates.sort(key=lambda v: specificity(v[0]))
+            return
+
+        conditions = sorted(conditions)
+        keys = tuple((v[0], v[1]) for v in conditions)
+        values = tuple(v[3] for v in conditions)
+        for v in self.buckets:
+            if v[0] == keys:
+                v[1].setdefault(values, method)
+                return
+        self.buckets.append((keys, {values: method}))
+        self.buckets.sort(key=lambda v: -len(v[0]))
+
+    def select(self, environ):
+        """Return method of matched variant or `None`.
+
+        :param environ: WSGI environ
+        """
+        values = RequestValues(environ)
+        for keys, variants in self.buckets:
+            found = []
+            for source, key in keys:
+                value = values.get(source, key)
+                if value is None:
+                    break
+                found.append(value)
+            else:
+                method = variants.get(tuple(found))
+                if method is not None:
+                    return method
+
+        for conditions, method in self.predicates:
+            if all(match(v, values) for v in conditions):
+                return method
+
+        return None
+
+
+def build_matchers(keys):
+    """Return dict of `(endpoint, method)` to :class:`VariantMatcher`.
+
+    :param keys: `(endpoint, method)` of response files, method of variant
+                 has conditions
+    """
+    matchers = {}
+    for endpoint, method in sorted(keys):
+        method, _, spec = method.partition('.')
+        if not spec:
+            continue
+        matcher = matchers.get((endpoint, method))
+        if matcher is None:
+            matcher = matchers[(endpoint, method)] = VariantMatcher()
+        matcher.add(method + '.' + spec, parse_conditions(spec))
+
+    return matchers
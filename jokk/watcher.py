@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.watcher
+    ~~~~~~~~~~~~
+
+    Watch `config.json` and data directory.
+
+    Watcher calls callback in background thread when watched files are
+    modified, so request threads don't need to stat any files.
+    On Linux inotify is used, otherwise files are polled.
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+#: Default polling interval in seconds.
+DEFAULT_INTERVAL = 1.0
+
+
+class Watcher(object):
+    """Poll mtime and size of files every interval.
+
+    Subclasses replace :meth:`run` to be notified by OS.
+
+    :param paths: Paths to files or directories, directories are watched
+                  recursively
+    :param callback: Called without arguments when files are modified
+    :param interval: Interval in seconds
+    """
+    def __init__(self, paths, callback, interval=DEFAULT_INTERVAL):
+        self.paths = [os.path.abspath(v) for v in paths]
+        self.callback = callback
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start watching in daemon thread."""
+        self._thread = threading.Thread(target=self.run,
+                                        name=self.__class__.__name__)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def watch(self, paths):
+        """Replace watched paths, such as data directory changed by
+        reloading.
+
+        :param paths: Paths to files or directories
+        """
+        self.paths = [os.path.abspath(v) for v in paths]
+
+    def snapshot(self):
+        """Return dict of path to `(mtime, size)`."""
+        stamps = {}
+        for path in self.paths:
+            targets = [path]
+            if os.path.isdir(path):
+                for root, dirs, names in os.walk(path):
+                    targets.extend(os.path.join(root, v) for v in dirs)
+                    targets.extend(os.path.join(root, v) for v in names)
+            for target in targets:
+                try:
+                    st = os.stat(target)
+                except OSError:
+                    continue
+                stamps[target] = (st.st_mtime, st.st_size)
+
+        return stamps
+
+    def run(self):
+        stamps = self.snapshot()
+        while not self._stop.wait(self.interval):
+            current = self.snapshot()
+            if current != stamps:
+                stamps = current
+                self.notify()
+
+    def notify(self):
+        """Call callback, errors are logged and ignored."""
+        try:
+            self.callback()
+        except Exception:
+            logger.exception('Failed to reload')
+
+
+#: Watcher which polls files.
+PollingWatcher = Watcher
+
+
+class InotifyWatcher(Watcher):
+    """Watch files by Linux inotify.
+
+    Parent directories of files are watched, because editors often
+    replace files by rename.
+    """
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+        IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    event_header = struct.Struct('iIII')
+
+    def __init__(self, paths, callback, interval=DEFAULT_INTERVAL):
+        super(InotifyWatcher, self).__init__(paths, callback, interval)
+        self._libc = self.load_libc()
+        flags = self.IN_NONBLOCK | self.IN_CLOEXEC
+        self._fd = self._libc.inotify_init1(flags)
+        if self._fd < 0:
+            raise OSError(errno.errorcode.get(self._errno(), 'inotify'))
+        #: Watch descriptor to `(directory, file name filter)`.
+        self._watches = {}
+        self._lock = threading.RLock()
+        self.add_watches()
+
+    @staticmethod
+    def load_libc():
+        """Load libc which supports inotify."""
+        import ctypes
+        import ctypes.util
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        return libc
+
+    def _errno(self):
+        import ctypes
+        return ctypes.get_errno()
+
+    def add_watch(self, path, name=None):
+        encoded = path.encode(sys.getfilesystemencoding())
+        wd = self._libc.inotify_add_watch(self._fd, encoded, self.mask)
+        if wd < 0:
+            return
+        watched = self._watches.get(wd)
+        if watched is not None and watched[1] is None:
+            #: Directory is already watched without file name filter.
+            return
+        self._watches[wd] = (path, name)
+
+    def add_watches(self):
+        """Watch paths, inotify ignores already watched directories."""
+        with self._lock:
+            for path in self.paths:
+                if os.path.isdir(path):
+                    for root, _, _ in os.walk(path):
+                        self.add_watch(root)
+                else:
+                    self.add_watch(os.path.dirname(path),
+                                   os.path.basename(path))
+
+    def watch(self, paths):
+        super(InotifyWatcher, self).watch(paths)
+        with self._lock:
+            #: Same watch descriptor is returned for watched directory,
+            #: so new paths are watched before others are removed.
+            watches, self._watches = self._watches, {}
+            self.add_watches()
+            for wd in set(watches) - set(self._watches):
+                self._libc.inotify_rm_watch(self._fd, wd)
+
+    def is_target(self, buf):
+        """Return `True` if events in buffer are for watched files.
+
+        :param buf: Buffer read from inotify file descriptor
+        """
+        offset = 0
+        size = self.event_header.size
+        while offset + size <= len(buf):
+            wd, _, _, length = self.event_header.unpack_from(buf, offset)
+            name = buf[offset + size:offset + size + length].rstrip(b'\0')
+            offset += size + length
+            #: Event queue overflowed, some events may be lost.
+            if wd == -1:
+                return True
+            watched = self._watches.get(wd)
+            if watched is None:
+                continue
+            file_name = watched[1]
+            if file_name is None:
+                return True
+            if name.decode(sys.getfilesystemencoding()) == file_name:
+                return True
+
+        return False
+
+    def read(self, timeout):
+        """Read events, return `None` if timeout.
+
+        :param timeout: Timeout in seconds
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return None
+        try:
+            return os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return b''
+            raise
+
+    def run(self):
+        try:
+            while not self._stop.is_set():
+                buf = self.read(0.5)
+                if not buf or not self.is_target(buf):
+                    continue
+                #: Editors and deployments modify many files at once,
+                #: wait until events are settled.
+                while self.read(min(self.interval, 0.1)) is not None:
+                    pass
+                self.add_watches()
+                self.notify()
+        finally:
+            os.close(self._fd)
+
+
+def create_watcher(paths, callback, interval=DEFAULT_INTERVAL,
+                   polling=False):
+    """Create inotify watcher, fallback to polling watcher.
+
+    :param paths: Paths to files or directories
+    :param callback: Called without arguments when files are modified
+    :param interval: Polling interval in seconds
+    :param polling: Force polling watcher
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(paths, callback, interval)
+        except (OSError, AttributeError):
+            pass
+
+    return PollingWatcher(paths, callback, interval)
@@ -37,6 +37,7 @@ setup(
     packages=find_packages(exclude=['tests']),
     package_dir={'': '.'},
     install_requires=requires,
+    extras_require={'brotli': ['brotli']},
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Web Environment',
@@ -10,6 +10,10 @@
     :license: BSD, see LICENSE for more details.
 """
 import os
+import json
+import time
+import shutil
+import tempfile
 from unittest import TestCase
 from functools import wraps
 from werkzeug.test import Client
@@ -22,7 +26,6 @@ def paramterized(**kwargs):
         @wraps(func)
         def __paramterized_test(*args):
             func(args[0], kwargs)
-            return func
         return __paramterized_test
     return _paramterized_test
 
@@ -50,3 +53,51 @@ class TestBase(TestCase):
         client = Client(app, BaseResponse)
 
         return client
+
+
+class TempDataTestBase(TestBase):
+    """Create config.json and data directory in temporary directory."""
+    config = {'data': './data', 'routes': ['/user']}
+    files = {'user_get.json': '{"message": "old"}'}
+
+    def setUp(self):
+        super(TempDataTestBase, self).setUp()
+        self.tmp_path = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmp_path, 'config.json')
+        self._write_config(self.config)
+        os.mkdir(os.path.join(self.tmp_path, 'data'))
+        for k, v in self.files.items():
+            self._write(k, v)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def _write_config(self, config):
+        with open(self.config_path, 'w') as f:
+            f.write(json.dumps(config))
+
+    def _write(self, file_name, data):
+        path = os.path.join(self.tmp_path, 'data', file_name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def _touch_config(self):
+        mtime = os.path.getmtime(self.config_path) + 10
+        os.utime(self.config_path, (mtime, mtime))
+
+    def _wait_reload(self, app, count=1, timeout=3):
+        """Wait until config.json is reloaded in background."""
+        for _ in range(int(timeout / 0.01)):
+            if app.reload_count >= count:
+                return True
+            time.sleep(0.01)
+
+        return False
+
+    def _create_tmp_client(self, **options):
+        app = create_app(self.config_path, **options)
+        client = Client(app, BaseResponse)
+
+        return client
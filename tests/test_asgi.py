@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_asgi
+    ~~~~~~~~~~~~~~~~~~~~
+
+    ASGI application tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import unittest
+from . import TestBase
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from http.client import HTTPConnection
+    from jokk.asgi import create_asgi_app, start_server
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+class TestAsgi(TestBase):
+    def setUp(self):
+        super(TestAsgi, self).setUp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _create_asgi_app(self, file_name):
+        file_path = os.path.join(self.root_path, 'configs', file_name)
+        return create_asgi_app(file_path)
+
+    def _request(self, app, method, path, query_string=b''):
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'query_string': query_string, 'headers': [],
+                 'http_version': '1.1'}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        self.loop.run_until_complete(app(scope, receive, send))
+        headers = dict(messages[0]['headers'])
+
+        return messages[0]['status'], headers, messages[1]['body']
+
+    def test_get_request(self):
+        """ GET /user should serve user_get.json """
+        app = self._create_asgi_app('basic.json')
+        expected = self._read_json('basic/user_get.json').encode('utf-8')
+        for _ in range(2):
+            status, headers, body = self._request(app, 'GET', '/user')
+            self.assertEqual(status, 200)
+            self.assertEqual(headers[b'content-type'], b'application/json')
+            self.assertEqual(body, expected)
+
+    def test_custom_status_201(self):
+        """ POST /user should return 201. """
+        app = self._create_asgi_app('basic.json')
+        status, _, _ = self._request(app, 'POST', '/user')
+        self.assertEqual(status, 201)
+
+    def test_template(self):
+        """ Url vars should be assigned. """
+        app = self._create_asgi_app('template.json')
+        _, _, body = self._request(app, 'GET', '/foo')
+        self.assertTrue(b'"foo"' in body)
+
+    def test_jsonp_callback(self):
+        """ JSONP callback should be read from query string. """
+        app = self._create_asgi_app('jsonp_true.json')
+        _, _, body = self._request(app, 'GET', '/user', b'callback=cb')
+        self.assertTrue(body.startswith(b'cb('))
+
+    def test_not_found(self):
+        """ Unmatched url should return 404. """
+        app = self._create_asgi_app('basic.json')
+        status, _, _ = self._request(app, 'GET', '/foo')
+        self.assertEqual(status, 404)
+
+    def test_server_keep_alive(self):
+        """ asyncio server should serve requests on one connection. """
+        app = self._create_asgi_app('basic.json')
+        server = self.loop.run_until_complete(
+            start_server(app, '127.0.0.1', 0))
+        port = server.sockets[0].getsockname()[1]
+        results = []
+
+        def client():
+            conn = HTTPConnection('127.0.0.1', port)
+            for path in ['/user', '/user/1', '/foo']:
+                conn.request('GET', path)
+                res = conn.getresponse()
+                results.append((res.status, res.read()))
+            conn.close()
+
+        try:
+            self.loop.run_until_complete(
+                self.loop.run_in_executor(None, client))
+        finally:
+            server.close()
+            self.loop.run_until_complete(server.wait_closed())
+
+        self.assertEqual([v[0] for v in results], [200, 200, 404])
+        expected = self._read_json('basic/user_get.json').encode('utf-8')
+        self.assertEqual(results[0][1], expected)
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_bench
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Benchmark tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import json
+import shutil
+import tempfile
+from jokk.bench import create_scenarios, main, percentile, run, split
+from . import TestBase
+
+
+class TestBench(TestBase):
+    def test_percentile(self):
+        """ Percentile should be nearest rank. """
+        values = list(range(1, 1001))
+        self.assertEqual(percentile(values, 0.5), 500)
+        self.assertEqual(percentile(values, 0.99), 990)
+        self.assertEqual(percentile(values, 0.999), 999)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+    def test_split(self):
+        """ Requests should be split to clients. """
+        self.assertEqual(split(10, 3), [4, 3, 3])
+
+    def test_scenarios(self):
+        """ Scenario paths should be served with 200. """
+        from werkzeug.test import Client
+        from werkzeug.wrappers import BaseResponse
+        from jokk.server import create_app
+        root_path = tempfile.mkdtemp()
+        try:
+            for scenario in create_scenarios().values():
+                app = create_app(scenario.setup(root_path))
+                client = Client(app, BaseResponse)
+                for path in scenario.paths[:3]:
+                    self.assertEqual(client.get(path).status_code, 200)
+        finally:
+            shutil.rmtree(root_path)
+
+    def test_run(self):
+        """ Report should have throughput and latency of each mode. """
+        report = run(['static', 'concurrent'], requests=50, warmup=5)
+        results = report['results']
+        self.assertEqual([(v['scenario'], v['mode']) for v in results],
+                         [('static', 'inprocess'), ('static', 'socket'),
+                          ('concurrent', 'inprocess'),
+                          ('concurrent', 'socket')])
+        for v in results:
+            self.assertEqual(v['requests'], 50)
+            self.assertTrue(v['rps'] > 0)
+            latency = v['latency_ms']
+            percentiles = [latency[k] for k in ('p50', 'p99', 'p999')]
+            self.assertEqual(percentiles, sorted(percentiles))
+        self.assertEqual(results[2]['concurrency'], 8)
+
+    def test_json(self):
+        """ `jokk bench --json` should write report. """
+        root_path = tempfile.mkdtemp()
+        path = os.path.join(root_path, 'result.json')
+        try:
+            main(['--scenario', 'template', '--mode', 'inprocess',
+                  '-n', '20', '--warmup', '0', '--json', path])
+            with open(path) as f:
+                report = json.loads(f.read())
+        finally:
+            shutil.rmtree(root_path)
+        self.assertEqual(report['results'][0]['scenario'], 'template')
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_bundle
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Packed bundle tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import shutil
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+from jokk.bundle import Bundle, BundleIndex, HEADER, MAGIC, is_bundle, \
+    main as pack_main
+from jokk.server import create_app, is_stateful, main
+from . import TempDataTestBase
+
+
+class TestBundle(TempDataTestBase):
+    config = {'data': './data', 'routes': ['/user', '/item/<id>'],
+              'variables': {'name': 'jokk'}}
+    files = {'user_get.json': '{"name": "${name}"}',
+             'user_head.status': '204',
+             'user_post.xml': '<id>1</id>',
+             'user_post.status': '201',
+             'item/id_get.json': '{"id": "${id}"}'}
+
+    def setUp(self):
+        super(TestBundle, self).setUp()
+        self.bundle_path = os.path.join(self.tmp_path, 'mock.jokk')
+
+    def _pack(self):
+        pack_main(['-c', self.config_path, '-o', self.bundle_path])
+
+    def test_pack(self):
+        """ Bundle should have config and response files. """
+        self._pack()
+        self.assertTrue(is_bundle(self.bundle_path))
+        self.assertFalse(is_bundle(self.config_path))
+
+        bundle = Bundle(self.bundle_path)
+        self.assertEqual(bundle.config, self.config)
+        index = BundleIndex(bundle, self.config['routes'])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.lookup('/user', 'head').status, 204)
+        descriptor = index.lookup('/user', 'post')
+        self.assertEqual((descriptor.mimetype, descriptor.status),
+                         ('application/xml', 201))
+        self.assertEqual(descriptor.read(), b'<id>1</id>')
+
+    def test_serve(self):
+        """ Bundle should be served without data directory. """
+        expected = self._create_tmp_client()
+        paths = ['/user', '/item/1']
+        responses = [expected.get(v) for v in paths]
+        self._pack()
+        shutil.rmtree(os.path.join(self.tmp_path, 'data'))
+
+        client = Client(create_app(self.bundle_path), BaseResponse)
+        for path, response in zip(paths, responses):
+            res = client.get(path)
+            self.assertEqual((res.status_code, res.data),
+                             (response.status_code, response.data))
+        self.assertEqual(client.get('/user').data, b'{"name": "jokk"}')
+        self.assertEqual(client.head('/user').status_code, 204)
+        res = client.post('/user')
+        self.assertEqual((res.status_code, res.data), (201, b'<id>1</id>'))
+        self.assertTrue(res.headers['Content-Type'].startswith(
+            'application/xml'))
+
+    def test_not_reloaded(self):
+        """ Bundle should not be checked on every request. """
+        self._pack()
+        client = Client(create_app(self.bundle_path), BaseResponse)
+        mtime = os.path.getmtime(self.bundle_path) + 10
+        os.utime(self.bundle_path, (mtime, mtime))
+        client.get('/user')
+        self.assertEqual(client.application.reload_count, 0)
+
+        client.application.reload()
+        self.assertEqual(client.get('/item/2').data, b'{"id": "2"}')
+
+    def test_preload(self):
+        """ Bundle should be preloaded. """
+        self._pack()
+        app = create_app(self.bundle_path, preload=True)
+        app.wait_ready(3)
+        self.assertEqual(app.preload_report.files, 4)
+
+    def test_invalid(self):
+        """ Unsupported version should raise ValueError. """
+        with open(self.bundle_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 99, 2) + b'{}')
+        self.assertRaises(ValueError, Bundle, self.bundle_path)
+
+    def test_stateful_workers(self):
+        """ Stateful bundle should be refused with workers. """
+        self._pack()
+        self.assertFalse(is_stateful(self.bundle_path))
+        self._write_config(dict(self.config, stateful=True))
+        self._pack()
+        self.assertTrue(is_stateful(self.bundle_path))
+
+        argv = sys.argv
+        sys.argv = ['jokk', '-c', self.bundle_path, '--workers', '2']
+        try:
+            self.assertEqual(main(), 1)
+        finally:
+            sys.argv = argv
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_cache
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Response cache tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+from jokk.cache import ResponseCache, CacheEntry
+from jokk._compat import to_unicode
+from . import TestBase, TempDataTestBase
+
+
+class TestResponseCache(TestBase):
+    def _entry(self, nbytes):
+        return CacheEntry(None, None, None, '', [], nbytes)
+
+    def test_hit_and_miss(self):
+        """ get() should count hits and misses. """
+        cache = ResponseCache(100)
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', self._entry(10))
+        self.assertTrue(cache.get('a') is not None)
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_evict_least_recently_used(self):
+        """ Least recently used entry should be evicted by total bytes. """
+        cache = ResponseCache(25)
+        cache.set('a', self._entry(10))
+        cache.set('b', self._entry(10))
+        cache.get('a')
+        cache.set('c', self._entry(10))
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.total_bytes, 20)
+
+    def test_disabled(self):
+        """ Cache size 0 should not cache anything. """
+        cache = ResponseCache(0)
+        cache.set('a', self._entry(0))
+        self.assertEqual(len(cache), 0)
+
+    def test_get_request_cached(self):
+        """ Second request should be served from cache. """
+        client = self._create_client('basic.json')
+        client.get('/user')
+        res = client.get('/user')
+        expected = self._read_json('basic/user_get.json')
+        self.assertEqual(to_unicode(res.data), expected)
+        self.assertEqual(client.application.cache.hits, 1)
+
+
+class TestResponseCacheInvalidate(TempDataTestBase):
+    def test_modified_file(self):
+        """ Modified response file should be read again. """
+        client = self._create_tmp_client()
+        client.get('/user')
+        self._write('user_get.json', '{"message": "modified"}')
+        res = client.get('/user')
+        self.assertEqual(to_unicode(res.data), '{"message": "modified"}')
+
+    def test_added_status_file(self):
+        """ Added status file should be found after config.json touched. """
+        client = self._create_tmp_client()
+        client.get('/user')
+        self._write('user_get.status', '202')
+        self._touch_config()
+        client.get('/user')
+        self.assertTrue(self._wait_reload(client.application))
+        res = client.get('/user')
+        self.assertEqual(res.status_code, 202)
+
+    def test_removed_file(self):
+        """ Removed response file should fall back to next extension. """
+        self._write('user_get.xml', '<message>xml</message>')
+        for fast_path in (True, False):
+            self._write('user_get.json', '{"message": "old"}')
+            client = self._create_tmp_client(fast_path=fast_path)
+            client.get('/user')
+            os.remove(os.path.join(self.tmp_path, 'data', 'user_get.json'))
+            res = client.get('/user')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(to_unicode(res.data), '<message>xml</message>')
+
+        os.remove(os.path.join(self.tmp_path, 'data', 'user_get.xml'))
+        res = client.get('/user')
+        self.assertEqual((res.status_code, res.data), (200, b''))
+
+    def test_added_file(self):
+        """ Added response file should be found without touching config. """
+        self._write_config(dict(self.config, routes=['/user', '/item']))
+        client = self._create_tmp_client()
+        self.assertEqual(client.get('/item').data, b'')
+        self._write('item_get.json', '{"message": "added"}')
+        res = client.get('/item')
+        self.assertEqual(to_unicode(res.data), '{"message": "added"}')
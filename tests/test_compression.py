@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_compression
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Response compression tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import zlib
+from jokk.compression import Compression, gzip_compress
+from jokk.largefile import FileResponse
+from . import TempDataTestBase, TestBase
+
+BODY = '[' + ','.join(['{"id": %d}' % i for i in range(200)]) + ']'
+GZIP = {'Accept-Encoding': 'gzip, deflate'}
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class TestNegotiate(TestBase):
+    def test_negotiate(self):
+        """ Best encoding should be chosen by quality. """
+        compression = Compression()
+        self.assertEqual(compression.negotiate('gzip, deflate'), 'gzip')
+        self.assertEqual(compression.negotiate('*'), 'gzip')
+        self.assertEqual(compression.negotiate('gzip;q=0, *;q=0.5'), None)
+        self.assertEqual(compression.negotiate('deflate'), None)
+        self.assertEqual(compression.negotiate(''), None)
+
+    def test_sidecars(self):
+        """ Sidecar encodings should be available without compressor. """
+        compression = Compression()
+        self.assertEqual(compression.negotiate('br, gzip;q=0.5', ['br']),
+                         'br')
+        self.assertEqual(compression.negotiate('br', [], compress=False),
+                         None)
+
+    def test_gzip_compress(self):
+        """ Same data should be compressed to same bytes. """
+        data = BODY.encode('utf-8')
+        self.assertEqual(gzip_compress(data), gzip_compress(data))
+        self.assertEqual(gunzip(gzip_compress(data)), data)
+
+    def test_invalid(self):
+        """ Invalid options should raise ValueError. """
+        self.assertEqual(Compression.from_config(None), None)
+        self.assertEqual(Compression.from_config(False), None)
+        self.assertRaises(ValueError, Compression.from_config,
+                          {'gzip_level': 10})
+        self.assertRaises(ValueError, Compression.from_config, {'level': 1})
+
+
+class TestCompression(TempDataTestBase):
+    config = {'data': './data', 'routes': ['/user', '/small', '/item/<id>'],
+              'compression': {'min_size': 100}}
+    files = {
+        'user_get.json': BODY,
+        'small_get.json': '{"id": 1}',
+        'item/id_get.json': '{"id": "${id}", "items": ' + BODY + '}'
+    }
+
+    def _write_bytes(self, file_name, data):
+        with open(os.path.join(self.tmp_path, 'data', file_name), 'wb') as f:
+            f.write(data)
+
+    def _entry(self, client, endpoint):
+        snapshot = client.application.snapshot
+        return snapshot.cache.get((snapshot.data_path, endpoint, 'get'))
+
+    def test_static(self):
+        """ Static response should be compressed once. """
+        client = self._create_tmp_client()
+        res = client.get('/user', headers=GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(res.headers['Content-Length'], str(len(res.data)))
+        self.assertEqual(gunzip(res.data), BODY.encode('utf-8'))
+
+        variant = self._entry(client, '/user').variants['gzip']
+        client.get('/user', headers=GZIP)
+        self.assertTrue(self._entry(client, '/user').variants['gzip']
+                        is variant)
+
+        stats = client.application.compression_stats.stats()['gzip']
+        self.assertEqual(stats['responses'], 2)
+        self.assertEqual(stats['original_bytes'], len(BODY) * 2)
+        self.assertEqual(stats['compressed_bytes'], len(res.data) * 2)
+
+    def test_identity(self):
+        """ Response should not be compressed unless accepted. """
+        client = self._create_tmp_client()
+        for headers in [{}, {'Accept-Encoding': 'gzip;q=0'}]:
+            res = client.get('/user', headers=headers)
+            self.assertFalse('Content-Encoding' in res.headers)
+            self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+            self.assertEqual(res.data, BODY.encode('utf-8'))
+
+    def test_small(self):
+        """ Body which gets larger by compression should not be compressed.
+        """
+        client = self._create_tmp_client()
+        res = client.get('/small', headers=GZIP)
+        self.assertFalse('Content-Encoding' in res.headers)
+        self.assertEqual(res.data, b'{"id": 1}')
+
+    def test_sidecar(self):
+        """ Sidecar file should be served as is. """
+        sidecar = gzip_compress(b'{"sidecar": true}')
+        self._write_bytes('user_get.json.gz', sidecar)
+        self._write_bytes('user_get.json.br', b'brotli')
+        client = self._create_tmp_client()
+        res = client.get('/user', headers=GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(res.data, sidecar)
+
+        res = client.get('/user', headers={'Accept-Encoding': 'br'})
+        self.assertEqual(res.headers['Content-Encoding'], 'br')
+        self.assertEqual(res.data, b'brotli')
+
+    def test_large_file_sidecar(self):
+        """ Sidecar of large file should be served from file. """
+        sidecar = gzip_compress(BODY.encode('utf-8'))
+        self._write_bytes('user_get.json.gz', sidecar)
+        client = self._create_tmp_client(large_file_size=1024)
+        res = client.get('/user', headers=GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(res.data, sidecar)
+        variant = self._entry(client, '/user').variants['gzip']
+        self.assertTrue(isinstance(variant, FileResponse))
+
+        res = client.get('/user', headers={'Accept-Encoding': 'br'})
+        self.assertFalse('Content-Encoding' in res.headers)
+
+    def test_template(self):
+        """ Large templated response should be compressed per request. """
+        client = self._create_tmp_client()
+        res = client.get('/item/1', headers=GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(gunzip(res.data).startswith(b'{"id": "1"'))
+
+        self._write_config(dict(self.config, compression={'min_size': 10000}))
+        client = self._create_tmp_client()
+        res = client.get('/item/1', headers=GZIP)
+        self.assertFalse('Content-Encoding' in res.headers)
+
+    def test_etag(self):
+        """ Compressed response should have its own ETag. """
+        self._write_config(dict(self.config, etag=True))
+        client = self._create_tmp_client()
+        identity = client.get('/user').headers['ETag']
+        res = client.get('/user', headers=GZIP)
+        etag = res.headers['ETag']
+        self.assertNotEqual(etag, identity)
+
+        headers = dict(GZIP, **{'If-None-Match': etag})
+        res = client.get('/user', headers=headers)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+        res = client.head('/user', headers=headers)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        res = client.head('/user', headers=GZIP)
+        self.assertEqual((res.headers['ETag'], res.headers['Vary']),
+                         (etag, 'Accept-Encoding'))
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        res = client.head('/user')
+        self.assertEqual(res.headers['ETag'], identity)
+        self.assertFalse('Content-Encoding' in res.headers)
+
+    def test_fast_path(self):
+        """ Fast path should return same compressed response. """
+        fast = self._create_tmp_client()
+        slow = self._create_tmp_client(fast_path=False)
+        for path in ['/user', '/small', '/item/1']:
+            for headers in [{}, GZIP]:
+                expected = slow.get(path, headers=headers)
+                res = fast.get(path, headers=headers)
+                self.assertEqual(res.headers.to_wsgi_list(),
+                                 expected.headers.to_wsgi_list())
+                self.assertEqual(res.data, expected.data)
+
+    def test_disabled(self):
+        """ Response should not be compressed without `compression`. """
+        config = dict(self.config)
+        del config['compression']
+        self._write_config(config)
+        client = self._create_tmp_client()
+        res = client.get('/user', headers=GZIP)
+        self.assertFalse('Content-Encoding' in res.headers)
+        self.assertFalse('Vary' in res.headers)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_etag
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Prepared response and ETag tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+from jokk._compat import to_unicode
+from jokk.server import create_app
+from . import TestBase
+
+
+class TestEtag(TestBase):
+    def test_etag(self):
+        """ Static response should contain strong ETag. """
+        client = self._create_client('etag.json')
+        res = client.get('/user')
+        etag = res.headers.get('ETag')
+        self.assertTrue(etag.startswith('"'))
+        self.assertEqual(res.headers.get('Content-Length'),
+                         str(len(res.data)))
+
+    def test_not_modified(self):
+        """ If-None-Match should return 304. """
+        client = self._create_client('etag.json')
+        etag = client.get('/user').headers.get('ETag')
+        res = client.get('/user', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers.get('ETag'), etag)
+        self.assertEqual(res.headers.get('Access-Control-Allow-Origin'), '*')
+
+    def test_modified(self):
+        """ Unmatched If-None-Match should return body. """
+        client = self._create_client('etag.json')
+        res = client.get('/user', headers={'If-None-Match': '"foo"'})
+        self.assertEqual(res.status_code, 200)
+        expected = self._read_json('basic/user_get.json')
+        self.assertEqual(to_unicode(res.data), expected)
+
+    def test_etag_disabled(self):
+        """ ETag should not be added unless etag option is true. """
+        client = self._create_client('basic.json')
+        res = client.get('/user')
+        self.assertFalse('ETag' in res.headers)
+
+    def test_prepared_once(self):
+        """ Static response should be prepared once. """
+        client = self._create_client('etag.json')
+        client.get('/user')
+        app = client.application
+        entry = app.cache.get((app.data_path, '/user', 'get'))
+        prepared = entry.prepared
+        client.get('/user')
+        self.assertTrue(entry.prepared is prepared)
+
+    def test_unsafe_methods(self):
+        """ Only GET and HEAD responses should contain ETag. """
+        client = self._create_client('etag.json')
+        for method in ('post', 'put', 'patch', 'delete', 'options'):
+            res = getattr(client, method)('/user')
+            self.assertFalse('ETag' in res.headers)
+
+    def test_head(self):
+        """ HEAD response should contain same ETag as GET. """
+        for fast_path in (True, False):
+            app = create_app(os.path.join(self.root_path, 'configs',
+                                          'etag.json'), fast_path=fast_path)
+            client = Client(app, BaseResponse)
+            etag = client.get('/user').headers.get('ETag')
+            res = client.head('/user')
+            self.assertEqual(res.headers.get('ETag'), etag)
+            self.assertEqual(res.data, b'')
+            res = client.head('/user', headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 304)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_fast_path
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    WSGI fast path tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+from jokk.server import create_app
+from . import TestBase
+
+METHODS = ['GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD']
+
+
+class TestFastPath(TestBase):
+    def _clients(self, file_name):
+        file_path = os.path.join(self.root_path, 'configs', file_name)
+        fast = Client(create_app(file_path), BaseResponse)
+        slow = Client(create_app(file_path, fast_path=False), BaseResponse)
+
+        return fast, slow
+
+    def _assert_same(self, file_name, path, methods=METHODS, **kwargs):
+        fast, slow = self._clients(file_name)
+        for method in methods:
+            expected = slow.open(path, method=method, **kwargs)
+            res = fast.open(path, method=method, **kwargs)
+            self.assertEqual(res.status, expected.status)
+            self.assertEqual(res.headers.to_wsgi_list(),
+                             expected.headers.to_wsgi_list())
+            self.assertEqual(res.data, expected.data)
+
+    def test_basic(self):
+        """ Fast path should return same response as Werkzeug. """
+        for path in ['/user', '/user/1', '/user/']:
+            self._assert_same('basic.json', path)
+
+    def test_crossdomain(self):
+        """ Fast path should return same JSONP and CORS response. """
+        self._assert_same('cors_true.json', '/user')
+        self._assert_same('jsonp_true.json', '/user')
+        self._assert_same('jsonp_true.json', '/user/1?callback=cb')
+
+    def test_mimetype(self):
+        """ Fast path should return same Content-Type. """
+        for path in ['/json', '/xml', '/html', '/txt']:
+            self._assert_same('mimetype.json', path, ['GET'])
+
+    def test_template(self):
+        """ Fast path should return same templated response. """
+        for path in ['/foo', '/template']:
+            self._assert_same('template.json', path)
+
+    def test_etag(self):
+        """ Fast path should return same 304 response. """
+        fast, _ = self._clients('etag.json')
+        etag = fast.get('/user').headers.get('ETag')
+        self._assert_same('etag.json', '/user', ['GET', 'HEAD'],
+                          headers={'If-None-Match': etag})
+
+    def test_not_found(self):
+        """ Fast path should fallback to Werkzeug when url not matched. """
+        from werkzeug.routing import NotFound
+        fast, _ = self._clients('basic.json')
+        with self.assertRaises(NotFound):
+            fast.get('/foo')
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_faults
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Fault and latency injection tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import sys
+import random
+import unittest
+from werkzeug.test import EnvironBuilder
+from jokk._compat import timer
+from jokk.server import create_app
+from jokk.shaping import Delay
+from jokk.faults import AbortConnection, Fault, FaultyBody, parse_faults
+from . import TempDataTestBase, TestBase
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from jokk.asgi import AsgiJokk
+
+BODY = '{"message": "' + 'x' * 86 + '"}'
+
+
+class TestFault(TestBase):
+    def test_histogram(self):
+        """ Delays should be replayed within histogram buckets. """
+        delay = Delay.from_config({'distribution': 'histogram',
+                                   'buckets': [[0.1, 9], [1.0, 0],
+                                               [2.0, 1]]})
+        rng = random.Random(1)
+        delays = [delay.sample(rng) for _ in range(1000)]
+        self.assertFalse([v for v in delays if 0.1 < v <= 1.0])
+        self.assertTrue(50 < len([v for v in delays if v > 1.0]) < 150)
+        for v in [[[1.0, 1], [0.5, 1]], [[0.1, 0]], [0.1], []]:
+            self.assertRaises(ValueError, Delay.from_config,
+                              {'distribution': 'histogram', 'buckets': v})
+
+    def test_seed(self):
+        """ Same seed should inject same faults. """
+        config = {'seed': 7, '/user': {'error_rate': 0.3, 'reset_rate': 0.1,
+                                       'truncate_rate': 0.1,
+                                       'latency': {'distribution': 'uniform',
+                                                   'min': 0, 'max': 1}}}
+
+        def decide():
+            fault = parse_faults(config)['/user']
+            return [(v.delay, v.kind, v.value) for v in
+                    (fault.decide() for _ in range(100))]
+
+        self.assertEqual(decide(), decide())
+        kinds = [v[1] for v in decide()]
+        self.assertTrue(20 < kinds.count('error') < 40)
+
+    def test_worker_seed(self):
+        """ Workers should inject different faults by same seed. """
+        config = {'seed': 7, '/user': {'error_rate': 0.5}}
+
+        def decide(worker):
+            fault = parse_faults(config, worker)['/user']
+            return [fault.decide() is None for _ in range(100)]
+
+        self.assertEqual(decide(1), decide(1))
+        self.assertNotEqual(decide(0), decide(1))
+        self.assertEqual(decide(None), decide(None))
+
+    def test_invalid(self):
+        """ Invalid faults should raise ValueError. """
+        for v in [{'error_rate': 2}, {'error_rate': 0.6, 'reset_rate': 0.6},
+                  {'error_status': 999}, {'timeout': 1}]:
+            self.assertRaises(ValueError, Fault.from_config, v)
+        self.assertRaises(ValueError, parse_faults, {'user': {}})
+
+    def test_truncate(self):
+        """ Connection should be aborted after truncated body. """
+        body = FaultyBody([b'abc', b'def'], truncate=4)
+        chunks = []
+        with self.assertRaises(AbortConnection):
+            for v in body:
+                chunks.append(v)
+        self.assertEqual(chunks, [b'abc', b'd'])
+
+    def test_reset(self):
+        """ Connection should be aborted after delay without data. """
+        body = FaultyBody([b'abc'], delay=0.5, reset=True)
+        schedule = body.schedule()
+        self.assertEqual(next(schedule), (0.5, None))
+        self.assertRaises(AbortConnection, next, schedule)
+
+
+class TestFaults(TempDataTestBase):
+    files = {'user_get.json': BODY, 'item_get.json': BODY}
+    config = {
+        'data': './data',
+        'routes': ['/user', '/item', '/slow'],
+        'faults': {
+            '/user': {'error_rate': 1, 'error_status': [503]},
+            '/item': {'truncate_rate': 1},
+            '*': {'latency': 0.05}
+        }
+    }
+
+    def _call(self, app, path):
+        started = []
+
+        def start_response(status, headers):
+            started[:] = [status, dict(headers)]
+
+        environ = EnvironBuilder(path).get_environ()
+        begin = timer()
+        chunks = []
+        try:
+            for v in app(environ, start_response):
+                chunks.append(v)
+        except AbortConnection:
+            chunks.append(None)
+
+        return started[0], started[1], chunks, timer() - begin
+
+    def test_wsgi(self):
+        """ Faults should be injected by fast path and Werkzeug. """
+        self._write('slow_get.json', BODY)
+        for fast_path in (True, False):
+            app = create_app(self.config_path, fast_path=fast_path)
+            status, headers, chunks, _ = self._call(app, '/user')
+            self.assertEqual(status, '503 Service Unavailable')
+            self.assertEqual(b''.join(chunks), b'Service Unavailable')
+
+            _, headers, chunks, _ = self._call(app, '/item')
+            self.assertEqual(headers['Content-Length'], str(len(BODY)))
+            self.assertEqual(chunks[-1], None)
+            self.assertTrue(len(b''.join(chunks[:-1])) < len(BODY))
+
+            status, _, chunks, elapsed = self._call(app, '/slow')
+            self.assertEqual(b''.join(chunks), BODY.encode('utf-8'))
+            self.assertTrue(elapsed >= 0.05)
+
+    def test_disabled(self):
+        """ Responses should be served as is without faults. """
+        self._write_config(dict(self.config, faults={}))
+        app = create_app(self.config_path)
+        status, _, chunks, _ = self._call(app, '/user')
+        self.assertEqual((status, b''.join(chunks)),
+                         ('200 OK', BODY.encode('utf-8')))
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+class TestFaultsAsgi(TempDataTestBase):
+    files = {'user_get.json': BODY}
+    config = {
+        'data': './data',
+        'routes': ['/user'],
+        'faults': {'/user': {'latency': 0.2}}
+    }
+
+    def test_concurrent(self):
+        """ Delays should sleep in event loop concurrently. """
+        app = AsgiJokk(create_app(self.config_path))
+        loop = asyncio.new_event_loop()
+
+        async def request():
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/user',
+                     'query_string': b'', 'headers': []}
+            await app(scope, receive, send)
+
+            return messages
+
+        async def requests():
+            return await asyncio.gather(*[request() for _ in range(100)])
+
+        begin = timer()
+        try:
+            results = loop.run_until_complete(requests())
+        finally:
+            loop.close()
+
+        self.assertTrue(0.2 <= timer() - begin < 2.0)
+        for messages in results:
+            self.assertEqual(b''.join(v['body'] for v in messages[1:]),
+                             BODY.encode('utf-8'))
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_index
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Route to response file index tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+from jokk.index import endpoint_to_file_name, MISSING
+from . import TestBase, paramterized
+
+
+class TestIndex(TestBase):
+    @paramterized(expected={'/': '', '/user': 'user',
+                            '/user/<userid>': 'user/userid'})
+    def test_endpoint_to_file_name(self, params):
+        """ Url rules should be converted to response file name. """
+        for k, v in params['expected'].items():
+            self.assertEqual(endpoint_to_file_name(k), v)
+
+    def test_lookup(self):
+        """ Index should resolve response file and status. """
+        app = self._create_app('basic.json')
+        descriptor = app.index.lookup('/user', 'post')
+        self.assertTrue(descriptor.path.endswith('user_post.json'))
+        self.assertEqual(descriptor.mimetype, 'application/json')
+        self.assertEqual(descriptor.status, 201)
+
+    def test_lookup_remapped(self):
+        """ Index should resolve response file in sub directory. """
+        app = self._create_app('basic.json')
+        descriptor = app.index.lookup('/user/<userid>', 'get')
+        self.assertTrue(descriptor.path.endswith('userid_get.json'))
+
+    def test_lookup_missing(self):
+        """ Index should return MISSING when response file not found. """
+        app = self._create_app('basic.json')
+        self.assertTrue(app.index.lookup('/user', 'options') is MISSING)
+        self.assertTrue(app.index.lookup('/user', 'head') is MISSING)
+
+    def test_mimetype_order(self):
+        """ Index should resolve mimetypes json, xml, html, txt order. """
+        app = self._create_app('mimetype.json')
+        descriptor = app.index.lookup('/html', 'get')
+        self.assertEqual(descriptor.mimetype, 'text/html')
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_largefile
+    ~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Large response file tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import unittest
+from jokk.largefile import FileIterator, FileResponse
+from . import TempDataTestBase
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from http.client import HTTPConnection
+    from jokk.asgi import AsgiJokk, start_server
+
+LARGE = '[' + ','.join(['{"id": %d}' % i for i in range(1000)]) + ']'
+
+
+class TestLargeFile(TempDataTestBase):
+    files = {
+        'user_get.json': LARGE,
+        'template_get.json': LARGE + '${foo}',
+        'small_get.json': '{"message": "small"}'
+    }
+    config = {'data': './data', 'routes': ['/user', '/template', '/small']}
+
+    def _entry(self, client, endpoint):
+        snapshot = client.application.snapshot
+        return snapshot.cache.get((snapshot.data_path, endpoint, 'get'))
+
+    def test_large_file(self):
+        """ Large file without placeholders should be served from file. """
+        client = self._create_tmp_client(large_file_size=1024)
+        res = client.get('/user')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, LARGE.encode('utf-8'))
+        self.assertEqual(res.headers['Content-Length'], str(len(LARGE)))
+        self.assertEqual(res.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(res.headers['Content-Type'], 'application/json')
+
+        entry = self._entry(client, '/user')
+        self.assertTrue(isinstance(entry.body, FileResponse))
+        self.assertEqual(entry.nbytes, 0)
+
+    def test_template_and_small_file(self):
+        """ Templated and small files should be read into memory. """
+        client = self._create_tmp_client(large_file_size=1024)
+        client.get('/template')
+        client.get('/small')
+        for endpoint in ['/template', '/small']:
+            self.assertFalse(isinstance(self._entry(client, endpoint).body,
+                                        FileResponse))
+
+    def test_disabled(self):
+        """ `large_file_size=0` should read all files into memory. """
+        client = self._create_tmp_client(large_file_size=0)
+        self.assertEqual(client.get('/user').data, LARGE.encode('utf-8'))
+        self.assertTrue(isinstance(self._entry(client, '/user').body, bytes))
+
+    def test_range(self):
+        """ Range request should return 206 Partial Content. """
+        for fast_path in (True, False):
+            client = self._create_tmp_client(large_file_size=1024,
+                                             fast_path=fast_path)
+            res = client.get('/user', headers={'Range': 'bytes=10-19'})
+            self.assertEqual(res.status_code, 206)
+            self.assertEqual(res.data, LARGE[10:20].encode('utf-8'))
+            self.assertEqual(res.headers['Content-Range'],
+                             'bytes 10-19/{0}'.format(len(LARGE)))
+            self.assertEqual(res.headers['Content-Length'], '10')
+
+            res = client.get('/user', headers={'Range': 'bytes=-5'})
+            self.assertEqual(res.data, LARGE[-5:].encode('utf-8'))
+
+    def test_range_not_satisfiable(self):
+        """ Range out of file should return 416. """
+        client = self._create_tmp_client(large_file_size=1024)
+        res = client.get('/user', headers={'Range': 'bytes=100000-'})
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res.headers['Content-Range'],
+                         'bytes */{0}'.format(len(LARGE)))
+
+    def test_multiple_ranges_and_if_range(self):
+        """ Multiple ranges and stale If-Range should return whole file. """
+        client = self._create_tmp_client(large_file_size=1024)
+        res = client.get('/user', headers={'Range': 'bytes=0-1,5-6'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data, LARGE.encode('utf-8'))
+
+        res = client.get('/user', headers={'Range': 'bytes=0-1',
+                                           'If-Range': '"stale"'})
+        self.assertEqual(res.status_code, 200)
+
+        last_modified = res.headers['Last-Modified']
+        res = client.get('/user', headers={'Range': 'bytes=0-1',
+                                           'If-Range': last_modified})
+        self.assertEqual(res.status_code, 206)
+
+    def test_etag(self):
+        """ ETag of large file should support If-None-Match. """
+        self._write_config(dict(self.config, etag=True))
+        client = self._create_tmp_client(large_file_size=1024)
+        etag = client.get('/user').headers['ETag']
+        res = client.get('/user', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_head(self):
+        """ HEAD should return Content-Length without body. """
+        self._write('user_head.json', LARGE)
+        client = self._create_tmp_client(large_file_size=1024)
+        res = client.head('/user')
+        self.assertEqual(res.data, b'')
+
+    def test_file_wrapper(self):
+        """ `wsgi.file_wrapper` should be used if server provides it. """
+        wrapped = []
+
+        def file_wrapper(f, block_size):
+            wrapped.append(f)
+            return iter(lambda: f.read(block_size), b'')
+
+        client = self._create_tmp_client(large_file_size=1024)
+        res = client.get('/user',
+                         environ_overrides={'wsgi.file_wrapper': file_wrapper})
+        self.assertEqual(res.data, LARGE.encode('utf-8'))
+        self.assertEqual(len(wrapped), 1)
+        wrapped[0].close()
+
+    def test_file_iterator(self):
+        """ File iterator should yield chunks of region. """
+        path = os.path.join(self.tmp_path, 'data', 'user_get.json')
+        iterator = FileIterator(path, 3, 3000, chunk_size=1000)
+        chunks = list(iterator)
+        self.assertEqual([len(v) for v in chunks], [1000, 1000, 997])
+        self.assertEqual(b''.join(chunks), LARGE[3:3000].encode('utf-8'))
+
+
+@unittest.skipIf(sys.version_info < (3, 7), 'requires Python 3.7')
+class TestLargeFileAsgi(TempDataTestBase):
+    files = {'user_get.json': LARGE}
+
+    def test_sendfile(self):
+        """ asyncio server should send large file by sendfile. """
+        app = AsgiJokk(self._create_tmp_client(
+            large_file_size=1024).application)
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(
+            start_server(app, '127.0.0.1', 0))
+        port = server.sockets[0].getsockname()[1]
+
+        results = []
+
+        def request():
+            conn = HTTPConnection('127.0.0.1', port)
+            for headers in ({}, {'Range': 'bytes=1-3'}):
+                conn.request('GET', '/user', headers=headers)
+                res = conn.getresponse()
+                results.append((res.status, res.read()))
+            conn.close()
+
+        try:
+            loop.run_until_complete(loop.run_in_executor(None, request))
+            #: Let connection handler see closed connection.
+            loop.run_until_complete(asyncio.sleep(0.05))
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+        self.assertEqual(results, [(200, LARGE.encode('utf-8')),
+                                   (206, LARGE[1:4].encode('utf-8'))])
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_limits
+    ~~~~~~~~~~~~~~~~~~~~~~
+
+    Rate limit and concurrency cap tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import time
+import signal
+import unittest
+from werkzeug.test import EnvironBuilder
+from jokk.server import create_app
+from jokk.limits import LimitState, parse_limits
+from jokk.serving import Arbiter
+from . import TempDataTestBase, TestBase
+
+
+class TestLimitState(TestBase):
+    def test_token_bucket(self):
+        """ Requests over rate should wait until tokens are refilled. """
+        state = LimitState(2)
+        self.assertEqual(state.acquire(0, 1, 2, now=10), None)
+        self.assertEqual(state.acquire(0, 1, 2, now=10), None)
+        self.assertEqual(state.acquire(0, 1, 2, now=10.25), (429, 0.75))
+        self.assertEqual(state.acquire(0, 1, 2, now=11), None)
+        #: Other slot has its own bucket.
+        self.assertEqual(state.acquire(1, 1, 2, now=11), None)
+
+    def test_in_flight(self):
+        """ Requests over max in flight should be rejected. """
+        state = LimitState(1)
+        self.assertEqual(state.acquire(0, max_in_flight=1), None)
+        self.assertEqual(state.acquire(0, max_in_flight=1), (503, 1.0))
+        state.release(0)
+        self.assertEqual(state.acquire(0, max_in_flight=1), None)
+
+    @unittest.skipIf(not hasattr(os, 'fork'), 'requires os.fork()')
+    def test_shared(self):
+        """ Counters should be shared by forked processes. """
+        state = LimitState(1)
+        pid = os.fork()
+        if pid == 0:
+            state.acquire(0, max_in_flight=2)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(state.in_flight(0), 1)
+
+    def test_reload(self):
+        """ Routes should keep their slots across reloads. """
+        state = LimitState(2)
+        old = parse_limits({'/b': {'max_in_flight': 1}}, state)['/b']
+        old.state.acquire(old.slot, max_in_flight=1, owner=old.owner)
+        limits = parse_limits({'/a': {'max_in_flight': 1},
+                               '/b': {'max_in_flight': 1}}, state)
+        self.assertEqual(limits['/b'].slot, old.slot)
+        self.assertEqual(state.in_flight(old.slot), 1)
+        self.assertEqual(state.in_flight(limits['/a'].slot), 0)
+
+        #: Slot of removed route is reset before it is reused.
+        new = parse_limits({'/a': {'max_in_flight': 1},
+                            '/c': {'max_in_flight': 1}}, state)['/c']
+        self.assertEqual(new.slot, old.slot)
+        self.assertEqual(state.in_flight(new.slot), 0)
+        old.release()
+        self.assertEqual(state.acquire(new.slot, max_in_flight=1,
+                                       owner=new.owner), None)
+        old.release()
+        self.assertEqual(state.in_flight(new.slot), 1)
+
+    def test_invalid(self):
+        """ Invalid limits should raise ValueError. """
+        state = LimitState(2)
+        for v in [{}, {'rate': 0}, {'rate': 1, 'burst': 0.5},
+                  {'max_in_flight': 1.5}, {'concurrency': 1}]:
+            self.assertRaises(ValueError, parse_limits, {'/user': v}, state)
+        self.assertRaises(ValueError, parse_limits, {'user': {'rate': 1}},
+                          state)
+        self.assertRaises(ValueError, parse_limits, dict(
+            (k, {'rate': 1}) for k in ['/a', '/b', '/c']), state)
+
+
+class TestLimits(TempDataTestBase):
+    files = {'user_get.json': '{"message": "user"}',
+             'item_get.json': '{"message": "item"}'}
+    config = {
+        'data': './data',
+        'routes': ['/user', '/item'],
+        'limits': {
+            '/user': {'rate': 0.001, 'burst': 1},
+            '*': {'max_in_flight': 1}
+        }
+    }
+
+    def _call(self, app, path, close=True):
+        started = []
+
+        def start_response(status, headers):
+            started[:] = [status, dict(headers)]
+
+        body = app(EnvironBuilder(path).get_environ(), start_response)
+        data = b''.join(body)
+        if close and hasattr(body, 'close'):
+            body.close()
+
+        return started[0], started[1], data, body
+
+    def test_rate(self):
+        """ Requests over rate should be `429` with Retry-After. """
+        for fast_path in (True, False):
+            app = create_app(self.config_path, fast_path=fast_path)
+            status, _, data, _ = self._call(app, '/user')
+            self.assertEqual((status, data), ('200 OK',
+                                              b'{"message": "user"}'))
+            status, headers, _, _ = self._call(app, '/user')
+            self.assertEqual(status, '429 Too Many Requests')
+            self.assertEqual(headers['Retry-After'], '1000')
+
+    def test_in_flight(self):
+        """ Requests over max in flight should be `503` until closed. """
+        for fast_path in (True, False):
+            app = create_app(self.config_path, fast_path=fast_path)
+            status, _, _, body = self._call(app, '/item', close=False)
+            self.assertEqual(status, '200 OK')
+            status, headers, _, _ = self._call(app, '/item')
+            self.assertEqual(status, '503 Service Unavailable')
+            self.assertEqual(headers['Retry-After'], '1')
+            body.close()
+            self.assertEqual(self._call(app, '/item')[0], '200 OK')
+
+    def test_fallback(self):
+        """ Request which falls back should take one token. """
+        app = create_app(self.config_path)
+        environ = EnvironBuilder('/user').get_environ()
+        self.assertEqual(app.dispatch_environ(environ, cached_only=True),
+                         None)
+        status, _, _ = app.dispatch_environ(environ)
+        self.assertEqual(status, '200 OK')
+
+    def test_shared_state(self):
+        """ Apps which share state should share limits. """
+        state = LimitState()
+        apps = [create_app(self.config_path, limit_state=state)
+                for _ in range(2)]
+        self.assertEqual(self._call(apps[0], '/user')[0], '200 OK')
+        self.assertEqual(self._call(apps[1], '/user')[0],
+                         '429 Too Many Requests')
+
+    @unittest.skipIf(not hasattr(os, 'fork'), 'requires os.fork()')
+    def test_killed_worker(self):
+        """ Requests in flight of killed worker should be released. """
+        state = LimitState(1, workers=2)
+        #: Request of other worker is kept.
+        state.worker = 1
+        state.acquire(0, max_in_flight=3)
+
+        def worker(sock, index):
+            state.worker = index
+            state.acquire(0, max_in_flight=3)
+            os.kill(os.getpid(), signal.SIGKILL)
+
+        arbiter = Arbiter(None, worker, 1, on_exit=state.release_worker)
+        arbiter.spawn_workers()
+        for _ in range(100):
+            arbiter.reap_workers()
+            if not arbiter.pids:
+                break
+            time.sleep(0.05)
+        self.assertFalse(arbiter.pids)
+        self.assertEqual(state.in_flight(0), 1)
+        state.release(0)
+        self.assertEqual(state.in_flight(0), 0)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_metrics
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Metrics endpoint tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import re
+import threading
+from werkzeug.exceptions import NotFound
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+from jokk._compat import to_unicode
+from jokk.metrics import Metrics, Trace
+from jokk.server import create_app
+from jokk.serving import ThreadPoolWSGIServer
+from . import TempDataTestBase, TestBase
+
+
+def sample(text, name, **labels):
+    """Return value of sample or `None`."""
+    for line in text.splitlines():
+        if line.startswith('#') or not line.startswith(name):
+            continue
+        sample_name, _, value = line.rpartition(' ')
+        if sample_name.split('{')[0] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', sample_name))
+        if all(found.get(k) == v for k, v in labels.items()):
+            return float(value)
+
+    return None
+
+
+class TestRegistry(TestBase):
+    def _trace(self, route, status, **spans):
+        trace = Trace('GET')
+        trace.route = route
+        trace.status = status
+        trace.spans = spans
+        return trace
+
+    def test_threads(self):
+        """ Counters of all threads should be summed up. """
+        metrics = Metrics()
+
+        def run():
+            for _ in range(100):
+                metrics.begin()
+                metrics.end(self._trace('/user', '200', dispatch=0.001))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        run()
+
+        total = metrics.collect()
+        self.assertEqual(total.requests[('/user', 'GET', '200')], 500)
+        self.assertEqual(total.in_flight, 0)
+        #: Finished threads are merged into one shard.
+        self.assertEqual(len(metrics._shards), 1)
+        self.assertEqual(metrics.collect().requests, total.requests)
+
+    def test_buckets(self):
+        """ Latency should be counted in bucket of upper bound. """
+        metrics = Metrics(buckets=(0.01, 0.1))
+        for seconds in (0.005, 0.01, 0.05, 1.0):
+            metrics.end(self._trace('/user', '200', lookup=seconds))
+
+        histogram = metrics.collect().histograms[('/user', 'lookup')]
+        self.assertEqual(histogram[:3], [2, 1, 1])
+        self.assertAlmostEqual(histogram[-1], 1.065)
+
+
+class TestMetrics(TempDataTestBase):
+    config = {'data': './data', 'routes': ['/user', '/item/<id>',
+                                           '/_jokk/user']}
+    files = {'user_get.json': '{"id": 1}',
+             'item/id_get.json': '{"id": "${id}"}'}
+
+    def _metrics(self, client):
+        res = client.get('/_jokk/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.headers['Content-Type'].startswith('text/plain'))
+
+        return to_unicode(res.data)
+
+    def test_disabled(self):
+        """ Metrics endpoint should be disabled by default. """
+        client = self._create_tmp_client()
+        self.assertRaises(NotFound, client.get, '/_jokk/metrics')
+
+    def test_reserved(self):
+        """ Routes under `/_jokk/` should not be served. """
+        client = self._create_tmp_client(metrics=True)
+        rules = client.application.url_map.iter_rules()
+        self.assertTrue('/_jokk/user' not in [v.rule for v in rules])
+        self.assertRaises(NotFound, client.get, '/_jokk/user')
+
+    def test_requests(self):
+        """ Requests should be counted by route, method and status. """
+        for fast_path in (True, False):
+            client = self._create_tmp_client(metrics=True,
+                                             fast_path=fast_path)
+            client.get('/user')
+            client.get('/user')
+            client.get('/item/1')
+            self.assertRaises(NotFound, client.get, '/unknown')
+
+            text = self._metrics(client)
+            self.assertEqual(sample(text, 'jokk_requests_total',
+                                    route='/user', method='GET',
+                                    status='200'), 2)
+            self.assertEqual(sample(text, 'jokk_requests_total',
+                                    route='/item/<id>', status='200'), 1)
+            self.assertEqual(sample(text, 'jokk_requests_total',
+                                    route='<unmatched>', status='404'), 1)
+            #: Metrics endpoint itself is not counted.
+            self.assertEqual(sample(text, 'jokk_requests_in_flight'), 0)
+
+            for phase in ('dispatch', 'lookup', 'template', 'serialize'):
+                self.assertEqual(
+                    sample(text, 'jokk_request_phase_seconds_count',
+                           route='/item/<id>', phase=phase), 1)
+            self.assertEqual(sample(text, 'jokk_request_phase_seconds_bucket',
+                                    route='/user', phase='dispatch',
+                                    le='+Inf'), 2)
+            self.assertEqual(sample(text, 'jokk_request_phase_seconds_count',
+                                    route='/user', phase='template'), None)
+
+    def test_cache_and_reload(self):
+        """ Cache hit ratio and reloads should be exported. """
+        client = self._create_tmp_client(metrics=True)
+        for _ in range(4):
+            client.get('/user')
+
+        text = self._metrics(client)
+        self.assertEqual(sample(text, 'jokk_cache_hits_total'), 3)
+        self.assertEqual(sample(text, 'jokk_cache_misses_total'), 1)
+        self.assertEqual(sample(text, 'jokk_cache_hit_ratio'), 0.75)
+        self.assertEqual(sample(text, 'jokk_reloads_total'), 0)
+
+        client.application.reload()
+        text = self._metrics(client)
+        self.assertEqual(sample(text, 'jokk_reloads_total'), 1)
+        self.assertTrue(sample(text, 'jokk_last_reload_duration_seconds') > 0)
+
+    def test_pool(self):
+        """ Thread pool counters should be exported. """
+        app = create_app(self.config_path, metrics=True)
+        server = ThreadPoolWSGIServer('127.0.0.1', 0, app, 3, 8)
+        try:
+            text = to_unicode(Client(app, BaseResponse)
+                              .get('/_jokk/metrics').data)
+        finally:
+            server.server_close()
+
+        self.assertEqual(sample(text, 'jokk_pool_threads'), 3)
+        self.assertEqual(sample(text, 'jokk_pool_queue_size'), 8)
+        self.assertEqual(sample(text, 'jokk_pool_rejected_total'), 0)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_preload
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Preloading and readiness tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import json
+from jokk._compat import to_unicode
+from jokk.preload import route_params
+from . import TempDataTestBase, TestBase
+
+
+class TestRouteParams(TestBase):
+    def test_route_params(self):
+        """ Names of url vars should be keys. """
+        self.assertEqual(route_params('/user'), {})
+        self.assertEqual(sorted(route_params('/user/<int:id>/<path:p>')),
+                         ['id', 'p'])
+
+
+class TestPreload(TempDataTestBase):
+    config = {'data': './data', 'routes': ['/user', '/item/<id>'],
+              'compression': {'min_size': 0}}
+    files = {'user_get.json': '{"id": 1, "name": "%s"}' % ('a' * 1000),
+             'user_head.status': '200',
+             'item/id_get.json': '{"id": "${id}"}'}
+
+    def test_preload(self):
+        """ All response files should be cached before first request. """
+        client = self._create_tmp_client(preload=True, preload_threads=2)
+        app = client.application
+        self.assertTrue(app.wait_ready(3))
+
+        report = app.preload_report
+        self.assertEqual((report.files, report.errors, report.entries),
+                         (3, 0, 3))
+        self.assertEqual(report.nbytes, app.cache.total_bytes)
+        self.assertTrue('Preloaded 3 response files' in str(report))
+
+        entry = app.cache.get((app.data_path, '/user', 'get'))
+        self.assertTrue(entry.prepared is not None)
+        self.assertTrue('gzip' in entry.variants)
+        entry = app.cache.get((app.data_path, '/item/<id>', 'get'))
+        self.assertFalse(isinstance(entry.body, bytes))
+
+        misses = app.cache.misses
+        self.assertEqual(client.get('/item/1').data, b'{"id": "1"}')
+        self.assertEqual(app.cache.misses, misses)
+
+    def test_ready(self):
+        """ Ready endpoint should return 200 once preloaded. """
+        client = self._create_tmp_client(preload=True)
+        app = client.application
+        app.wait_ready(3)
+        res = client.get('/_jokk/ready')
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(to_unicode(res.data))
+        self.assertEqual((data['ready'], data['preload']['files']),
+                         (True, 3))
+
+        app.ready.clear()
+        res = client.get('/_jokk/ready')
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+    def test_reload(self):
+        """ New snapshot should be preloaded before it's published. """
+        client = self._create_tmp_client(preload=True)
+        app = client.application
+        app.wait_ready(3)
+        self._write_config(dict(self.config, routes=['/user']))
+        app.reload()
+        self.assertEqual(app.preload_report.generation, 1)
+        self.assertEqual(len(app.cache), 2)
+
+    def test_disabled(self):
+        """ App should be ready on start without preloading. """
+        client = self._create_tmp_client()
+        self.assertEqual(client.get('/_jokk/ready').status_code, 200)
+        self.assertEqual(client.application.preload_report, None)
+        self.assertEqual(len(client.application.cache), 0)
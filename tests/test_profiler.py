@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_profiler
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Dispatch hooks and sampling profiler tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import sys
+import marshal
+import random
+import unittest
+from werkzeug.exceptions import BadRequest, NotFound
+from jokk._compat import to_unicode
+from jokk.profiler import Profiler
+from . import TempDataTestBase, TestBase
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from jokk.asgi import AsgiJokk
+
+
+class TestProfiler(TestBase):
+    def test_sample_rate(self):
+        """ Only sampled requests should be profiled. """
+        profiler = Profiler(0.5, rng=random.Random(1))
+        for _ in range(100):
+            profile = profiler.start()
+            if profile is not None:
+                sum(range(100))
+                profiler.stop(profile)
+
+        self.assertTrue(30 < profiler.sampled < 70)
+        self.assertTrue('requests are profiled' in profiler.report())
+
+        profiler.reset()
+        self.assertEqual(profiler.sampled, 0)
+        self.assertEqual(marshal.loads(profiler.dumps()), {})
+
+    def test_invalid(self):
+        """ Sample rate should be from 0 to 1. """
+        self.assertRaises(ValueError, Profiler, 0)
+        self.assertRaises(ValueError, Profiler, 1.5)
+
+
+class TestHooks(TempDataTestBase):
+    config = {'data': './data', 'routes': ['/user', '/item/<id>']}
+    files = {'user_get.json': '{"id": 1}',
+             'item/id_get.json': '{"id": "${id}"}'}
+
+    def test_hooks(self):
+        """ Hooks should be called with spans of each phase. """
+        for fast_path in (True, False):
+            client = self._create_tmp_client(fast_path=fast_path)
+            app = client.application
+            called = []
+
+            @app.before_dispatch
+            def before(environ, trace):
+                called.append(('before', environ['PATH_INFO'], trace.route))
+
+            @app.after_dispatch
+            def after(environ, trace):
+                called.append(('after', trace.route, trace.status,
+                               sorted(trace.spans)))
+
+            client.get('/item/1')
+            self.assertRaises(NotFound, client.get, '/unknown')
+            self.assertEqual(called, [
+                ('before', '/item/1', None),
+                ('after', '/item/<id>', '200',
+                 ['dispatch', 'lookup', 'serialize', 'template']),
+                ('before', '/unknown', None),
+                ('after', None, '404', ['dispatch'])
+            ])
+
+    def test_profile(self):
+        """ Profile should be served at `/_jokk/profile`. """
+        client = self._create_tmp_client(profile_sample_rate=1)
+        self.assertRaises(NotFound, client.get, '/_jokk/metrics')
+        for _ in range(3):
+            client.get('/user')
+
+        res = client.get('/_jokk/profile?sort=tottime&limit=5')
+        self.assertTrue(to_unicode(res.data).startswith(
+            '3 requests are profiled.'))
+
+        res = client.get('/_jokk/profile?format=pstats&reset=1')
+        self.assertTrue(marshal.loads(res.data))
+        self.assertEqual(client.application.profiler.sampled, 0)
+
+        self.assertRaises(BadRequest, client.get,
+                          '/_jokk/profile?sort=unknown')
+
+    def test_dump(self):
+        """ Profile should be dumped to file. """
+        client = self._create_tmp_client(profile_sample_rate=1)
+        client.get('/user')
+        output = os.path.join(self.tmp_path, 'jokk-{pid}.prof')
+        path = client.application.profiler.dump(output)
+        self.assertEqual(path, output.format(pid=os.getpid()))
+        with open(path, 'rb') as f:
+            self.assertTrue(marshal.loads(f.read()))
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+class TestProfileAsgi(TempDataTestBase):
+    def test_profile(self):
+        """ Requests served in event loop and thread should be profiled. """
+        app = AsgiJokk(self._create_tmp_client(
+            profile_sample_rate=1).application)
+        loop = asyncio.new_event_loop()
+
+        async def request():
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                pass
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/user',
+                     'query_string': b'', 'headers': []}
+            await app(scope, receive, send)
+
+        try:
+            #: First request falls back to thread, second one is cached.
+            for _ in range(2):
+                loop.run_until_complete(request())
+        finally:
+            loop.close()
+
+        profiler = app.app.profiler
+        self.assertEqual(profiler.sampled, 2)
+        report = profiler.report(limit=1000)
+        self.assertTrue('dispatch_environ' in report)
+        self.assertTrue('read_response_file' in report)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_recorder
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Record proxy tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import json
+import shutil
+import socket
+import tempfile
+import threading
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse, Request, Response
+from jokk.recorder import ConnectionPool, FixtureWriter, Recorder, \
+    find_ext, path_to_route
+from jokk.server import create_app
+from jokk.serving import ThreadPoolWSGIServer
+from . import TestBase
+
+
+@Request.application
+def upstream(request):
+    if request.path == '/user':
+        return Response('{"id": 1, "price": "$5"}',
+                        mimetype='application/json')
+    if request.method == 'POST':
+        return Response('<id>{0}</id>'.format(request.get_data(True)),
+                        status=201, mimetype='application/xml')
+
+    return Response('not found', status=404)
+
+
+class TestRecorder(TestBase):
+    def setUp(self):
+        super(TestRecorder, self).setUp()
+        self.tmp_path = tempfile.mkdtemp()
+        self.config_path = os.path.join(self.tmp_path, 'config.json')
+        self.server = ThreadPoolWSGIServer('127.0.0.1', 0, upstream, 2)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_path)
+
+    def _create_recorder(self, port=None):
+        pool = ConnectionPool('http://127.0.0.1:{0}'.format(
+            port or self.server.port))
+        writer = FixtureWriter(self.config_path, 0.01)
+        writer.start()
+
+        return Client(Recorder(pool, writer), BaseResponse)
+
+    def test_record(self):
+        """ Recorded responses should be replayed by Jokk. """
+        client = self._create_recorder()
+        requests = [('GET', '/user', None), ('POST', '/item/1', '2'),
+                    ('GET', '/item/', None)]
+        expected = []
+        for method, path, data in requests:
+            res = client.open(path, method=method, data=data)
+            expected.append((res.status_code, res.data))
+        self.assertEqual(expected[0], (200, b'{"id": 1, "price": "$5"}'))
+
+        pool = client.application.pool
+        self.assertEqual(pool._idle.qsize(), 1)
+        client.application.writer.stop()
+        pool.close()
+
+        with open(self.config_path) as f:
+            config = json.loads(f.read())
+        self.assertEqual(config['routes'], ['/item', '/item/1', '/user'])
+        data_path = os.path.join(self.tmp_path, 'data')
+        with open(os.path.join(data_path, 'item', '1_post.status')) as f:
+            self.assertEqual(f.read(), '201')
+        self.assertTrue(os.path.exists(os.path.join(data_path,
+                                                    'item', '1_post.xml')))
+
+        replay = Client(create_app(self.config_path), BaseResponse)
+        for (method, path, data), response in zip(requests, expected):
+            res = replay.open(path, method=method, data=data)
+            self.assertEqual((res.status_code, res.data), response)
+
+    def test_retry(self):
+        """ Only idempotent requests should be sent again. """
+        pool = ConnectionPool('http://127.0.0.1:{0}'.format(self.server.port))
+        for method, retried in [('GET', True), ('POST', False)]:
+            pool.request('GET', '/user')
+            #: Idle connection is closed by upstream.
+            pool._idle.queue[-1].sock.close()
+            if retried:
+                self.assertEqual(pool.request(method, '/user')[0], 200)
+            else:
+                self.assertRaises(socket.error, pool.request, method,
+                                  '/item', b'1')
+        pool.close()
+
+    def test_bad_gateway(self):
+        """ Upstream errors should be 502 and not recorded. """
+        client = self._create_recorder(port=1)
+        self.assertEqual(client.get('/user').status_code, 502)
+        client.application.writer.stop()
+        self.assertFalse(os.path.exists(self.config_path))
+
+
+class TestRecordedFiles(TestBase):
+    def test_path_to_route(self):
+        """ Paths which can't be route should not be recorded. """
+        self.assertEqual(path_to_route('/'), '/')
+        self.assertEqual(path_to_route('/user/1/'), '/user/1')
+        for path in ['/a//b', '/a/../b', '/<id>', '/_jokk/metrics',
+                     '/x_get.page=2']:
+            self.assertEqual(path_to_route(path), None)
+
+    def test_find_ext(self):
+        """ Ext should be found by Content-Type. """
+        self.assertEqual(find_ext('application/json; charset=utf-8'), 'json')
+        self.assertEqual(find_ext('application/problem+json'), 'json')
+        self.assertEqual(find_ext('image/png'), 'txt')
+        self.assertEqual(find_ext(None), 'txt')
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_routing
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Routing engine tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import glob
+import json
+import random
+from werkzeug.exceptions import NotFound
+from werkzeug.routing import Map, Rule
+from werkzeug.test import EnvironBuilder
+from jokk.routing import BaseRouter, Router, MapRouter
+from . import TempDataTestBase, TestBase
+
+ROUTES = [
+    '/', '/user', '/user/', '/user/<id>', '/user/<int:id>', '/user/me',
+    '/<a>/<b>', '/<path:p>', '/<path:p>/edit', '/files/<path:f>',
+    '/x/<int:n>/y', '/x/<n>/y', '/x/<a>/<b>', '/x//z',
+    '/a/<any(foo,bar):k>', '/f/<float:v>', '/s/<string(length=2):c>',
+    '/<int(min=3):n>', '/t/<a>/<path:p>/end'
+]
+
+SEGMENTS = ['user', 'me', '1', '12', 'x', 'y', 'z', '', 'foo', 'bar', 'edit',
+            'files', 'a', '1.5', 'ab', 'abc', 't', 'end', '2', '5', 's', 'f']
+
+
+def werkzeug_match(routes):
+    url_map = Map([Rule(v, endpoint=v, strict_slashes=False) for v in routes])
+    adapter = url_map.bind('localhost')
+
+    def match(path):
+        try:
+            return adapter.match(path)
+        except NotFound:
+            return None
+
+    return match
+
+
+def router_match(routes):
+    router = Router(routes)
+
+    def match(path):
+        try:
+            return router.match_path(path)
+        except NotFound:
+            return None
+
+    return match
+
+
+class TestRouter(TestBase):
+    def _assert_same(self, routes, paths):
+        expected = werkzeug_match(routes)
+        actual = router_match(routes)
+        for path in paths:
+            self.assertEqual(actual(path), expected(path), path)
+
+    def test_configs(self):
+        """ Results should be same as Werkzeug on test configs. """
+        for config_path in glob.glob(os.path.join(self.root_path, 'configs',
+                                                  '*.json')):
+            with open(config_path) as f:
+                routes = json.loads(f.read())['routes']
+            paths = ['/', '/user', '/user/', '/user/1', '/user/1/', '/1',
+                     '/json', '/xml/', '/html', '/txt', '/template', '/foo',
+                     '/user/1/2', '//user', '/user//']
+            self._assert_same(routes, paths)
+
+    def test_random_paths(self):
+        """ Results should be same as Werkzeug on overlapping routes. """
+        rng = random.Random(0)
+        paths = ['', '//', '/user/1//', '//a//b', '/%', u'/\xe9/x']
+        for _ in range(3000):
+            path = '/' + '/'.join(rng.choice(SEGMENTS)
+                                  for _ in range(rng.randint(0, 5)))
+            if rng.random() < 0.2:
+                path += '/'
+            paths.append(path)
+        self._assert_same(ROUTES, paths)
+
+    def test_converters(self):
+        """ Url vars should be converted. """
+        match = router_match(ROUTES)
+        self.assertEqual(match('/user/12'), ('/user/<int:id>', {'id': 12}))
+        self.assertEqual(match('/f/1.5'), ('/f/<float:v>', {'v': 1.5}))
+        self.assertEqual(match('/files/a/b/c/'),
+                         ('/files/<path:f>', {'f': 'a/b/c'}))
+
+    def test_unsupported(self):
+        """ Url vars in part of segment should not be supported. """
+        for route in ['/user<id>', '/<id>.json', '/<a><b>', '/<foo:x>']:
+            self.assertRaises(ValueError, Router, [route])
+
+    def test_match_environ(self):
+        """ Router should match WSGI environ as Werkzeug map. """
+        environ = EnvironBuilder(u'/user/\xe9').get_environ()
+        url_map = Map([Rule('/user/<id>', endpoint='/user/<id>')])
+        self.assertEqual(Router(['/user/<id>']).match(environ),
+                         MapRouter(url_map).match(environ))
+
+
+class TestRouting(TempDataTestBase):
+    config = {'data': './data', 'routes': ['/user', '/item/<id>']}
+    files = {'user_get.json': '{"id": 1}',
+             'item/id_get.json': '{"id": "${id}"}'}
+
+    def test_routing(self):
+        """ Both routings should return same responses. """
+        trie = self._create_tmp_client()
+        werkzeug = self._create_tmp_client(routing='werkzeug')
+        self.assertTrue(isinstance(trie.application.snapshot.router, Router))
+        self.assertTrue(isinstance(werkzeug.application.snapshot.router,
+                                   MapRouter))
+        for path in ['/user', '/user/', '/item/1']:
+            self.assertEqual(trie.get(path).data, werkzeug.get(path).data)
+        self.assertRaises(NotFound, trie.get, '/item')
+
+    def test_fallback(self):
+        """ Unsupported routes should be matched by Werkzeug. """
+        self._write_config(dict(self.config, routes=['/user', '/item<id>']))
+        client = self._create_tmp_client()
+        router = client.application.snapshot.router
+        self.assertTrue(isinstance(router, MapRouter))
+        self.assertEqual(router.match(EnvironBuilder('/item1').get_environ()),
+                         ('/item<id>', {'id': '1'}))
+
+    def test_lazy_url_map(self):
+        """ Werkzeug map should be built on first access. """
+        client = self._create_tmp_client()
+        router = client.application.snapshot.router
+        self.assertEqual(router._url_map, None)
+        self.assertEqual(sorted(v.rule for v in
+                                client.application.url_map.iter_rules()),
+                         ['/item/<id>', '/user'])
+
+    def test_reload(self):
+        """ Memoized results should be discarded by reloading. """
+        client = self._create_tmp_client()
+        client.get('/user')
+        self._write_config(dict(self.config, routes=['/item/<id>']))
+        client.application.reload()
+        self.assertEqual(client.application.snapshot.router.stats()['entries'],
+                         0)
+        self.assertRaises(NotFound, client.get, '/user')
+
+    def test_invalid(self):
+        """ Unknown routing should raise ValueError. """
+        self.assertRaises(ValueError, self._create_tmp_client, routing='re')
+
+
+class TestMatchCache(TestBase):
+    def _environ(self, path, **kwargs):
+        return EnvironBuilder(path, **kwargs).get_environ()
+
+    def test_memoize(self):
+        """ Repeated requests should skip matching. """
+        for router in [Router(['/user/<id>'], cache_size=2),
+                       MapRouter(Map([Rule('/user/<id>',
+                                           endpoint='/user/<id>')]), 2)]:
+            for _ in range(3):
+                self.assertEqual(router.match(self._environ('/user/1')),
+                                 ('/user/<id>', {'id': '1'}))
+                self.assertRaises(NotFound, router.match,
+                                  self._environ('/item'))
+            stats = router.stats()
+            self.assertEqual((stats['hits'], stats['misses']), (4, 2))
+
+            #: Least recently used result is evicted.
+            router.match(self._environ('/user/2'))
+            self.assertRaises(NotFound, router.match,
+                              self._environ('/item', method='POST'))
+            self.assertEqual(router.stats()['entries'], 2)
+            router.match(self._environ('/user/1'))
+            self.assertEqual(router.stats()['misses'], 5)
+
+    def test_disabled(self):
+        """ Results should not be memoized if cache size is 0. """
+        router = Router(['/user'], cache_size=0)
+        router.match(self._environ('/user'))
+        self.assertEqual(router.stats()['entries'], 0)
+
+    def test_adapter(self):
+        """ Adapter should be bound once per host and script name. """
+        router = MapRouter(Map([Rule('/user', endpoint='/user')]))
+        environs = [self._environ('/user'), self._environ('/user/'),
+                    self._environ('/user', base_url='http://example.com/app')]
+        adapters = [router.adapter(v) for v in environs]
+        self.assertTrue(adapters[0] is adapters[1])
+        self.assertFalse(adapters[0] is adapters[2])
+        self.assertEqual(adapters[2].script_name, '/app/')
+
+    def test_base_router(self):
+        """ Subclass should match by url_map unless overriding. """
+        class StaticRouter(BaseRouter):
+            url_map = Map([Rule('/user', endpoint='/user')])
+
+        router = StaticRouter()
+        self.assertEqual(router.match(self._environ('/user')), ('/user', {}))
+        self.assertRaises(NotFound, router.match, self._environ('/item'))
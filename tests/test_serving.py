@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_serving
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Thread pool server and prefork server tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import re
+import sys
+import time
+import signal
+import socket
+import unittest
+import threading
+import subprocess
+from jokk._compat import to_unicode
+from jokk.serving import ThreadPoolWSGIServer
+from . import TestBase
+
+try:
+    from urllib.request import urlopen
+    from http.client import HTTPConnection
+except ImportError:
+    from urllib2 import urlopen
+    from httplib import HTTPConnection
+
+SCRIPT = '''
+import sys
+from jokk.server import create_app
+from jokk.serving import run_prefork
+run_prefork(lambda index: create_app(sys.argv[1]), '127.0.0.1', 0, 2)
+'''
+
+
+class TestThreadPool(TestBase):
+    def setUp(self):
+        super(TestThreadPool, self).setUp()
+        self.app = self._create_app('basic.json')
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def _start(self, app, threads=2, backlog=4):
+        self.server = ThreadPoolWSGIServer('127.0.0.1', 0, app, threads,
+                                           backlog)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def test_keep_alive(self):
+        """ Connection should be kept between requests. """
+        self._start(self.app)
+        expected = self._read_json('basic/user_get.json')
+        conn = HTTPConnection('127.0.0.1', self.server.port)
+        for _ in range(3):
+            conn.request('GET', '/user')
+            res = conn.getresponse()
+            self.assertEqual(res.status, 200)
+            self.assertEqual(to_unicode(res.read()), expected)
+            self.assertNotEqual(res.getheader('Connection'), 'close')
+        conn.close()
+        for _ in range(100):
+            if self.server.stats()['handled'] == 1:
+                break
+            time.sleep(0.01)
+        #: Three requests are served on one connection.
+        self.assertEqual(self.server.stats()['handled'], 1)
+
+    def test_saturated(self):
+        """ Server should return 503 when accept queue is full. """
+        entered = threading.Event()
+        release = threading.Event()
+
+        def blocking_app(environ, start_response):
+            entered.set()
+            release.wait(5)
+            return self.app(environ, start_response)
+
+        self._start(blocking_app, threads=1, backlog=1)
+        busy = HTTPConnection('127.0.0.1', self.server.port)
+        busy.request('GET', '/user')
+        self.assertTrue(entered.wait(5))
+
+        #: Waits in accept queue.
+        queued = socket.create_connection(('127.0.0.1', self.server.port))
+        for _ in range(100):
+            if self.server.stats()['queue_depth'] == 1:
+                break
+            time.sleep(0.01)
+
+        rejected = HTTPConnection('127.0.0.1', self.server.port)
+        rejected.request('GET', '/user')
+        res = rejected.getresponse()
+        self.assertEqual(res.status, 503)
+        self.assertEqual(res.getheader('Retry-After'), '1')
+        rejected.close()
+
+        stats = self.server.stats()
+        self.assertEqual(stats['busy'], 1)
+        self.assertEqual(stats['queue_depth'], 1)
+        self.assertEqual(stats['rejected'], 1)
+
+        release.set()
+        self.assertEqual(busy.getresponse().status, 200)
+        busy.close()
+        queued.close()
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork()')
+class TestPrefork(TestBase):
+    def setUp(self):
+        super(TestPrefork, self).setUp()
+        config_path = os.path.join(self.root_path, 'configs', 'basic.json')
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', SCRIPT, config_path],
+            stderr=subprocess.PIPE, cwd=os.path.dirname(self.root_path))
+        line = to_unicode(self.process.stderr.readline())
+        self.port = int(re.search(r':(\d+)/', line).group(1))
+
+    def tearDown(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stderr.close()
+
+    def _workers(self):
+        output = subprocess.check_output(['ps', '-o', 'pid=', '--ppid',
+                                          str(self.process.pid)])
+        return [int(v) for v in output.split()]
+
+    def _wait_workers(self, count, exclude=None):
+        for _ in range(100):
+            workers = self._workers()
+            if len(workers) == count and exclude not in workers:
+                return workers
+            time.sleep(0.05)
+        return self._workers()
+
+    def _get(self, path):
+        res = urlopen('http://127.0.0.1:{0}{1}'.format(self.port, path))
+        return to_unicode(res.read())
+
+    def test_serve(self):
+        """ Workers should serve requests on shared socket. """
+        self.assertEqual(len(self._wait_workers(2)), 2)
+        expected = self._read_json('basic/user_get.json')
+        for _ in range(4):
+            self.assertEqual(self._get('/user'), expected)
+
+    def test_restart_worker(self):
+        """ Crashed worker should be restarted. """
+        workers = self._wait_workers(2)
+        os.kill(workers[0], signal.SIGKILL)
+        restarted = self._wait_workers(2, workers[0])
+        self.assertEqual(len(restarted), 2)
+        self.assertFalse(workers[0] in restarted)
+
+    def test_shutdown(self):
+        """ SIGTERM should stop workers and arbiter. """
+        self._wait_workers(2)
+        self.process.send_signal(signal.SIGTERM)
+        self.assertEqual(self.process.wait(), 0)
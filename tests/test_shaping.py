@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_shaping
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Streaming and throughput shaping tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import sys
+import random
+import unittest
+from werkzeug.test import EnvironBuilder
+from jokk._compat import timer
+from jokk.server import create_app
+from jokk.shaping import Delay, Shape, ShapedBody
+from . import TempDataTestBase, TestBase
+
+if sys.version_info >= (3, 5):
+    import asyncio
+    from jokk.asgi import AsgiJokk
+
+BODY = '{"message": "' + 'x' * 35 + '"}'
+
+
+class TestDelay(TestBase):
+    def test_fixed(self):
+        """ Number should be fixed delay. """
+        self.assertEqual(Delay.from_config(0.5).sample(), 0.5)
+
+    def test_distributions(self):
+        """ Distributions should return delays in range. """
+        rng = random.Random(1)
+        uniform = Delay.from_config({'distribution': 'uniform',
+                                     'min': 0.1, 'max': 0.2})
+        normal = Delay.from_config({'distribution': 'normal',
+                                    'mean': 0.0, 'stddev': 1.0})
+        exponential = Delay.from_config({'distribution': 'exponential',
+                                         'mean': 0.1})
+        for _ in range(100):
+            self.assertTrue(0.1 <= uniform.sample(rng) <= 0.2)
+            self.assertTrue(normal.sample(rng) >= 0)
+            self.assertTrue(exponential.sample(rng) >= 0)
+
+    def test_invalid(self):
+        """ Invalid config should raise ValueError. """
+        for v in [{'distribution': 'unknown'},
+                  {'distribution': 'uniform', 'min': 0.1},
+                  -1]:
+            self.assertRaises(ValueError, Delay.from_config, v)
+        self.assertRaises(ValueError, Shape.from_config, {'speed': 1})
+        self.assertRaises(ValueError, Shape.from_config, {'chunk_size': 0})
+
+
+class TestShapedBody(TestBase):
+    def test_chunks(self):
+        """ Body should be split into chunks. """
+        body = ShapedBody([b'abc', b'defgh', b'ij'], Shape(chunk_size=4))
+        self.assertEqual(list(body), [b'abcd', b'efgh', b'ij'])
+
+    def test_schedule(self):
+        """ Delays should be time to first byte, then paced by rate. """
+        shape = Shape(chunk_size=10, rate=100,
+                      first_byte=Delay.from_config(0.5))
+        delays = [v[0] for v in ShapedBody([b'x' * 30], shape).schedule()]
+        self.assertEqual(delays[0], 0.5)
+        #: Second chunk is due 0.1 seconds after first byte.
+        self.assertTrue(0.5 < delays[1] <= 0.6)
+
+    def test_empty_body(self):
+        """ Empty body should be delayed too. """
+        shape = Shape(first_byte=Delay.from_config(0.5))
+        self.assertEqual(list(ShapedBody([], shape).schedule()),
+                         [(0.5, b'')])
+
+
+class TestStreaming(TempDataTestBase):
+    files = {'user_get.json': BODY, 'item_get.json': BODY}
+    config = {
+        'data': './data',
+        'routes': ['/user', '/item'],
+        'streaming': {
+            '/user': {'chunk_size': 10, 'rate': 1000, 'first_byte': 0.02},
+            '*': {'chunk_size': 25, 'chunked': True}
+        }
+    }
+
+    def _call(self, app, path):
+        started = []
+
+        def start_response(status, headers):
+            started[:] = [status, dict(headers)]
+
+        begin = timer()
+        chunks = list(app(EnvironBuilder(path).get_environ(),
+                          start_response))
+
+        return started[0], started[1], chunks, timer() - begin
+
+    def test_wsgi(self):
+        """ WSGI response should be streamed by chunks. """
+        for fast_path in (True, False):
+            app = create_app(self.config_path, fast_path=fast_path)
+            status, headers, chunks, elapsed = self._call(app, '/user')
+            self.assertEqual(status, '200 OK')
+            self.assertEqual(headers['Content-Length'], str(len(BODY)))
+            self.assertEqual(b''.join(chunks), BODY.encode('utf-8'))
+            self.assertEqual([len(v) for v in chunks], [10, 10, 10, 10, 10])
+            #: 20ms to first byte and 40ms for 4 chunks.
+            self.assertTrue(elapsed >= 0.055)
+
+    def test_any_route_chunked(self):
+        """ `*` should match routes and remove Content-Length. """
+        app = create_app(self.config_path)
+        _, headers, chunks, _ = self._call(app, '/item')
+        self.assertFalse('Content-Length' in headers)
+        self.assertEqual([len(v) for v in chunks], [25, 25])
+
+    def test_invalid_config(self):
+        """ Invalid streaming options should fail to create app. """
+        self._write_config(dict(self.config, streaming={'/user': {'x': 1}}))
+        self.assertRaises(ValueError, create_app, self.config_path)
+        self._write_config(dict(self.config,
+                                streaming={'download': {'rate': 1}}))
+        self.assertRaises(ValueError, create_app, self.config_path)
+
+
+@unittest.skipIf(sys.version_info < (3, 5), 'requires Python 3.5')
+class TestStreamingAsgi(TempDataTestBase):
+    files = {'user_get.json': BODY}
+    config = {
+        'data': './data',
+        'routes': ['/user'],
+        'streaming': {'/user': {'chunk_size': 25, 'first_byte': 0.2}}
+    }
+
+    def test_concurrent(self):
+        """ Slow responses should sleep in event loop concurrently. """
+        app = AsgiJokk(create_app(self.config_path))
+        loop = asyncio.new_event_loop()
+
+        async def request():
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/user',
+                     'query_string': b'', 'headers': []}
+            await app(scope, receive, send)
+
+            return messages
+
+        async def requests():
+            return await asyncio.gather(*[request() for _ in range(100)])
+
+        begin = timer()
+        try:
+            results = loop.run_until_complete(requests())
+        finally:
+            loop.close()
+
+        self.assertTrue(timer() - begin < 2.0)
+        for messages in results:
+            bodies = [v['body'] for v in messages[1:]]
+            self.assertEqual(bodies, [BODY[:25].encode('utf-8'),
+                                      BODY[25:].encode('utf-8'), b''])
+            self.assertTrue(messages[1]['more_body'])
+            self.assertFalse(messages[-1].get('more_body', False))
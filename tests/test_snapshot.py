@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_snapshot
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Snapshot reloading tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+from jokk._compat import to_unicode
+from . import TempDataTestBase
+
+
+class TestSnapshot(TempDataTestBase):
+    def test_immutable(self):
+        """ Snapshot should not be modified. """
+        client = self._create_tmp_client()
+        snapshot = client.application.snapshot
+        with self.assertRaises(AttributeError):
+            snapshot.config = {}
+
+    def test_reload_routes(self):
+        """ Reloaded routes should be served. """
+        client = self._create_tmp_client()
+        self._write('item_get.json', '{"message": "item"}')
+        self._write_config({'data': './data', 'routes': ['/user', '/item'],
+                            'cors': True})
+        client.application.reload()
+        res = client.get('/item')
+        self.assertEqual(to_unicode(res.data), '{"message": "item"}')
+        self.assertEqual(res.headers.get('Access-Control-Allow-Origin'), '*')
+        rules = [v.rule for v in client.application.url_map.iter_rules()]
+        self.assertEqual(sorted(rules), ['/item', '/user'])
+
+    def test_reload_counter(self):
+        """ Reload count and duration should be recorded. """
+        client = self._create_tmp_client()
+        app = client.application
+        self.assertEqual(app.reload_count, 0)
+        self._touch_config()
+        client.get('/user')
+        self.assertTrue(self._wait_reload(app))
+        self.assertEqual(app.snapshot.generation, 1)
+        self.assertTrue(app.last_reload_duration >= 0)
+
+    def test_reload_failed(self):
+        """ Current snapshot should be kept if config.json is invalid. """
+        client = self._create_tmp_client()
+        app = client.application
+        snapshot = app.snapshot
+        with open(self.config_path, 'w') as f:
+            f.write('{')
+        self._touch_config()
+        client.get('/user')
+        self.assertFalse(self._wait_reload(app, timeout=0.2))
+        self.assertTrue(app.snapshot is snapshot)
+        res = client.get('/user')
+        self.assertEqual(to_unicode(res.data), '{"message": "old"}')
+
+        #: Failed reloading is retried even if mtime is not changed.
+        mtime = os.path.getmtime(self.config_path)
+        self._write_config(self.config)
+        os.utime(self.config_path, (mtime, mtime))
+        #: Wait until failed reloading is finished.
+        with app._reload_lock:
+            pass
+        client.get('/user')
+        self.assertTrue(self._wait_reload(app))
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_store
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Stateful store tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import json
+import threading
+from werkzeug.test import EnvironBuilder
+from jokk._compat import to_unicode
+from jokk.store import find_resources, parse_stateful
+from . import TempDataTestBase, TestBase
+
+
+class TestResources(TestBase):
+    def test_find_resources(self):
+        """ Route which appends one url var to route should be resource. """
+        routes = ['/', '/<id>', '/user', '/user/<int:userid>/',
+                  '/user/<int:userid>/items', '/item/<a>/<b>', '/x<id>',
+                  '/group/<id>']
+        self.assertEqual(find_resources(routes), {
+            '/<id>': ('/', 'id'),
+            '/user/<int:userid>/': ('/user', 'userid')
+        })
+
+    def test_parse_stateful(self):
+        """ Unknown options should raise ValueError. """
+        self.assertEqual(parse_stateful(None), None)
+        self.assertEqual(parse_stateful(True), {})
+        self.assertRaises(ValueError, parse_stateful, {'path': 'x'})
+        self.assertRaises(ValueError, parse_stateful, {'interval': 0})
+
+
+class TestStore(TempDataTestBase):
+    config = {'data': './data', 'stateful': True,
+              'routes': ['/user', '/user/<int:userid>', '/item',
+                         '/item/<id>']}
+    files = {'user_get.json': '[{"userid": 1, "name": "a"}]',
+             'user_post.json': '{"message": "created"}',
+             'item/id_head.status': '200'}
+
+    def _json(self, res):
+        return json.loads(to_unicode(res.data))
+
+    def _send(self, client, method, path, data):
+        return client.open(path, method=method, data=json.dumps(data),
+                           content_type='application/json')
+
+    def test_crud(self):
+        """ Writes should be served by following reads. """
+        for fast_path in (True, False):
+            client = self._create_tmp_client(fast_path=fast_path)
+            self.assertEqual(self._json(client.get('/user/1')),
+                             {'userid': 1, 'name': 'a'})
+
+            res = self._send(client, 'POST', '/user', {'name': 'b'})
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(self._json(res), {'userid': 2, 'name': 'b'})
+            self.assertEqual(res.headers['Content-Type'], 'application/json')
+
+            res = self._send(client, 'PATCH', '/user/2', {'name': 'c'})
+            self.assertEqual(self._json(res), {'userid': 2, 'name': 'c'})
+            res = self._send(client, 'PUT', '/user/5', {'name': 'd'})
+            self.assertEqual(res.status_code, 201)
+            self.assertEqual(client.delete('/user/1').status_code, 204)
+
+            self.assertEqual(self._json(client.get('/user')), [
+                {'userid': 2, 'name': 'c'}, {'userid': 5, 'name': 'd'}])
+            self.assertEqual(client.get('/user/1').status_code, 404)
+            self.assertEqual(client.delete('/user/1').status_code, 404)
+
+    def test_errors(self):
+        """ Invalid bodies and existing keys should be errors. """
+        client = self._create_tmp_client()
+        res = client.post('/user', data='[1]')
+        self.assertEqual(res.status_code, 400)
+        res = self._send(client, 'POST', '/user', {'userid': 1})
+        self.assertEqual(res.status_code, 409)
+        res = self._send(client, 'PATCH', '/user/9', {'name': 'x'})
+        self.assertEqual(res.status_code, 404)
+
+    def test_seed(self):
+        """ Resource without array fixture should be empty with `id`. """
+        client = self._create_tmp_client()
+        self.assertEqual(client.get('/item').data, b'[]')
+        res = self._send(client, 'POST', '/item', {'name': 'x'})
+        self.assertEqual(self._json(res), {'id': 1, 'name': 'x'})
+        self.assertEqual(self._json(client.get('/item/1')),
+                         {'id': 1, 'name': 'x'})
+        #: Methods which store doesn't handle are served by files.
+        self.assertEqual(client.head('/item/1').status_code, 200)
+
+    def test_put_key(self):
+        """ Key added by PUT should be integer and skipped by POST. """
+        client = self._create_tmp_client()
+        res = self._send(client, 'PUT', '/item/3', {'name': 'x'})
+        self.assertEqual(self._json(res), {'id': 3, 'name': 'x'})
+        self.assertEqual(self._json(client.get('/item/3'))['id'], 3)
+        res = self._send(client, 'PUT', '/item/03', {'name': 'y'})
+        self.assertEqual(self._json(res), {'id': '03', 'name': 'y'})
+        ids = [self._json(self._send(client, 'POST', '/item', {}))['id']
+               for _ in range(3)]
+        self.assertEqual(ids, [4, 5, 6])
+
+        self._send(client, 'PUT', '/user/8', {'name': 'x'})
+        res = self._send(client, 'POST', '/user', {'name': 'y'})
+        self.assertEqual(self._json(res)['userid'], 9)
+        self.assertEqual(len(self._json(client.get('/user'))), 3)
+
+    def test_reload(self):
+        """ Items should be kept on reloading. """
+        client = self._create_tmp_client()
+        self._send(client, 'POST', '/user', {'name': 'b'})
+        client.application.reload()
+        self.assertEqual(len(self._json(client.get('/user'))), 2)
+
+    def test_snapshot(self):
+        """ Items should be written to file and loaded on start. """
+        self._write_config(dict(self.config,
+                                stateful={'snapshot': './state.json',
+                                          'interval': 60}))
+        client = self._create_tmp_client()
+        dumper = client.application.store_dumper
+        self._send(client, 'POST', '/user', {'name': 'b'})
+        self.assertTrue(dumper.dump())
+        self.assertFalse(dumper.dump())
+        dumper.stop()
+
+        with open(os.path.join(self.tmp_path, 'state.json')) as f:
+            self.assertEqual(len(json.loads(f.read())['/user']), 2)
+
+        client = self._create_tmp_client()
+        self.assertEqual(self._json(client.get('/user/2')),
+                         {'userid': 2, 'name': 'b'})
+        client.application.store_dumper.stop()
+
+    def test_disabled(self):
+        """ Response files should be served unless stateful. """
+        self._write_config(dict(self.config, stateful=False))
+        client = self._create_tmp_client()
+        self.assertEqual(client.post('/user').data,
+                         b'{"message": "created"}')
+        self.assertEqual(client.get('/user').data,
+                         b'[{"userid": 1, "name": "a"}]')
+
+    def test_version(self):
+        """ Concurrent writes should increment version once each. """
+        client = self._create_tmp_client()
+        store = client.application.snapshot.store
+        version = store.version
+
+        def put(i):
+            environ = EnvironBuilder('/item/{0}'.format(i % 5), method='PUT',
+                                     data='{}').get_environ()
+            store.handle(environ, '/item/<id>', {'id': str(i % 5)}, [])
+
+        threads = [threading.Thread(target=put, args=(i,))
+                   for i in range(50)]
+        for v in threads:
+            v.start()
+        for v in threads:
+            v.join()
+        self.assertEqual(store.version, version + 50)
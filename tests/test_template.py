@@ -10,8 +10,12 @@
     :license: BSD, see LICENSE for more details.
 """
 import json
-from jokk._compat import to_unicode
-from . import TestBase
+from string import Template
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+from jokk._compat import text_type, to_unicode
+from jokk.template import CompiledTemplate
+from . import TestBase, paramterized
 
 
 class TestTemplate(TestBase):
@@ -34,3 +38,49 @@ class TestTemplate(TestBase):
         res = client.get('/template')
         text = json.loads(to_unicode(res.data))['server']
         self.assertEqual(text, 'http://example.com')
+
+    def test_create_response(self):
+        """ create_response() should return text of response. """
+        app = self._create_app('template.json')
+        for path, endpoint, params in [('/template', '/template', {}),
+                                       ('/foo', '/<userid>',
+                                        {'userid': 'foo'})]:
+            request = Request(EnvironBuilder(path).get_environ())
+            body, status, mimetype = app.create_response(request, params,
+                                                         endpoint)
+            self.assertTrue(isinstance(body, text_type))
+            self.assertEqual(mimetype, 'application/json')
+
+
+class TestCompiledTemplate(TestBase):
+    @paramterized(texts=['${a} and $b', '$$a ${a}', '${c} $', '$1 ${a',
+                         'no placeholders', '${a}${b}$a'])
+    def test_same_as_safe_substitute(self, params):
+        """ Rendered text should be same as Template.safe_substitute. """
+        mapping = {'a': 'x', 'b': 1}
+        for text in params['texts']:
+            expected = Template(text).safe_substitute(**mapping)
+            compiled = CompiledTemplate.compile(text)
+            self.assertEqual(compiled.render(mapping), expected)
+
+    def test_bind_exclude(self):
+        """ bind() should not substitute excluded names. """
+        compiled = CompiledTemplate.compile('${a} ${b}')
+        compiled = compiled.bind({'a': 'x', 'b': 'y'}, exclude=['b'])
+        self.assertEqual(compiled.names, frozenset(['b']))
+        self.assertEqual(compiled.render({'b': 'z'}), 'x z')
+
+    def test_static(self):
+        """ Template without placeholders should be static. """
+        compiled = CompiledTemplate.compile('{"a": "$$"}')
+        self.assertTrue(compiled.is_static())
+        self.assertEqual(compiled.encode(), b'{"a": "$"}')
+
+    def test_static_response_cached_as_bytes(self):
+        """ Response file without url vars should be cached as bytes. """
+        client = self._create_client('template.json')
+        client.get('/template')
+        entry = client.application.cache.get(
+            (client.application.data_path, '/template', 'get'))
+        self.assertEqual(json.loads(to_unicode(entry.body))['server'],
+                         'http://example.com')
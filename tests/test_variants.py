@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_variants
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Response file variant tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import json
+from werkzeug.test import Client
+from werkzeug.wrappers import BaseResponse
+from jokk.bundle import pack
+from jokk.server import create_app
+from jokk.variants import split_file_name, parse_conditions
+from . import TempDataTestBase, TestBase
+
+
+class TestConditions(TestBase):
+    def test_split_file_name(self):
+        """ Conditions should be part of method. """
+        self.assertEqual(split_file_name('user_get'), ('user', 'get'))
+        self.assertEqual(split_file_name('user_get.page=2&per_page=5'),
+                         ('user', 'get.page=2&per_page=5'))
+        self.assertEqual(split_file_name('my_user_get.a_b=c_get'),
+                         ('my_user', 'get.a_b=c_get'))
+        self.assertEqual(split_file_name('user_get.old'), ('user', 'get.old'))
+
+    def test_parse_conditions(self):
+        """ Conditions should have source and operator. """
+        self.assertEqual(parse_conditions(
+            'page=2&header.x-version=2&body.user.role=*&query.q=jo%2A*'), (
+                ('query', 'page', 'exact', '2'),
+                ('header', 'HTTP_X_VERSION', 'exact', '2'),
+                ('body', ('user', 'role'), 'present', None),
+                ('query', 'q', 'prefix', 'jo*')))
+
+
+class TestVariants(TempDataTestBase):
+    config = {'data': './data', 'routes': ['/user']}
+    files = {'user_get.json': '{"page": 1}',
+             'user_get.page=2.json': '{"page": 2}',
+             'user_get.page=2&sort=name.json': '{"page": 2, "sort": "name"}',
+             'user_get.header.x-version=2.json': '{"version": 2}',
+             'user_get.q=jo*.json': '{"q": "jo"}',
+             'user_get.q=*.json': '{"q": "any"}',
+             'user_post.json': '{"role": "user"}',
+             'user_post.body.user.role=admin.json': '{"role": "admin"}',
+             'user_post.body.user.role=admin.status': '403'}
+
+    def _assert_selected(self, client):
+        self.assertEqual(client.get('/user').data, b'{"page": 1}')
+        self.assertEqual(client.get('/user?page=2').data, b'{"page": 2}')
+        self.assertEqual(client.get('/user?sort=name&page=2').data,
+                         b'{"page": 2, "sort": "name"}')
+        self.assertEqual(client.get('/user?page=3').data, b'{"page": 1}')
+        self.assertEqual(client.get('/user', headers={'X-Version': '2'}).data,
+                         b'{"version": 2}')
+        self.assertEqual(client.get('/user?q=jokk').data, b'{"q": "jo"}')
+        self.assertEqual(client.get('/user?q=foo').data, b'{"q": "any"}')
+
+        res = client.post('/user', data=json.dumps({'user': {'role':
+                                                             'admin'}}))
+        self.assertEqual((res.status_code, res.data),
+                         (403, b'{"role": "admin"}'))
+        res = client.post('/user', data='{"user": {"role": "guest"}}')
+        self.assertEqual((res.status_code, res.data),
+                         (200, b'{"role": "user"}'))
+
+    def test_select(self):
+        """ Variant which request matches should be served. """
+        for fast_path in (True, False):
+            self._assert_selected(
+                self._create_tmp_client(fast_path=fast_path))
+
+    def test_bucket(self):
+        """ Variants with same condition names should be one bucket. """
+        for i in range(100):
+            self._write('item_get.page={0}.json'.format(i), str(i))
+        self._write_config({'data': './data', 'routes': ['/item']})
+        client = self._create_tmp_client()
+        matcher = client.application.index._matchers[('/item', 'get')]
+        self.assertEqual((len(matcher.buckets), len(matcher.predicates)),
+                         (1, 0))
+        self.assertEqual(client.get('/item?page=42').data, b'42')
+
+    def test_bundle(self):
+        """ Variants should be packed. """
+        app = create_app(self.config_path)
+        bundle_path = os.path.join(self.tmp_path, 'mock.jokk')
+        pack(app.config, app.index, bundle_path)
+        self._assert_selected(Client(create_app(bundle_path), BaseResponse))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+    jokk.tests.test_watcher
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Watcher tests for Jokk.
+
+
+    :copyright: (c) 2014-2015 Shinya Ohyanagi, All rights reserved.
+    :license: BSD, see LICENSE for more details.
+"""
+import os
+import time
+import threading
+from jokk.watcher import PollingWatcher, InotifyWatcher, create_watcher
+from jokk._compat import to_unicode
+from . import TempDataTestBase
+
+
+class TestWatcher(TempDataTestBase):
+    def _watch(self, cls):
+        event = threading.Event()
+        watcher = cls([self.config_path, os.path.join(self.tmp_path, 'data')],
+                      event.set, 0.05)
+        watcher.start()
+        return watcher, event
+
+    def _assert_notified(self, cls):
+        watcher, event = self._watch(cls)
+        try:
+            time.sleep(0.1)
+            self._write('user/userid_get.json', '{}')
+            self.assertTrue(event.wait(3))
+        finally:
+            watcher.stop()
+
+    def test_polling_watcher(self):
+        """ PollingWatcher should notify added files. """
+        self._assert_notified(PollingWatcher)
+
+    def test_inotify_watcher(self):
+        """ InotifyWatcher should notify added files. """
+        try:
+            InotifyWatcher.load_libc()
+        except OSError:
+            return
+        self._assert_notified(InotifyWatcher)
+
+    def test_ignore_other_files(self):
+        """ Watcher should ignore files next to config.json. """
+        try:
+            InotifyWatcher.load_libc()
+        except OSError:
+            return
+        watcher, event = self._watch(InotifyWatcher)
+        try:
+            with open(os.path.join(self.tmp_path, 'README'), 'w') as f:
+                f.write('')
+            self.assertFalse(event.wait(0.5))
+        finally:
+            watcher.stop()
+
+    def test_create_polling_watcher(self):
+        """ create_watcher() should create polling watcher if forced. """
+        watcher = create_watcher([self.config_path], None, polling=True)
+        self.assertTrue(isinstance(watcher, PollingWatcher))
+
+    def test_app_reloaded(self):
+        """ Jokk should reload response files in background. """
+        client = self._create_tmp_client(watch=True, watch_interval=0.05)
+        try:
+            client.get('/user')
+            self._write('user_get.json', '{"message": "new"}')
+            for _ in range(60):
+                res = client.get('/user')
+                if to_unicode(res.data) == '{"message": "new"}':
+                    break
+                time.sleep(0.05)
+            self.assertEqual(to_unicode(res.data), '{"message": "new"}')
+        finally:
+            client.application.watcher.stop()
+
+    def test_data_path_changed(self):
+        """ Data directory changed by reloading should be watched. """
+        self._write('../data2/user_get.json', '{"message": "data2"}')
+        client = self._create_tmp_client(watch=True, watch_interval=0.05)
+        app = client.application
+        try:
+            self._write_config(dict(self.config, data='./data2'))
+            self.assertTrue(self._wait_reload(app))
+            self.assertEqual(to_unicode(client.get('/user').data),
+                             '{"message": "data2"}')
+            self._write('../data2/user_get.json', '{"message": "new"}')
+            for _ in range(60):
+                res = client.get('/user')
+                if to_unicode(res.data) == '{"message": "new"}':
+                    break
+                time.sleep(0.05)
+            self.assertEqual(to_unicode(res.data), '{"message": "new"}')
+        finally:
+            app.watcher.stop()